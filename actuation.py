@@ -0,0 +1,315 @@
+"""
+City actuators and the log of what they were told to do.
+
+SmartCityActuator keeps the state of each subsystem (traffic signals, public
+alerts, ventilation, road signs, monitoring stations, emergency protocols)
+behind its own lock, so commands for different subsystems never wait for
+each other. apply_batch() checks a whole list of commands before touching
+anything and then applies them while holding the locks of every subsystem
+involved, taken in a fixed order, so a batch takes effect completely or not
+at all and no reader sees half of it.
+
+Every applied command is recorded in an ActuationLog: a ring buffer of
+fixed-size records in a NumPy structured array. Districts and actions are
+stored as ids into a table of names, so a record is 21 bytes and the log
+never grows past its capacity; the oldest records are overwritten first.
+"""
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime
+
+import numpy as np
+
+TRAFFIC_SIGNAL_ACTIONS = ['optimize_flow', 'emergency_protocol', 'normal_operation']
+VENTILATION_ACTIONS = ['increase', 'decrease', 'normal']
+EMERGENCY_PROTOCOLS = ['severe_pollution', 'traffic_emergency', 'public_health_alert']
+
+# Command type: (actuator method, parameters). The first parameter is the
+# district (or area, location, station, protocol) the command is logged under.
+# The order is also the order batch locks are taken in.
+COMMANDS = {
+    'traffic_signals': ('manage_traffic_signals', ['district', 'action']),
+    'public_alert': ('issue_public_alert', ['district', 'alert_type', 'severity']),
+    'ventilation': ('control_ventilation', ['area', 'action']),
+    'digital_signs': ('update_digital_signs', ['location', 'message']),
+    'monitoring': ('update_monitoring_status', ['station_id', 'data']),
+    'emergency_protocol': ('activate_emergency_protocol', ['protocol_type', 'activate'])
+}
+COMMAND_TYPES = list(COMMANDS)
+
+# Records kept by the event log (about 2 MB)
+LOG_CAPACITY = 100000
+# Most commands accepted in one batch, which bounds how long its locks are held
+MAX_BATCH_COMMANDS = 10000
+
+EVENT_DTYPE = np.dtype([
+    ('time', 'f8'),       # Epoch seconds
+    ('batch', 'u4'),      # Batch id, 0 for single commands
+    ('command', 'u1'),    # Index into COMMAND_TYPES
+    ('target', 'u4'),     # Name id of the district
+    ('detail', 'u4')      # Name id of the action
+])
+
+
+class ActuationLog:
+    """
+    Append-only ring buffer of the last ``capacity`` actuation events.
+    """
+    def __init__(self, capacity=LOG_CAPACITY):
+        self.capacity = capacity
+        self._events = np.zeros(capacity, dtype=EVENT_DTYPE)
+        # Total number of events ever appended; the next one goes to _written % capacity
+        self._written = 0
+        self._names = []
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._written, self.capacity)
+
+    def _intern(self, name):
+        name = str(name)
+        name_id = self._ids.get(name)
+        if name_id is None:
+            name_id = self._ids[name] = len(self._names)
+            self._names.append(name)
+        return name_id
+
+    def append(self, events, batch=0, timestamp=None):
+        """
+        Records (command type, target, detail) events made at ``timestamp``
+        (epoch seconds, default now).
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            records = np.array([
+                (timestamp, batch, COMMAND_TYPES.index(command), self._intern(target), self._intern(detail))
+                for command, target, detail in events
+            ], dtype=EVENT_DTYPE)[-self.capacity:]
+            positions = (self._written + np.arange(len(records))) % self.capacity
+            self._events[positions] = records
+            self._written += len(records)
+
+    def query(self, target=None, command=None, since=None, until=None, limit=100):
+        """
+        Returns the newest ``limit`` events matching the filters, newest first.
+        ``since`` and ``until`` are epoch seconds (inclusive).
+        """
+        with self._lock:
+            count = len(self)
+            events = self._events[:count]
+            mask = np.ones(count, dtype=bool)
+            if target is not None:
+                if str(target) not in self._ids:
+                    return []
+                mask &= events['target'] == self._ids[str(target)]
+            if command is not None:
+                mask &= events['command'] == COMMAND_TYPES.index(command)
+            if since is not None:
+                mask &= events['time'] >= since
+            if until is not None:
+                mask &= events['time'] <= until
+            positions = np.flatnonzero(mask)
+            # Age 0 is the newest event
+            ages = (self._written - 1 - positions) % self.capacity
+            order = np.argsort(ages, kind='stable')[:limit]
+            selected = events[positions[order]]
+            names = self._names
+
+        return [{
+            'time': datetime.fromtimestamp(event['time']).isoformat(),
+            'batch': int(event['batch']) or None,
+            'command': COMMAND_TYPES[event['command']],
+            'target': names[event['target']],
+            'detail': names[event['detail']]
+        } for event in selected]
+
+
+def _detail(command, params):
+    """
+    The short description of a command kept in the event log.
+    """
+    if command == 'public_alert':
+        return f"{params['alert_type']}:{params['severity']}"
+    if command == 'digital_signs':
+        return params['message']
+    if command == 'monitoring':
+        return 'update'
+    if command == 'emergency_protocol':
+        return 'activate' if params['activate'] else 'deactivate'
+    return params['action']
+
+
+class SmartCityActuator:
+    """Administrative control system for Delhi's air quality and traffic management."""
+    def __init__(self, log_capacity=LOG_CAPACITY):
+        self.traffic_signals = {}        # Traffic signal states across districts
+        self.alert_systems = {}          # Public alert system states
+        self.monitoring_stations = {}     # Air quality monitoring station data
+        self.ventilation_systems = {}    # Ventilation levels per area
+        self.digital_signs = {}          # Messages shown on digital road signs
+        self.emergency_protocols = {      # Emergency response protocols
+            protocol: False for protocol in EMERGENCY_PROTOCOLS
+        }
+        self.log = ActuationLog(log_capacity)
+        self._locks = {command: threading.Lock() for command in COMMAND_TYPES}
+        self._batches = 0
+        self._batch_lock = threading.Lock()
+
+    def manage_traffic_signals(self, district, action):
+        """
+        Manages traffic signal timing across districts.
+        Actions: 'optimize_flow', 'emergency_protocol', 'normal_operation'
+        """
+        return self.execute('traffic_signals', district=district, action=action)
+
+    def issue_public_alert(self, district, alert_type, severity):
+        """
+        Issues public health and safety alerts.
+        Types: 'air_quality', 'traffic_congestion', 'weather_emergency'
+        """
+        return self.execute('public_alert', district=district, alert_type=alert_type, severity=severity)
+
+    def control_ventilation(self, area, action):
+        """
+        Adjusts ventilation systems in an area.
+        Actions: 'increase', 'decrease', 'normal'
+        """
+        return self.execute('ventilation', area=area, action=action)
+
+    def update_digital_signs(self, location, message):
+        """
+        Shows a message on the digital road signs at a location.
+        """
+        return self.execute('digital_signs', location=location, message=message)
+
+    def update_monitoring_status(self, station_id, data):
+        """
+        Updates air quality monitoring station data.
+        """
+        return self.execute('monitoring', station_id=station_id, data=data)
+
+    def activate_emergency_protocol(self, protocol_type, activate=True):
+        """
+        Activates or deactivates emergency protocols.
+        """
+        return self.execute('emergency_protocol', protocol_type=protocol_type, activate=activate)
+
+    def execute(self, command, **params):
+        """
+        Applies one command and records it in the log.
+        """
+        error = self._validate(command, params)
+        if error:
+            return {'status': 'error', 'message': error}
+        now = time.time()
+        with self._locks[command]:
+            message = self._apply(command, params, now)
+            self.log.append([(command, params[COMMANDS[command][1][0]], _detail(command, params))], timestamp=now)
+        return {'status': 'success', 'message': message}
+
+    def apply_batch(self, commands):
+        """
+        Applies a list of commands, each a dict with a 'type' (a key of
+        COMMANDS) and that command's parameters, all at once. If any command is
+        invalid none are applied and the errors are returned by index.
+        """
+        if len(commands) > MAX_BATCH_COMMANDS:
+            return {'status': 'error', 'message': f'At most {MAX_BATCH_COMMANDS} commands can be sent at once'}
+        parsed = []
+        errors = []
+        for i, command in enumerate(commands):
+            if not isinstance(command, dict) or command.get('type') not in COMMANDS:
+                errors.append({'index': i, 'error': f"Command type must be one of: {COMMAND_TYPES}"})
+                continue
+            params = {key: value for key, value in command.items() if key != 'type'}
+            error = self._validate(command['type'], params)
+            if error:
+                errors.append({'index': i, 'error': error})
+            parsed.append((command['type'], params))
+        if errors:
+            return {'status': 'error', 'message': 'No commands were applied', 'errors': errors}
+
+        with self._batch_lock:
+            self._batches += 1
+            batch = self._batches
+        now = time.time()
+        involved = sorted({command for command, _ in parsed}, key=COMMAND_TYPES.index)
+        with ExitStack() as stack:
+            for command in involved:
+                stack.enter_context(self._locks[command])
+            messages = [self._apply(command, params, now) for command, params in parsed]
+            self.log.append(
+                [(command, params[COMMANDS[command][1][0]], _detail(command, params)) for command, params in parsed],
+                batch=batch, timestamp=now
+            )
+        return {'status': 'success', 'batch': batch, 'applied': len(messages), 'messages': messages}
+
+    def snapshot(self):
+        """
+        Returns a consistent copy of the state of every subsystem.
+        """
+        with ExitStack() as stack:
+            for command in COMMAND_TYPES:
+                stack.enter_context(self._locks[command])
+            return {
+                'traffic_signals': dict(self.traffic_signals),
+                'alert_systems': dict(self.alert_systems),
+                'ventilation_systems': dict(self.ventilation_systems),
+                'digital_signs': dict(self.digital_signs),
+                'monitoring_stations': dict(self.monitoring_stations),
+                'emergency_protocols': dict(self.emergency_protocols)
+            }
+
+    @staticmethod
+    def _validate(command, params):
+        """
+        Returns why a command can't be applied, or None if it can.
+        """
+        expected = COMMANDS[command][1]
+        missing = [name for name in expected if name not in params]
+        if missing:
+            return f"Missing parameters: {missing}"
+        unknown = [name for name in params if name not in expected]
+        if unknown:
+            return f"Unknown parameters: {unknown}"
+        if command == 'traffic_signals' and params['action'] not in TRAFFIC_SIGNAL_ACTIONS:
+            return 'Invalid action specified'
+        if command == 'ventilation' and params['action'] not in VENTILATION_ACTIONS:
+            return 'Invalid action specified'
+        if command == 'emergency_protocol':
+            if params['protocol_type'] not in EMERGENCY_PROTOCOLS:
+                return 'Invalid protocol type'
+            if not isinstance(params['activate'], bool):
+                return "'activate' must be true or false"
+        return None
+
+    def _apply(self, command, params, now):
+        # Called with the command's lock held, after _validate()
+        timestamp = datetime.fromtimestamp(now).isoformat()
+        if command == 'traffic_signals':
+            district, action = params['district'], params['action']
+            self.traffic_signals[district] = action
+            return f'Traffic signal protocol {action} activated in {district}'
+        if command == 'public_alert':
+            district = params['district']
+            self.alert_systems[district] = {
+                'type': params['alert_type'],
+                'severity': params['severity'],
+                'timestamp': timestamp,
+                'district': district
+            }
+            return f"Alert issued for {district}: {params['alert_type']} - {params['severity']}"
+        if command == 'ventilation':
+            self.ventilation_systems[params['area']] = params['action']
+            return f"Ventilation set to {params['action']} in {params['area']}"
+        if command == 'digital_signs':
+            self.digital_signs[params['location']] = {'message': params['message'], 'timestamp': timestamp}
+            return f"Signs at {params['location']} now show: {params['message']}"
+        if command == 'monitoring':
+            self.monitoring_stations[params['station_id']] = {'data': params['data'], 'last_updated': timestamp}
+            return f"Station {params['station_id']} data updated"
+        self.emergency_protocols[params['protocol_type']] = params['activate']
+        status = 'activated' if params['activate'] else 'deactivated'
+        return f"Emergency protocol {params['protocol_type']} {status}"
@@ -0,0 +1,94 @@
+"""
+Rolling correlations and hour-of-day x day-of-week profiles of the cleaned series.
+
+Rolling correlations are computed from prefix sums: the count, sums, sums of
+squares and cross-products over the rows of a time window are differences
+of two cumulative sums whose positions are found with np.searchsorted, so
+each window costs O(1) whatever its width. Profiles are per-cell sums and
+counts gathered with np.bincount.
+"""
+import numpy as np
+
+from rollups import to_ns
+
+# Fewest complete (pollutant, traffic) pairs a window needs before its correlation is reported
+MIN_PERIODS = 3
+
+HOUR_NS = 3600 * 10**9
+DAY_NS = 24 * HOUR_NS
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+def _prefix(values):
+    return np.concatenate([[0.0], np.cumsum(values)])
+
+
+def rolling_corr(timestamps, x, y, window, min_periods=MIN_PERIODS):
+    """
+    Pearson correlation of x and y over the time window (t - window, t] ending
+    at each row, using the rows where both are present (as pandas'
+    ``rolling(window).corr`` does). ``timestamps`` must be sorted. Windows with
+    fewer than ``min_periods`` pairs or no variance give NaN.
+    """
+    ts_ns = to_ns(timestamps)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    if not valid.any():
+        return np.full(len(ts_ns), np.nan)
+
+    # Centering first keeps the cumulative sums small, so window differences stay precise
+    x = np.where(valid, x - x[valid].mean(), 0.0)
+    y = np.where(valid, y - y[valid].mean(), 0.0)
+    n, sx, sy = _prefix(valid), _prefix(x), _prefix(y)
+    sxx, syy, sxy = _prefix(x * x), _prefix(y * y), _prefix(x * y)
+
+    start = np.searchsorted(ts_ns, ts_ns - int(window.value), side='right')
+    end = np.arange(1, len(ts_ns) + 1)
+
+    def window_sum(prefix):
+        return prefix[end] - prefix[start]
+
+    count = window_sum(n)
+    wx, wy = window_sum(sx), window_sum(sy)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var_x = window_sum(sxx) - wx * wx / count
+        var_y = window_sum(syy) - wy * wy / count
+        cov = window_sum(sxy) - wx * wy / count
+        # Variances at rounding-noise level of the running sums are treated as zero
+        flat = (var_x <= 1e-12 * sxx[-1]) | (var_y <= 1e-12 * syy[-1])
+        corr = cov / np.sqrt(var_x * var_y)
+    corr[(count < min_periods) | flat] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+
+def weekly_profile(timestamps, values):
+    """
+    Returns (sums, counts) of the non-missing values, each a 7 x 24 array
+    indexed by weekday (Monday first) and hour of day.
+    """
+    ts_ns = to_ns(timestamps)
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    # 1970-01-01 was a Thursday
+    cells = ((ts_ns // DAY_NS + 3) % 7) * 24 + (ts_ns % DAY_NS) // HOUR_NS
+    sums = np.bincount(cells[valid], weights=values[valid], minlength=7 * 24)
+    counts = np.bincount(cells[valid], minlength=7 * 24)
+    return sums.reshape(7, 24), counts.reshape(7, 24)
+
+
+def profile_means(sums, counts):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def peak_hours(timestamps, values, count=3):
+    """
+    Returns the ``count`` hours of the day with the highest mean value, highest first.
+    """
+    sums, counts = weekly_profile(timestamps, values)
+    means = profile_means(sums.sum(axis=0), counts.sum(axis=0))
+    hours = np.flatnonzero(~np.isnan(means))
+    order = np.argsort(-means[hours], kind='stable')
+    return hours[order[:count]].tolist()
@@ -0,0 +1,265 @@
+"""
+Spike and dropout detection for readings.
+
+Each series (one field at one location) is scored against an exponentially
+weighted mean and variance of its earlier samples (EWMA z-score). The state
+behind a score is three numbers, so AnomalyDetector.update() costs O(1) per
+sample and can run inline as readings arrive; update_frame() produces the
+same scores for a whole batch at once by running the EWMA recurrences as
+linear filters (scipy.signal.lfilter), continuing from the saved state. A
+detector that starts empty and is fed the full history is the backfill.
+
+robust_scores() gives an alternative score for history analysis: the
+distance from the median of the preceding window in units of its median
+absolute deviation, which a single outlier cannot drag along.
+
+Besides spikes, missing values ('dropout') and gaps between readings longer
+than ``max_gap`` ('gap') are reported, since cleaning fills both in.
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from dataset import AIR_QUALITY_COLUMNS, DEFAULT_LOCATION, LOCATION_COLUMN, TRAFFIC_COLUMNS
+
+FIELDS = AIR_QUALITY_COLUMNS + TRAFFIC_COLUMNS
+
+# Weight of the newest sample in the running mean and variance (about a 3-hour memory at 10 minutes)
+ALPHA = 0.05
+# |z| above which a sample is a spike
+THRESHOLD = 4.0
+# Samples a series needs before it is scored
+WARMUP = 12
+# Longer silences between readings of a location are reported as gaps
+MAX_GAP = pd.Timedelta(minutes=30)
+
+# Trailing window (in samples) of the median/MAD score
+ROBUST_WINDOW = 144
+# Scales the MAD to a standard deviation for normally distributed data
+MAD_SCALE = 1.4826
+
+KINDS = ('spike', 'dropout', 'gap')
+ANOMALY_COLUMNS = ['timestamp', 'location', 'field', 'kind', 'value', 'expected', 'score']
+
+
+def ewma_scores(values, alpha=ALPHA, state=None, warmup=WARMUP):
+    """
+    Returns the z-score of every sample against the EWMA mean and variance of
+    the samples before it, plus the state after the last one. ``state`` is a
+    (mean, variance, count) tuple from an earlier call, or None to start
+    fresh. Missing samples get NaN and leave the state unchanged, as do
+    samples within the first ``warmup``.
+    """
+    # Imported on first use since scipy.signal is slow to import
+    from scipy.signal import lfilter
+
+    values = np.asarray(values, dtype=float)
+    scores = np.full(len(values), np.nan)
+    expected = np.full(len(values), np.nan)
+    present = np.flatnonzero(~np.isnan(values))
+    if not len(present):
+        return scores, expected, state
+    x = values[present]
+    mean, var, count = state if state is not None else (x[0], 0.0, 0)
+
+    # m[t] = (1 - alpha) m[t-1] + alpha x[t]
+    # v[t] = (1 - alpha) (v[t-1] + alpha (x[t] - m[t-1])^2)
+    decay = 1.0 - alpha
+    means = lfilter([alpha], [1.0, -decay], x, zi=[decay * mean])[0]
+    prev_means = np.concatenate([[mean], means[:-1]])
+    deviation = x - prev_means
+    variances = lfilter([1.0], [1.0, -decay], decay * alpha * deviation * deviation, zi=[decay * var])[0]
+    prev_vars = np.concatenate([[var], variances[:-1]])
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = np.where(prev_vars > 0, deviation / np.sqrt(prev_vars), np.nan)
+    z[count + np.arange(len(x)) < warmup] = np.nan
+    scores[present] = z
+    expected[present] = prev_means
+    return scores, expected, (float(means[-1]), float(variances[-1]), count + len(x))
+
+
+def robust_scores(values, window=ROBUST_WINDOW, min_periods=None):
+    """
+    Returns (x - median) / (MAD_SCALE * MAD) of every sample, with the median
+    and MAD taken over the ``window`` samples before it, plus the medians.
+    """
+    values = np.asarray(values, dtype=float)
+    min_periods = window // 2 if min_periods is None else min_periods
+    medians = np.full(len(values), np.nan)
+    mads = np.full(len(values), np.nan)
+    if len(values) > window:
+        windows = np.lib.stride_tricks.sliding_window_view(values[:-1], window)
+        # Chunked so the per-window copies nanmedian makes stay small
+        for start in range(0, len(windows), 10000):
+            chunk = windows[start:start + 10000]
+            with warnings.catch_warnings():
+                # All-NaN windows warn; they are masked out below
+                warnings.simplefilter('ignore', RuntimeWarning)
+                median = np.nanmedian(chunk, axis=1)
+                mad = np.nanmedian(np.abs(chunk - median[:, None]), axis=1)
+            enough = (~np.isnan(chunk)).sum(axis=1) >= min_periods
+            medians[window + start:window + start + len(chunk)] = np.where(enough, median, np.nan)
+            mads[window + start:window + start + len(chunk)] = np.where(enough, mad, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scores = np.where(mads > 0, (values - medians) / (MAD_SCALE * mads), np.nan)
+    return scores, medians
+
+
+def _locations(df):
+    if LOCATION_COLUMN in df:
+        return df[LOCATION_COLUMN].fillna(DEFAULT_LOCATION).astype(str).to_numpy()
+    return np.full(len(df), DEFAULT_LOCATION, dtype=object)
+
+
+def _anomaly_frame(parts):
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return pd.DataFrame({column: [] for column in ANOMALY_COLUMNS}).astype({'timestamp': 'datetime64[ns]'})
+    return pd.concat(parts, ignore_index=True).sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+
+def _series_anomalies(timestamps, location, field, values, scores, expected, threshold):
+    spikes = np.abs(scores) > threshold
+    dropouts = np.isnan(values)
+    mask = spikes | dropouts
+    return pd.DataFrame({
+        'timestamp': timestamps[mask],
+        'location': location,
+        'field': field,
+        'kind': np.where(dropouts[mask], 'dropout', 'spike'),
+        'value': values[mask],
+        'expected': expected[mask],
+        'score': scores[mask]
+    })
+
+
+def _gap_anomalies(timestamps, location, last, max_gap):
+    previous = np.concatenate([[np.datetime64('NaT') if last is None else np.datetime64(last, 'ns')],
+                               timestamps[:-1]]).astype('datetime64[ns]')
+    gaps = (timestamps - previous) > max_gap.to_timedelta64()
+    return pd.DataFrame({
+        'timestamp': timestamps[gaps],
+        'location': location,
+        'field': None,
+        'kind': 'gap',
+        'value': (timestamps[gaps] - previous[gaps]) / np.timedelta64(1, 'm'),
+        'expected': np.nan,
+        'score': np.nan
+    })
+
+
+class AnomalyDetector:
+    """
+    Scores readings as they arrive, keeping O(1) state per (location, field).
+    """
+    def __init__(self, fields=FIELDS, alpha=ALPHA, threshold=THRESHOLD, warmup=WARMUP, max_gap=MAX_GAP,
+                 state=None):
+        self.fields = list(fields)
+        self.alpha = alpha
+        self.threshold = threshold
+        self.warmup = warmup
+        self.max_gap = pd.Timedelta(max_gap)
+        state = state or {}
+        self._series = {tuple(key.rsplit('|', 1)): tuple(value) for key, value in state.get('series', {}).items()}
+        self._last_seen = dict(state.get('last_seen', {}))
+
+    def state(self):
+        """
+        Returns the detector state as JSON-serializable data (e.g. for a checkpoint).
+        """
+        return {
+            'series': {f"{location}|{field}": list(value) for (location, field), value in self._series.items()},
+            'last_seen': dict(self._last_seen)
+        }
+
+    def update(self, timestamp, values, location=DEFAULT_LOCATION):
+        """
+        Scores one reading (a mapping of field to value) and folds it into the
+        state. Returns the anomalies found as a list of dicts.
+        """
+        timestamp = pd.Timestamp(timestamp)
+        anomalies = []
+        last = self._last_seen.get(location)
+        if last is not None and timestamp - pd.Timestamp(last) > self.max_gap:
+            anomalies.append({
+                'timestamp': timestamp, 'location': location, 'field': None, 'kind': 'gap',
+                'value': (timestamp - pd.Timestamp(last)) / pd.Timedelta(minutes=1),
+                'expected': np.nan, 'score': np.nan
+            })
+        self._last_seen[location] = timestamp.isoformat()
+
+        decay = 1.0 - self.alpha
+        for field in self.fields:
+            value = values.get(field, np.nan)
+            value = np.nan if value is None else float(value)
+            if np.isnan(value):
+                anomalies.append({
+                    'timestamp': timestamp, 'location': location, 'field': field, 'kind': 'dropout',
+                    'value': value, 'expected': np.nan, 'score': np.nan
+                })
+                continue
+            mean, var, count = self._series.get((location, field), (value, 0.0, 0))
+            deviation = value - mean
+            if count >= self.warmup and var > 0:
+                score = deviation / np.sqrt(var)
+                if abs(score) > self.threshold:
+                    anomalies.append({
+                        'timestamp': timestamp, 'location': location, 'field': field, 'kind': 'spike',
+                        'value': value, 'expected': mean, 'score': score
+                    })
+            self._series[(location, field)] = (
+                mean + self.alpha * deviation, decay * (var + self.alpha * deviation * deviation), count + 1
+            )
+        return anomalies
+
+    def update_frame(self, df):
+        """
+        Scores a batch of readings sorted by timestamp, with the same results as
+        calling update() on each row, and returns the anomalies as a DataFrame.
+        Rows without a location column belong to DEFAULT_LOCATION.
+        """
+        locations = _locations(df)
+        timestamps = df['timestamp'].to_numpy().astype('datetime64[ns]')
+        parts = []
+        for location in pd.unique(locations):
+            rows = np.flatnonzero(locations == location)
+            ts = timestamps[rows]
+            parts.append(_gap_anomalies(ts, location, self._last_seen.get(location), self.max_gap))
+            self._last_seen[location] = pd.Timestamp(ts[-1]).isoformat()
+            for field in self.fields:
+                values = df[field].to_numpy(dtype=float)[rows] if field in df else np.full(len(rows), np.nan)
+                scores, expected, state = ewma_scores(
+                    values, self.alpha, self._series.get((location, field)), self.warmup
+                )
+                if state is not None:
+                    self._series[(location, field)] = state
+                parts.append(_series_anomalies(ts, location, field, values, scores, expected, self.threshold))
+        return _anomaly_frame(parts)
+
+
+def detect(df, fields=FIELDS, method='ewma', threshold=THRESHOLD, **options):
+    """
+    Finds anomalies over a whole history of readings sorted by timestamp.
+    ``method`` is 'ewma' (what the incremental detector reports) or 'robust'
+    (rolling median/MAD scores).
+    """
+    if method == 'ewma':
+        return AnomalyDetector(fields, threshold=threshold, **options).update_frame(df)
+    if method != 'robust':
+        raise ValueError(f"Unknown anomaly method '{method}'")
+
+    locations = _locations(df)
+    timestamps = df['timestamp'].to_numpy().astype('datetime64[ns]')
+    max_gap = pd.Timedelta(options.get('max_gap', MAX_GAP))
+    parts = []
+    for location in pd.unique(locations):
+        rows = np.flatnonzero(locations == location)
+        ts = timestamps[rows]
+        parts.append(_gap_anomalies(ts, location, None, max_gap))
+        for field in fields:
+            values = df[field].to_numpy(dtype=float)[rows]
+            scores, medians = robust_scores(values, options.get('window', ROBUST_WINDOW))
+            parts.append(_series_anomalies(ts, location, field, values, scores, medians, threshold))
+    return _anomaly_frame(parts)
@@ -3,11 +3,31 @@ from flask_cors import CORS
 import pandas as pd
 from datetime import datetime, timedelta
 import numpy as np
-from sklearn.ensemble import RandomForestRegressor
+import json
 import logging
 import os
+import time
 import traceback
 from flask import Flask, render_template, jsonify
+from actuation import COMMAND_TYPES, COMMANDS, SmartCityActuator
+from analytics import WEEKDAYS, peak_hours, profile_means, rolling_corr, weekly_profile
+from anomalies import KINDS, THRESHOLD, detect
+import database
+from dataset import (
+    AIR_QUALITY_COLUMNS, DEFAULT_LOCATION, LOCATION_COLUMN, TRAFFIC_COLUMNS, Dataset, DatasetCache, LRUCache,
+    read_merged
+)
+from downsample import MIN_POINTS, downsample_indices, lttb_indices, series_budget
+from forecast import DEFAULT_MODEL_PATH, HORIZONS, Forecaster
+from http_cache import conditional, send_versioned_file
+from live import LiveFeed
+from online_stats import OnlineStats, StatsStore
+from rollups import RollupStore
+from rules import RuleSet
+from streaming import StreamedColumn, buffered, fill_nan, format_timestamps, stream_json
+from timeseries import (
+    QueryError, RangeQuery, cursor_position, make_cursor, parse_fields, parse_time, parse_window, range_bounds
+)
 
 # Set up logging
 logging.basicConfig(
@@ -21,7 +41,16 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Constants
-DATA_FILE = os.path.join(os.path.dirname(__file__), 'Merged_Air_Quality_and_Traffic_Data.csv')
+DATA_FILE = os.environ.get('DATA_FILE') or os.path.join(os.path.dirname(__file__), 'Merged_Air_Quality_and_Traffic_Data.csv')
+
+# Readings are read from DATABASE_URL (e.g. sqlite:///smart_city.db) when set, otherwise from DATA_FILE
+DATA_SOURCE = os.environ.get('DATABASE_URL') or DATA_FILE
+
+# Shared cache of the cleaned dataset, reloaded only when DATA_SOURCE changes
+dataset_cache = DatasetCache(DATA_SOURCE)
+
+# Tracks the CSV download separately when readings come from a database
+csv_file_cache = dataset_cache if DATA_SOURCE == DATA_FILE else DatasetCache(DATA_FILE)
 
 app = Flask(__name__, static_folder='frontend/build', static_url_path='')
 CORS(app, resources={
@@ -32,6 +61,15 @@ CORS(app, resources={
     }
 })
 
+# Series that can be selected with the 'fields' query parameter
+SERIES_FIELDS = AIR_QUALITY_COLUMNS + TRAFFIC_COLUMNS
+
+# 10-minute/hourly/daily rollups of the cleaned series, updated as new rows arrive
+rollup_store = RollupStore(SERIES_FIELDS)
+
+# Daily running means, extrema and co-moments of the cleaned series, for range statistics and correlations
+stats_store = StatsStore(SERIES_FIELDS)
+
 # Location-specific constants
 LOCATION_NAME = "Connaught Place"
 LOCATION_DETAILS = {
@@ -61,66 +99,76 @@ SMART_FEATURES = {
     }
 }
 
-class SmartCityActuator:
-    """Administrative control system for Delhi's air quality and traffic management."""
-    def __init__(self):
-        self.traffic_signals = {}        # Traffic signal states across districts
-        self.alert_systems = {}          # Public alert system states
-        self.monitoring_stations = {}     # Air quality monitoring station data
-        self.emergency_protocols = {      # Emergency response protocols
-            'severe_pollution': False,
-            'traffic_emergency': False,
-            'public_health_alert': False
-        }
+# Rules for the latest window of each monitoring station (/api/smart-city-data)
+STATION_RULES = [
+    {
+        'name': 'hazardous_air',
+        'when': [('aqi', '>', 'air_quality.hazardous')],
+        'actions': ['Deploy water sprinklers in {location}'],
+        'advisory': ['Use N95 masks when outdoors', 'Avoid outdoor activities in early morning']
+    },
+    {
+        'name': 'congested_traffic',
+        'when': [('traffic_density', '>', 0.7)],
+        'actions': ['Divert traffic from {location}'],
+        'advisory': ['Use metro or carpool for commute']
+    }
+]
 
-    def manage_traffic_signals(self, district, action):
-        """
-        Manages traffic signal timing across districts.
-        Actions: 'optimize_flow', 'emergency_protocol', 'normal_operation'
-        """
-        valid_actions = ['optimize_flow', 'emergency_protocol', 'normal_operation']
-        if action in valid_actions:
-            self.traffic_signals[district] = action
-            return {'status': 'success', 'message': f'Traffic signal protocol {action} activated in {district}'}
-        return {'status': 'error', 'message': 'Invalid action specified'}
-
-    def issue_public_alert(self, district, alert_type, severity):
-        """
-        Issues public health and safety alerts.
-        Types: 'air_quality', 'traffic_congestion', 'weather_emergency'
-        """
-        alert_data = {
-            'type': alert_type,
-            'severity': severity,
-            'timestamp': datetime.now().isoformat(),
-            'district': district
-        }
-        self.alert_systems[district] = alert_data
-        return {'status': 'success', 'message': f'Alert issued for {district}: {alert_type} - {severity}'}
-
-    def update_monitoring_status(self, station_id, data):
-        """
-        Updates air quality monitoring station data.
-        """
-        self.monitoring_stations[station_id] = {
-            'data': data,
-            'last_updated': datetime.now().isoformat()
-        }
-        return {'status': 'success', 'message': f'Station {station_id} data updated'}
-
-    def activate_emergency_protocol(self, protocol_type, activate=True):
-        """
-        Activates or deactivates emergency protocols.
-        """
-        if protocol_type in self.emergency_protocols:
-            self.emergency_protocols[protocol_type] = activate
-            status = 'activated' if activate else 'deactivated'
-            return {'status': 'success', 'message': f'Emergency protocol {protocol_type} {status}'}
-        return {'status': 'error', 'message': 'Invalid protocol type'}
+# Rules for individual readings; traffic_ratio is the trip time relative to the station's average
+READING_RULES = [
+    {
+        'name': 'unhealthy_air',
+        'when': [('aqi', '>', 'air_quality.unhealthy')],
+        'recommendation': {
+            'type': 'health',
+            'priority': 'high',
+            'message': 'Air quality is unhealthy. Consider using air purifiers and limiting outdoor activities.'
+        },
+        'actuations': [
+            ('control_ventilation', {'area': '{location}', 'action': 'increase'}),
+            ('update_digital_signs', {'location': '{location}', 'message': 'POOR AIR QUALITY - USE ALTERNATE ROUTES'})
+        ]
+    },
+    {
+        'name': 'severe_congestion',
+        'when': [('traffic_ratio', '>', 1.5)],
+        'recommendation': {
+            'type': 'traffic',
+            'priority': 'high',
+            'message': 'Severe traffic congestion. Consider alternative routes or delay travel.'
+        },
+        'actuations': [
+            ('manage_traffic_signals', {'district': '{location}', 'action': 'optimize_flow'}),
+            ('update_digital_signs', {'location': '{location}', 'message': 'HEAVY TRAFFIC - USE ALTERNATE ROUTES'})
+        ]
+    },
+    {
+        'name': 'pollution_and_traffic',
+        'when': [('aqi', '>', 'air_quality.moderate'), ('traffic_ratio', '>', 1.2)],
+        'recommendation': {
+            'type': 'combined',
+            'priority': 'high',
+            'message': 'High pollution and traffic levels. Consider working remotely or using public transportation.'
+        },
+        'actuations': [
+            ('update_digital_signs', {
+                'location': '{location}', 'message': 'HIGH POLLUTION & TRAFFIC - CONSIDER PUBLIC TRANSPORT'
+            })
+        ]
+    }
+]
+
+# Compiled once at startup
+station_rules = RuleSet(STATION_RULES, SMART_FEATURES)
+reading_rules = RuleSet(READING_RULES, SMART_FEATURES)
 
 # Initialize the actuator
 city_actuator = SmartCityActuator()
 
+# Most events returned by /api/actuate/events
+MAX_ACTUATION_EVENTS = 10000
+
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
@@ -128,6 +176,16 @@ def after_request(response):
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
     return response
 
+def json_response(payload):
+    """
+    Serializes a payload that may contain StreamedColumns.
+    With ?stream=1 the body is sent incrementally (chunked transfer encoding)
+    instead of being built in memory first.
+    """
+    if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return app.response_class(buffered(stream_json(payload)), mimetype='application/json')
+    return app.response_class(''.join(stream_json(payload)), mimetype='application/json')
+
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
 def serve(path):
@@ -144,302 +202,729 @@ def not_found(e):
 def serve_csv():
     try:
         logger.info(f"Serving CSV file from: {DATA_FILE}")
-        return send_from_directory(os.path.dirname(DATA_FILE), os.path.basename(DATA_FILE))
+        return send_versioned_file(
+            os.path.dirname(DATA_FILE), os.path.basename(DATA_FILE), csv_file_cache.file_version()
+        )
     except Exception as e:
         logger.error(f"Error serving CSV file: {e}")
         return jsonify({"error": "Failed to serve CSV file"}), 500
 
 def load_data():
-    try:
-        logger.info(f"Loading data from CSV at path: {DATA_FILE}")
-        if not os.path.exists(DATA_FILE):
-            logger.error(f"CSV file not found at path: {DATA_FILE}")
-            return None
-            
-        # Read CSV file with index_col=0 to skip the index column
-        df = pd.read_csv(DATA_FILE, index_col=0)
-        
-        # Validate required columns
-        required_columns = ['timestamp', 'pm2_5', 'pm10', 'no2', 'o3', 'aqi', 'duration_in_traffic_min', 'distance_km']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            logger.error(f"Missing required columns in CSV: {missing_columns}")
-            return None
-            
-        # Convert timestamp and handle potential errors
-        try:
-            df['timestamp'] = pd.to_datetime(df['timestamp'], format='%m/%d/%Y %H:%M', errors='coerce')
-        except Exception as e:
-            logger.error(f"Error converting timestamps: {e}")
-            return None
-            
-        # Basic data validation
-        if df.empty:
-            logger.error("CSV file is empty")
-            return None
-
-        # Drop duplicates
-        logger.info(f"Total rows before dropping duplicates: {len(df)}")
-        df = df.drop_duplicates()
-        logger.info(f"Total rows after dropping duplicates: {len(df)}")
-
-        # Resample data to 10-minute intervals
-        df.set_index('timestamp', inplace=True)
-        df = df.resample('10T').mean().reset_index()
-        logger.info(f"Total rows after resampling: {len(df)}")
-
-        # Fill missing values
-        df['pm2_5'] = df['pm2_5'].fillna(df['pm2_5'].mean())
-        df['pm10'] = df['pm10'].fillna(df['pm10'].mean())
-        df['no2'] = df['no2'].fillna(df['no2'].mean())
-        df['o3'] = df['o3'].fillna(df['o3'].mean())
-        df['aqi'] = df['aqi'].fillna(df['aqi'].mean())
-        
-        # For traffic data, use forward fill for missing values
-        df['duration_in_traffic_min'] = df['duration_in_traffic_min'].fillna(method='ffill')
-        df['distance_km'] = df['distance_km'].fillna(method='ffill')
-        
-        logger.info(f"Data loaded and cleaned successfully. Shape: {df.shape}")
-        return df
-        
-    except pd.errors.EmptyDataError:
-        logger.error("CSV file is empty")
-        return None
-    except pd.errors.ParserError as e:
-        logger.error(f"Error parsing CSV file: {e}")
-        return None
-    except Exception as e:
-        logger.error(f"Unexpected error loading CSV file: {e}")
+    """
+    Returns the cleaned dataset as a DataFrame backed by the shared cache.
+    Handlers may add or replace columns on the returned frame, but the
+    underlying arrays are read-only and shared across requests.
+    """
+    dataset = dataset_cache.get()
+    if dataset is None:
         return None
+    return dataset.frame()
+
+@app.route('/api/reload-data', methods=['POST'])
+def reload_data():
+    logger.info("API call: /api/reload-data")
+    # Re-read and re-clean the source even if a shared copy of this version exists
+    for cache in (raw_dataset_cache, region_dataset_cache):
+        cache.reload(force=True)
+    dataset = dataset_cache.reload(force=True)
+    if dataset is None:
+        return jsonify({"error": "Failed to load data"}), 500
+    return jsonify({
+        "status": "success",
+        "version": dataset.version,
+        "rows": len(dataset)
+    })
+
+def format_chart_timestamps(timestamps):
+    """
+    Formats timestamps like the top graph ("11/26 9:30 PM") in one vectorized pass.
+    """
+    formatted = pd.Series(pd.DatetimeIndex(timestamps).strftime('%m/%d %I:%M %p'))
+    # Remove leading zeros from month, day and hour but keep 2-digit minutes
+    return formatted.str.replace(r'^0|(?<=[/ ])0', '', regex=True).tolist()
+
+def build_hourly_data(dataset):
+    # Keep about a third of the points, picked by LTTB so pollution and traffic spikes stay visible
+    timestamps = dataset.column('timestamp')
+    series = ['pm2_5', 'pm10', 'duration_in_traffic_min']
+    budget = series_budget(max(len(timestamps) // 3, MIN_POINTS), len(series))
+    step = np.unique(np.concatenate([
+        dataset.cached(('downsample', 'lttb', name, budget), lambda _, name=name: lttb_indices(timestamps, dataset.column(name), budget))
+        for name in series
+    ]))
+    pm25 = dataset.column('pm2_5')[step].tolist()
+    return [
+        {
+            "timestamp": timestamp,
+            "indoor_pm25": pm25_value,
+            "outdoor_pm25": pm25_value,
+            "pm10": pm10_value,
+            "traffic_density": traffic_value
+        }
+        for timestamp, pm25_value, pm10_value, traffic_value in zip(
+            format_chart_timestamps(timestamps[step]),
+            pm25,
+            dataset.column('pm10')[step].tolist(),
+            dataset.column('duration_in_traffic_min')[step].tolist()
+        )
+    ]
 
 def generate_hourly_data():
-    df = load_data()
-    if df is None:
+    """
+    Returns the chart points for the dashboard, built once per data version.
+    """
+    dataset = dataset_cache.get()
+    if dataset is None:
         return []
-    
-    # Convert timestamp to datetime
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    
-    # Sort by timestamp
-    df = df.sort_values('timestamp')
-    
-    # Take every 3rd point to reduce density
-    df = df.iloc[::3].copy()
-    
-    data_points = []
-    for _, row in df.iterrows():
-        # Format timestamp exactly like the top graph: "11/26 9:30 PM"
-        # Remove leading zeros and ensure spacing matches
-        timestamp = row['timestamp']
-        month = str(timestamp.month)
-        day = str(timestamp.day)
-        hour = str(timestamp.hour % 12 or 12)  # Convert 0 to 12
-        minute = str(timestamp.minute).zfill(2)  # Keep minutes as 2 digits
-        ampm = "AM" if timestamp.hour < 12 else "PM"
-        formatted_time = f"{month}/{day} {hour}:{minute} {ampm}"
-        
-        data_points.append({
-            "timestamp": formatted_time,
-            "indoor_pm25": row['pm2_5'],
-            "outdoor_pm25": row['pm2_5'],
-            "pm10": row['pm10'],
-            "traffic_density": row['duration_in_traffic_min']
-        })
-    
-    return data_points
+    return dataset.memo('hourly_data', build_hourly_data)
 
-def get_weather_data():
+def build_dashboard_payload(dataset):
+    """
+    Pre-serializes the parts of the dashboard response that only depend on the data.
+    """
+    data_points = dataset.memo('hourly_data', build_hourly_data)
+    if not data_points:
+        return None
+    current_data = data_points[-1]  # Latest data point
     return {
-        "temperature": round(np.random.uniform(15, 45), 1),
-        "humidity": round(np.random.uniform(30, 90), 1),
-        "wind_speed": round(np.random.uniform(0, 15), 1),
-        "season": np.random.choice(["winter", "summer", "monsoon", "autumn"])
+        "data_points_json": json.dumps(data_points, separators=(',', ':')),
+        "indoor_range": f"{current_data['indoor_pm25']} µg/m³",
+        "outdoor_pm25": f"{current_data['outdoor_pm25']} µg/m³",
+        "traffic_density": current_data['traffic_density']
     }
 
 @app.route('/api/dashboard')
 def dashboard():
     logger.info("API call: /api/dashboard")
-    current_data = generate_hourly_data()[-1]  # Get latest data point
-    
-    return jsonify({
-        "data_points": generate_hourly_data(),
-        "stats": {
-            "indoor_range": f"{current_data['indoor_pm25']} µg/m³",
-            "outdoor_pm25": f"{current_data['outdoor_pm25']} µg/m³",
-            "traffic_congestion": {
-                "level": "High" if current_data['traffic_density'] > 0.7 else 
-                         "Medium" if current_data['traffic_density'] > 0.4 else "Low",
-                "percentage": round(current_data['traffic_density'] * 100),
-                "trend": np.random.choice(["increasing", "decreasing"])
-            }
+    dataset = dataset_cache.get()
+    payload = dataset.memo('dashboard_payload', build_dashboard_payload) if dataset is not None else None
+    if payload is None:
+        return jsonify({"error": "Failed to load data"}), 500
+
+    traffic_density = payload['traffic_density']
+    stats = {
+        "indoor_range": payload['indoor_range'],
+        "outdoor_pm25": payload['outdoor_pm25'],
+        "traffic_congestion": {
+            "level": "High" if traffic_density > 0.7 else
+                     "Medium" if traffic_density > 0.4 else "Low",
+            "percentage": round(traffic_density * 100),
+            "trend": str(np.random.choice(["increasing", "decreasing"]))
         }
-    })
+    }
+    body = '{"data_points":%s,"stats":%s}' % (payload['data_points_json'], json.dumps(stats, separators=(',', ':')))
+    return app.response_class(body, mimetype='application/json')
 
 
 
-@app.route('/api/smart-city-data')
-def smart_city_data():
-    logger.info("API call: /api/smart-city-data")
-    df = load_data()
+# Each region is summarized over this span before its latest reading
+REGION_WINDOW = pd.Timedelta(hours=1)
+
+REGION_COLUMNS = ['timestamp', LOCATION_COLUMN, 'duration_min'] + SERIES_FIELDS
+
+def load_region_frame(path):
+    """
+    Loads unresampled readings of every monitoring station, sorted by timestamp.
+    """
+    df = read_merged(path)
     if df is None:
-        return jsonify({"error": "Failed to load data"}), 500
-    
-    regions_data = []
-    
-    for region in ["Anand Vihar", "ITO", "Dwarka", "Rohini", "Punjabi Bagh",
-                    "RK Puram", "Mandir Marg", "Shadipur", "Siri Fort", "Ashok Vihar"]:
-        aqi = df['aqi'].iloc[0]
-        traffic_density = df['duration_in_traffic_min'].iloc[0]
-        events = np.random.sample(["Diwali", "Republic Day", "Independence Day", "Durga Puja",
-                                "Christmas", "New Year"], np.random.randint(0, 2))
-        
-        regions_data.append({
-            "name": region,
-            "aqi": aqi,
-            "traffic_density": traffic_density,
-            "crowd_density": round(np.random.uniform(0.3, 0.9), 2),
-            "events_nearby": events,
-            "weather": get_weather_data()
-        })
-    
-    # Generate recommendations based on data
-    high_pollution_regions = [r["name"] for r in regions_data if r["aqi"] > 300]
-    high_traffic_regions = [r["name"] for r in regions_data if r["traffic_density"] > 0.7]
-    
+        return None
+    df = df.dropna(subset=['timestamp']).sort_values('timestamp', kind='stable')
+    return df.reindex(columns=REGION_COLUMNS)
+
+# Per-station readings as recorded (no gap filling), for /api/smart-city-data and /api/anomalies
+region_dataset_cache = DatasetCache(DATA_SOURCE, loader=load_region_frame)
+
+# Placeholder context reported for every region until crowd, event and weather feeds exist
+REGION_EVENTS = ["Diwali", "Republic Day", "Independence Day", "Durga Puja", "Christmas", "New Year"]
+
+def get_weather_data():
+    return {
+        "temperature": round(np.random.uniform(15, 45), 1),
+        "humidity": round(np.random.uniform(30, 90), 1),
+        "wind_speed": round(np.random.uniform(0, 15), 1),
+        "season": str(np.random.choice(["winter", "summer", "monsoon", "autumn"]))
+    }
+
+def free_flow_duration(df):
+    """
+    Trip time without traffic: the recorded duration_min, or where that is
+    missing (files from before it was logged) the station's fastest recorded trip.
+    """
+    fastest = df.groupby(LOCATION_COLUMN)['duration_in_traffic_min'].transform('min')
+    return df['duration_min'].fillna(fastest)
+
+def build_region_summaries(dataset):
+    """
+    Summarizes every region's latest window with one groupby over all stations.
+    Traffic density is the share of the trip time lost to congestion (0-1).
+    """
+    df = dataset.frame()
+    df['free_flow_duration'] = free_flow_duration(df)
+    latest = df.groupby(LOCATION_COLUMN, sort=False)['timestamp'].transform('max')
+    window = df[df['timestamp'] >= latest - REGION_WINDOW]
+    summary = window.groupby(LOCATION_COLUMN).agg(
+        aqi=('aqi', 'last'),
+        aqi_mean=('aqi', 'mean'),
+        pm2_5=('pm2_5', 'mean'),
+        pm10=('pm10', 'mean'),
+        traffic_duration=('duration_in_traffic_min', 'mean'),
+        free_flow_duration=('free_flow_duration', 'mean'),
+        readings=('timestamp', 'size'),
+        last_reading=('timestamp', 'max')
+    )
+    summary['traffic_density'] = (1 - summary['free_flow_duration'] / summary['traffic_duration']).clip(0, 1)
+    summary['last_reading'] = summary['last_reading'].dt.strftime('%Y-%m-%dT%H:%M:%S')
+    summary = summary.drop(columns='free_flow_duration').round(2)
+
+    regions = summary.reset_index().rename(columns={LOCATION_COLUMN: 'name'})
+    regions = regions.astype(object).where(regions.notna(), None).to_dict('records')
+
+    # Every station is checked against every rule in one pass
+    stations = summary.reset_index()
+    fired = station_rules.evaluate(stations)
     immediate_actions = []
     citizen_advisory = []
-    
-    if high_pollution_regions:
-        immediate_actions.extend([
-            f"Deploy water sprinklers in {region}" for region in high_pollution_regions
-        ])
-        citizen_advisory.append("Use N95 masks when outdoors")
-        citizen_advisory.append("Avoid outdoor activities in early morning")
-    
-    if high_traffic_regions:
-        immediate_actions.extend([
-            f"Divert traffic from {region}" for region in high_traffic_regions
-        ])
-        citizen_advisory.append("Use metro or carpool for commute")
-    
-    return jsonify({
-        "regions": regions_data,
+    for _, outcome in station_rules.outcomes(fired, stations.to_dict('records')):
+        immediate_actions.extend(outcome['actions'])
+        citizen_advisory.extend(outcome['advisory'])
+    citizen_advisory = list(dict.fromkeys(citizen_advisory))
+
+    return {
+        "regions": regions,
         "recommendations": {
             "immediate_actions": immediate_actions,
             "citizen_advisory": citizen_advisory
         },
-        "last_updated": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        "latest_reading": summary['last_reading'].max() if len(summary) else None,
+        "last_updated": window['timestamp'].max().strftime("%Y-%m-%d %H:%M:%S") if len(window) else None
+    }
+
+# Not wrapped in @conditional: the placeholder fields are drawn anew for every response
+@app.route('/api/smart-city-data')
+def smart_city_data():
+    logger.info("API call: /api/smart-city-data")
+    dataset = region_dataset_cache.get()
+    if dataset is None:
+        return jsonify({"error": "Failed to load data"}), 500
+    summaries = dataset.memo('region_summaries', build_region_summaries)
+    regions = [
+        dict(
+            region,
+            crowd_density=round(np.random.uniform(0.3, 0.9), 2),
+            events_nearby=np.random.choice(REGION_EVENTS, np.random.randint(0, 2), replace=False).tolist(),
+            weather=get_weather_data()
+        )
+        for region in summaries['regions']
+    ]
+    body = json.dumps({**summaries, "regions": regions}, separators=(',', ':'))
+    return app.response_class(body, mimetype='application/json')
+
+def build_rule_metrics(dataset):
+    """
+    Every recorded reading with the metrics station and reading rules refer to.
+    """
+    df = dataset.frame()
+    typical = df.groupby(LOCATION_COLUMN)['duration_in_traffic_min'].transform('mean')
+    df = reading_metrics(df, typical)
+    df['traffic_density'] = (1 - free_flow_duration(df) / df['duration_in_traffic_min']).clip(0, 1)
+    return df
+
+@app.route('/api/rules/backtest')
+@conditional(lambda: region_dataset_cache.file_version())
+def backtest_rules():
+    """
+    How often each station and reading rule would have fired on the readings
+    in [start, end] (optionally of one 'location'), with the first and last time.
+    """
+    logger.info("API call: /api/rules/backtest")
+    dataset = region_dataset_cache.get()
+    if dataset is None:
+        return jsonify({"error": "Failed to load data"}), 500
+
+    try:
+        query = RangeQuery.from_args(request.args, dataset, SERIES_FIELDS)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    lo, hi = query.bounds(dataset)
+    df = dataset.memo('rule_metrics', build_rule_metrics).iloc[lo:hi]
+    location = request.args.get('location')
+    if location:
+        df = df[df[LOCATION_COLUMN] == location]
+    timestamps = df['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%S').to_numpy()
+    return jsonify({
+        "readings": len(df),
+        "station_rules": station_rules.summarize(station_rules.evaluate(df), timestamps),
+        "reading_rules": reading_rules.summarize(reading_rules.evaluate(df), timestamps)
     })
 
 @app.route('/api/location-data')
+@conditional(lambda: dataset_cache.file_version())
 def get_location_data():
     logger.info("API call: /api/location-data")
-    df = load_data()
-    if df is None:
+    dataset = dataset_cache.get()
+    if dataset is None:
         logger.error("Failed to load data from CSV")
         return jsonify({"error": "Failed to load data"}), 500
+
+    try:
+        query = RangeQuery.from_args(request.args, dataset, SERIES_FIELDS)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    stats_df = query.apply(dataset, columns=SERIES_FIELDS, rollups=rollup_store)
+    if stats_df.empty:
+        return jsonify({"error": "No data in the requested range"}), 404
+    logger.info(f"Data loaded successfully. Shape: {stats_df.shape}")
+
+    # Statistics cover the whole range; only the returned series are downsampled
+    if query.resolution == 'raw':
+        lo, hi = query.bounds(dataset)
+        stats = stats_store.summary(dataset, lo, hi)
+    else:
+        stats = OnlineStats.from_columns(stats_df, SERIES_FIELDS)
+    df = query.downsample(dataset, stats_df)
     
-    logger.info(f"Data loaded successfully. Shape: {df.shape}")
-    logger.info(f"Columns: {df.columns.tolist()}")
-    logger.info(f"First row: {df.iloc[0].to_dict()}")
-    
-    # Convert timestamps to ISO format for better compatibility
-    timestamps = df['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%S').tolist()
-    
-    # Use actual data from CSV
+    # Use actual data from CSV; series are serialized chunk by chunk,
+    # with timestamps converted to ISO format for better compatibility
     data = {
         "location": LOCATION_NAME,
         "details": LOCATION_DETAILS,
         "data": {
-            "timestamps": timestamps,
+            "timestamps": StreamedColumn(df['timestamp'].to_numpy(), format_timestamps('%Y-%m-%dT%H:%M:%S')),
             "air_quality": {
-                "pm2_5": df['pm2_5'].fillna(0).tolist(),
-                "pm10": df['pm10'].fillna(0).tolist(),
-                "no2": df['no2'].fillna(0).tolist(),
-                "o3": df['o3'].fillna(0).tolist(),
-                "aqi": df['aqi'].fillna(0).tolist()
+                field: StreamedColumn(df[field].to_numpy(), fill_nan(0))
+                for field in AIR_QUALITY_COLUMNS if field in query.fields
             },
             "traffic": {
-                "duration": df['duration_in_traffic_min'].fillna(0).tolist(),
-                "distance": df['distance_km'].fillna(0).tolist()
+                key: StreamedColumn(df[field].to_numpy(), fill_nan(0))
+                for key, field in [("duration", "duration_in_traffic_min"), ("distance", "distance_km")]
+                if field in query.fields
             }
         },
         "statistics": {
-            "average_aqi": float(df['aqi'].mean()),
-            "max_aqi": float(df['aqi'].max()),
-            "min_aqi": float(df['aqi'].min()),
-            "average_traffic_duration": float(df['duration_in_traffic_min'].mean()),
-            "max_traffic_duration": float(df['duration_in_traffic_min'].max()),
+            "average_aqi": stats.mean('aqi'),
+            "max_aqi": stats.max('aqi'),
+            "min_aqi": stats.min('aqi'),
+            "average_traffic_duration": stats.mean('duration_in_traffic_min'),
+            "max_traffic_duration": stats.max('duration_in_traffic_min'),
             "correlations": {
-                "pm25_traffic": float(df['pm2_5'].corr(df['duration_in_traffic_min'])),
-                "pm10_traffic": float(df['pm10'].corr(df['duration_in_traffic_min'])),
-                "no2_traffic": float(df['no2'].corr(df['duration_in_traffic_min']))
+                "pm25_traffic": stats.corr('pm2_5', 'duration_in_traffic_min'),
+                "pm10_traffic": stats.corr('pm10', 'duration_in_traffic_min'),
+                "no2_traffic": stats.corr('no2', 'duration_in_traffic_min')
             }
         }
     }
     
     logger.info("Successfully prepared response data")
-    return jsonify(data)
+    return json_response(data)
+
+def clean_air_traffic_frame(df, means=None):
+    """
+    Fills and rounds readings for /api/air-traffic-data. Missing air quality
+    values get the mean of ``means`` (by default the frame's own column means).
+    """
+    df = df.dropna(subset=['timestamp']).sort_values('timestamp', kind='stable')
+
+    # Fill NaN values with appropriate defaults
+    for col in AIR_QUALITY_COLUMNS:
+        df[col] = df[col].fillna(df[col].mean() if means is None else means[col])
+    for col in TRAFFIC_COLUMNS:
+        df[col] = df[col].fillna(0)
+
+    # Round numeric columns to 2 decimal places to reduce payload size
+    df[SERIES_FIELDS] = df[SERIES_FIELDS].round(2)
+    return df[['timestamp'] + SERIES_FIELDS]
+
+def load_air_traffic_frame(path):
+    """
+    Loads the merged data without resampling, sorted by timestamp, for /api/air-traffic-data.
+    """
+    df = read_merged(path)
+    if df is None:
+        return None
+    return clean_air_traffic_frame(df)
+
+# Unresampled copy of the data, sorted by timestamp
+raw_dataset_cache = DatasetCache(DATA_SOURCE, loader=load_air_traffic_frame)
+raw_rollup_store = RollupStore(SERIES_FIELDS)
+
+# Pushes newly appended readings and AQI band changes to connected clients
+live_feed = LiveFeed(raw_dataset_cache, SERIES_FIELDS, {'aqi': SMART_FEATURES['air_quality']})
+
+# Latest timestamp and whole-history means of the database, per data version
+database_summaries = LRUCache(maxsize=4)
+
+def query_air_traffic_range(args):
+    """
+    Reads the range of a raw-resolution /api/air-traffic-data request from
+    the database, so only its rows are loaded rather than the whole table.
+    Gaps are filled with the whole history's means, as in the cached frame.
+    Returns (query, Dataset of the range), or (None, None) if there are no readings.
+    """
+    store = database.ReadingStore(DATA_SOURCE)
+    version = dataset_cache.file_version()
+    if version is None:
+        # Only SQLite files can be watched; other databases are summarized on every request
+        latest, means = store.summary(AIR_QUALITY_COLUMNS)
+    else:
+        latest, means = database_summaries.get_or_build(version, lambda: store.summary(AIR_QUALITY_COLUMNS))
+    if latest is None:
+        return None, None
+    query = RangeQuery.from_args(args, None, SERIES_FIELDS, latest=latest)
+    df = clean_air_traffic_frame(store.query(query.start, query.end, fields=SERIES_FIELDS), means)
+    return query, Dataset.from_frame(df, version)
+
+def wants_database_range(args):
+    """
+    Whether a request is a time range that the database can answer directly.
+    Coarser resolutions keep using the in-memory rollups.
+    """
+    return (database.is_database_url(DATA_SOURCE) and ('start' in args or 'end' in args)
+            and args.get('resolution', 'raw') == 'raw')
+
+# Response keys used by /api/air-traffic-data for each series
+AIR_TRAFFIC_KEYS = {
+    'pm2_5': 'pm25',
+    'pm10': 'pm10',
+    'no2': 'no2',
+    'o3': 'o3',
+    'aqi': 'aqi',
+    'duration_in_traffic_min': 'duration',
+    'distance_km': 'distance'
+}
 
 @app.route('/api/air-traffic-data')
+@conditional(lambda: dataset_cache.file_version())
 def get_air_traffic_data():
     try:
         logger.info("API call: /api/air-traffic-data")
-        logger.info("Loading data from CSV...")
-        df = pd.read_csv(DATA_FILE)
-        
-        if df.empty:
-            logger.error("CSV file is empty")
-            return jsonify({"error": "CSV file is empty"}), 500
-            
-        logger.info(f"Data loaded successfully. Shape: {df.shape}")
-        
-        # Drop the unnamed index column if it exists
-        if 'Unnamed: 0' in df.columns:
-            df = df.drop('Unnamed: 0', axis=1)
-        
-        # Convert timestamp column
-        df['timestamp'] = pd.to_datetime(df['timestamp'], format='%m/%d/%Y %H:%M')
-        df = df.sort_values('timestamp')
-        
-        # Fill NaN values with appropriate defaults
-        df['pm2_5'] = df['pm2_5'].fillna(df['pm2_5'].mean())
-        df['pm10'] = df['pm10'].fillna(df['pm10'].mean())
-        df['no2'] = df['no2'].fillna(df['no2'].mean())
-        df['o3'] = df['o3'].fillna(df['o3'].mean())
-        df['aqi'] = df['aqi'].fillna(df['aqi'].mean())
-        df['duration_in_traffic_min'] = df['duration_in_traffic_min'].fillna(0)
-        df['distance_km'] = df['distance_km'].fillna(0)
-        
-        # Round numeric columns to 2 decimal places to reduce payload size
-        numeric_columns = ['pm2_5', 'pm10', 'no2', 'o3', 'aqi', 'duration_in_traffic_min', 'distance_km']
-        df[numeric_columns] = df[numeric_columns].round(2)
+        if wants_database_range(request.args):
+            try:
+                query, dataset = query_air_traffic_range(request.args)
+            except QueryError as e:
+                return jsonify({"error": str(e)}), 400
+            if dataset is None:
+                logger.error("Database has no readings")
+                return jsonify({"error": "CSV file is empty"}), 500
+            df = query.downsample(dataset, query.apply(dataset))
+        else:
+            dataset = raw_dataset_cache.get()
+
+            if dataset is None or len(dataset) == 0:
+                logger.error("CSV file is empty")
+                return jsonify({"error": "CSV file is empty"}), 500
+
+            try:
+                query = RangeQuery.from_args(request.args, dataset, SERIES_FIELDS)
+            except QueryError as e:
+                return jsonify({"error": str(e)}), 400
+
+            df = query.downsample(dataset, query.apply(dataset, rollups=raw_rollup_store))
+        if query.resolution != 'raw':
+            df[query.fields] = df[query.fields].round(2)
         
         # Process the data
-        data = {
-            "timestamps": df['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S').tolist(),
-            "pm25": df['pm2_5'].tolist(),
-            "pm10": df['pm10'].tolist(),
-            "no2": df['no2'].tolist(),
-            "o3": df['o3'].tolist(),
-            "aqi": df['aqi'].tolist(),
-            "duration": df['duration_in_traffic_min'].tolist(),
-            "distance": df['distance_km'].tolist()
-        }
+        data = {"timestamps": StreamedColumn(df['timestamp'].to_numpy(), format_timestamps('%Y-%m-%d %H:%M:%S'))}
+        for field in query.fields:
+            data[AIR_TRAFFIC_KEYS[field]] = StreamedColumn(df[field].to_numpy())
         
         response_data = {
             "status": "success",
             "data": data
         }
         
-        logger.info(f"Sending response with {len(data['timestamps'])} data points")
-        return jsonify(response_data)
+        logger.info(f"Sending response with {len(df)} data points")
+        return json_response(response_data)
         
     except Exception as e:
         error_msg = f"Error in get_air_traffic_data: {str(e)}\n{traceback.format_exc()}"
         logger.error(error_msg)
         return jsonify({"error": error_msg}), 500
 
+@app.route('/api/live')
+def live_stream():
+    """
+    Server-Sent Events stream of new readings ('reading') and threshold
+    crossings ('threshold'). Reconnecting clients send Last-Event-ID and
+    receive the readings they missed first.
+    """
+    logger.info("API call: /api/live")
+    return app.response_class(
+        live_feed.stream(request.headers.get('Last-Event-ID')),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/delta')
+def get_delta():
+    """
+    Returns only the readings appended after 'cursor' and the cursor to send next time.
+    Without a cursor, starts from the beginning of the history; 'limit' caps the
+    number of rows per call so clients can page through a large backlog.
+    """
+    logger.info("API call: /api/delta")
+    dataset = raw_dataset_cache.get()
+    if dataset is None:
+        return jsonify({"error": "Failed to load data"}), 500
+
+    try:
+        fields = parse_fields(request.args.get('fields'), SERIES_FIELDS)
+        timestamps = dataset.column('timestamp')
+        lo = cursor_position(timestamps, request.args.get('cursor', '0.0'))
+        limit = request.args.get('limit', type=int)
+        if limit is not None and limit < 1:
+            raise QueryError("'limit' must be positive")
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    hi = len(dataset) if limit is None else min(len(dataset), lo + limit)
+    data = {"timestamps": StreamedColumn(timestamps[lo:hi], format_timestamps('%Y-%m-%d %H:%M:%S'))}
+    for field in fields:
+        data[AIR_TRAFFIC_KEYS[field]] = StreamedColumn(dataset.column(field)[lo:hi])
+
+    return json_response({
+        "status": "success",
+        "cursor": make_cursor(timestamps, hi),
+        "count": hi - lo,
+        "has_more": hi < len(dataset),
+        "data": data
+    })
+
+@app.route('/api/aggregates')
+@conditional(lambda: dataset_cache.file_version())
+def get_aggregates():
+    """
+    Summary statistics (count, mean, min, max, std) per series, served from the rollups.
+    With a 'resolution' other than raw, returns the statistics of every bucket instead.
+    """
+    logger.info("API call: /api/aggregates")
+    dataset = dataset_cache.get()
+    if dataset is None:
+        return jsonify({"error": "Failed to load data"}), 500
+
+    try:
+        query = RangeQuery.from_args(request.args, dataset, SERIES_FIELDS)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    rollup_store.sync(dataset)
+    if query.resolution not in rollup_store:
+        return jsonify({
+            "start": query.start.isoformat() if query.start is not None else None,
+            "end": query.end.isoformat() if query.end is not None else None,
+            "statistics": rollup_store.aggregate(query.start, query.end, query.fields)
+        })
+
+    df = rollup_store.series(query.resolution, query.start, query.end, query.fields)
+    buckets = {"timestamps": df['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%S').tolist()}
+    for field in query.fields:
+        buckets[field] = {
+            stat: df[f"{field}_{stat}"].tolist()
+            for stat in ('count', 'mean', 'min', 'max', 'std')
+        }
+    return jsonify({"resolution": query.resolution, "buckets": buckets})
+
+# Pollutants correlated against traffic delay by /api/rolling-correlations
+POLLUTANT_FIELDS = ['pm2_5', 'pm10', 'no2', 'o3']
+TRAFFIC_DELAY_FIELD = 'duration_in_traffic_min'
+DEFAULT_WINDOW = '24h'
+
+@app.route('/api/rolling-correlations')
+@conditional(lambda: dataset_cache.file_version())
+def get_rolling_correlations():
+    """
+    Correlation between each pollutant and traffic delay over a sliding time
+    window ('window', e.g. 24h or 7d) ending at every reading in [start, end].
+    Each (field, window) series is computed once per data version; 'points'
+    caps the number of readings returned.
+    """
+    logger.info("API call: /api/rolling-correlations")
+    dataset = dataset_cache.get()
+    if dataset is None:
+        return jsonify({"error": "Failed to load data"}), 500
+
+    try:
+        window_arg = request.args.get('window', DEFAULT_WINDOW)
+        window = parse_window(window_arg)
+        query = RangeQuery.from_args(request.args, dataset, POLLUTANT_FIELDS)
+        if query.resolution != 'raw':
+            raise QueryError("'resolution' is not supported here; use 'points' to limit the response")
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    timestamps = dataset.column('timestamp')
+    series = {
+        field: dataset.cached(
+            ('rolling_corr', field, window.value),
+            lambda ds, field=field: rolling_corr(timestamps, ds.column(field), ds.column(TRAFFIC_DELAY_FIELD), window)
+        )
+        for field in query.fields
+    }
+    lo, hi = query.bounds(dataset)
+    indices = np.arange(lo, hi)
+    if query.points is not None and hi - lo > query.points:
+        budget = series_budget(query.points, len(query.fields))
+        indices = lo + np.unique(np.concatenate([
+            dataset.cached(
+                ('rolling_corr_points', field, window.value, query.method, lo, hi, budget),
+                lambda _, field=field: downsample_indices(timestamps[lo:hi], series[field][lo:hi], budget, query.method)
+            )
+            for field in query.fields
+        ]))
+
+    return json_response({
+        "window": window_arg,
+        "traffic_field": TRAFFIC_DELAY_FIELD,
+        "data": {
+            "timestamps": StreamedColumn(timestamps[indices], format_timestamps('%Y-%m-%dT%H:%M:%S')),
+            "correlations": {field: StreamedColumn(series[field][indices], fill_nan(None)) for field in query.fields}
+        }
+    })
+
+def build_weekly_profiles(dataset, lo, hi, fields):
+    profiles = {}
+    timestamps = dataset.column('timestamp')[lo:hi]
+    for field in fields:
+        sums, counts = weekly_profile(timestamps, dataset.column(field)[lo:hi])
+        means = profile_means(sums, counts)
+        profiles[field] = {
+            "mean": np.where(np.isnan(means), None, means).tolist(),
+            "count": counts.tolist()
+        }
+    return profiles
+
+@app.route('/api/profiles')
+@conditional(lambda: dataset_cache.file_version())
+def get_profiles():
+    """
+    Mean of each series per day of the week and hour of the day over [start, end]:
+    'mean' and 'count' are 7 x 24 grids with Monday first.
+    """
+    logger.info("API call: /api/profiles")
+    dataset = dataset_cache.get()
+    if dataset is None:
+        return jsonify({"error": "Failed to load data"}), 500
+
+    try:
+        query = RangeQuery.from_args(request.args, dataset, SERIES_FIELDS)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    lo, hi = query.bounds(dataset)
+    fields = tuple(query.fields)
+    profiles = dataset.cached(('weekly_profiles', lo, hi, fields), lambda ds: build_weekly_profiles(ds, lo, hi, fields))
+    return jsonify({
+        "start": query.start.isoformat() if query.start is not None else None,
+        "end": query.end.isoformat() if query.end is not None else None,
+        "weekdays": WEEKDAYS,
+        "hours": list(range(24)),
+        "profiles": profiles
+    })
+
+ANOMALY_METHODS = ('ewma', 'robust')
+
+@app.route('/api/anomalies')
+@conditional(lambda: region_dataset_cache.file_version())
+def get_anomalies():
+    """
+    Spikes, dropouts (missing values) and gaps in the readings as recorded.
+    'method' picks EWMA z-scores (default, as tagged at ingest) or rolling
+    median/MAD scores; 'location' and 'kind' filter the result. Detection
+    runs once per data version and method.
+    """
+    logger.info("API call: /api/anomalies")
+    dataset = region_dataset_cache.get()
+    if dataset is None:
+        return jsonify({"error": "Failed to load data"}), 500
+
+    try:
+        query = RangeQuery.from_args(request.args, dataset, SERIES_FIELDS)
+        method = request.args.get('method', 'ewma')
+        if method not in ANOMALY_METHODS:
+            raise QueryError(f"Invalid method '{method}'. Use one of: {list(ANOMALY_METHODS)}")
+        kinds = parse_fields(request.args.get('kind'), KINDS)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    found = dataset.memo(('anomalies', method), lambda ds: detect(ds.frame(), SERIES_FIELDS, method))
+    lo, hi = range_bounds(found['timestamp'].to_numpy(), query.start, query.end)
+    found = found.iloc[lo:hi]
+    keep = found['kind'].isin(kinds) & (found['field'].isin(query.fields) | found['field'].isna())
+    location = request.args.get('location')
+    if location:
+        keep &= found['location'] == location
+    found = found[keep]
+    found = found.assign(timestamp=found['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%S'))
+
+    return jsonify({
+        "method": method,
+        "threshold": THRESHOLD,
+        "count": len(found),
+        "anomalies": found.astype(object).where(found.notna(), None).to_dict('records')
+    })
+
+# AQI forecaster, loaded from disk at startup and retrained in a child process as data arrives
+# (set FORECAST_TRAINING=0 when models are trained by a separate `python forecast.py train` job)
+forecaster = Forecaster(
+    DEFAULT_MODEL_PATH, dataset_cache,
+    train_in_background=os.environ.get('FORECAST_TRAINING', '1') != '0'
+)
+
+# Most forecast origins a single request may ask for
+MAX_FORECAST_ORIGINS = 5000
+
+def forecast_version():
+    version = dataset_cache.file_version()
+    stamp = forecaster.stamp
+    return None if version is None or stamp is None else f"{version}-{stamp}"
+
+@app.route('/api/forecast')
+@conditional(forecast_version)
+def get_forecast():
+    """
+    Predicted AQI at each requested horizon ('horizons', e.g. 1h,24h; default all).
+    Forecasts are made from the latest reading, or from every reading in
+    [start, end] when either is given, in one batch.
+    """
+    logger.info("API call: /api/forecast")
+    dataset = dataset_cache.get()
+    if dataset is None:
+        return jsonify({"error": "Failed to load data"}), 500
+    forecaster.refresh(dataset)
+
+    try:
+        horizons = parse_fields(request.args.get('horizons'), list(HORIZONS))
+        query = RangeQuery.from_args(request.args, dataset, SERIES_FIELDS)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if query.start is None and query.end is None:
+        lo, hi = max(0, len(dataset) - 1), len(dataset)
+    else:
+        lo, hi = query.bounds(dataset)
+    if hi - lo > MAX_FORECAST_ORIGINS:
+        return jsonify({"error": f"At most {MAX_FORECAST_ORIGINS} forecast origins per request"}), 400
+
+    df = forecaster.predict(dataset, lo, hi, horizons)
+    if df is None:
+        return jsonify({"error": "Forecast model is not trained yet; try again shortly"}), 503
+    bundle = forecaster.load()
+    return json_response({
+        "target": "aqi",
+        "model": {
+            "data_version": bundle['data_version'],
+            "trained_at": datetime.fromtimestamp(bundle['trained_at']).isoformat(timespec='seconds'),
+            "training_rows": bundle['training_rows'],
+            "stale": bundle['data_version'] != dataset.version
+        },
+        "origins": StreamedColumn(df['timestamp'].to_numpy(), format_timestamps('%Y-%m-%dT%H:%M:%S')),
+        "forecasts": {horizon: StreamedColumn(df[horizon].to_numpy(), fill_nan(None)) for horizon in horizons}
+    })
+
+INSIGHT_FIELDS = ['pm2_5', 'pm10', 'no2', 'o3', 'duration_in_traffic_min']
+
 def generate_insights(df):
     """
     Generate insights by analyzing correlations between air quality and traffic data.
@@ -447,12 +932,13 @@ def generate_insights(df):
     """
     insights = []
     
-    # Calculate correlations between air quality and traffic metrics
+    # Calculate correlations between air quality and traffic metrics in one pass
+    stats = OnlineStats.from_columns(df, INSIGHT_FIELDS)
     correlations = {
-        'pm25_traffic': df['pm2_5'].corr(df['duration_in_traffic_min']),
-        'pm10_traffic': df['pm10'].corr(df['duration_in_traffic_min']),
-        'no2_traffic': df['no2'].corr(df['duration_in_traffic_min']),
-        'o3_traffic': df['o3'].corr(df['duration_in_traffic_min'])
+        'pm25_traffic': stats.corr('pm2_5', 'duration_in_traffic_min'),
+        'pm10_traffic': stats.corr('pm10', 'duration_in_traffic_min'),
+        'no2_traffic': stats.corr('no2', 'duration_in_traffic_min'),
+        'o3_traffic': stats.corr('o3', 'duration_in_traffic_min')
     }
     
     # Generate insights based on correlations
@@ -463,9 +949,8 @@ def generate_insights(df):
             insights.append(f"Moderate correlation ({corr:.2f}) found between {metric.split('_')[0]} and traffic congestion")
     
     # Analyze peak hours
-    df['hour'] = pd.to_datetime(df['timestamp']).dt.hour
-    peak_pollution_hours = df.groupby('hour')['aqi'].mean().nlargest(3).index.tolist()
-    peak_traffic_hours = df.groupby('hour')['duration_in_traffic_min'].mean().nlargest(3).index.tolist()
+    peak_pollution_hours = peak_hours(df['timestamp'], df['aqi'])
+    peak_traffic_hours = peak_hours(df['timestamp'], df['duration_in_traffic_min'])
     
     # Cross-reference peak hours
     common_peaks = set(peak_pollution_hours).intersection(peak_traffic_hours)
@@ -474,69 +959,46 @@ def generate_insights(df):
     
     return insights
 
+def reading_metrics(df, avg_duration):
+    """
+    Adds the metrics reading rules refer to; ``avg_duration`` is each row's
+    typical trip time (a scalar or an array).
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        traffic_ratio = df['duration_in_traffic_min'].to_numpy(dtype=float) / np.asarray(avg_duration, dtype=float)
+    return df.assign(traffic_ratio=traffic_ratio)
+
+# Command type of each actuator method that rules name
+COMMAND_BY_METHOD = {method: command for command, (method, _) in COMMANDS.items()}
+
 def generate_smart_recommendations(current_data):
     """
     Generate smart recommendations and automatic actuation responses based on conditions.
+    ``current_data`` is one reading, or a DataFrame of readings (e.g. one per
+    station) with 'aqi', 'duration_in_traffic_min', 'avg_duration' and optionally
+    'location'; all rows are evaluated together.
     """
+    df = current_data if isinstance(current_data, pd.DataFrame) else pd.DataFrame([current_data])
+    if LOCATION_COLUMN not in df:
+        df = df.assign(**{LOCATION_COLUMN: DEFAULT_LOCATION})
+    df = reading_metrics(df, df['avg_duration'])
+    fired = reading_rules.evaluate(df)
+
     recommendations = []
+    commands = []
+    for _, outcome in reading_rules.outcomes(fired, df.to_dict('records')):
+        recommendations.append(outcome['recommendation'])
+        commands.extend(dict(kwargs, type=COMMAND_BY_METHOD[method]) for method, kwargs in outcome['actuations'])
+
+    # Every actuation is applied as one batch, under each subsystem's lock once
     actuations = []
-    
-    # Air Quality based recommendations and actuations
-    aqi_level = current_data['aqi']
-    if aqi_level > 150:
-        recommendations.append({
-            'type': 'health',
-            'priority': 'high',
-            'message': 'Air quality is unhealthy. Consider using air purifiers and limiting outdoor activities.'
-        })
-        # Trigger ventilation systems
-        actuations.append(
-            city_actuator.control_ventilation('city_center', 'increase')
-        )
-        # Update digital signs
-        actuations.append(
-            city_actuator.update_digital_signs(
-                'main_street',
-                'POOR AIR QUALITY - USE ALTERNATE ROUTES'
-            )
-        )
-    
-    # Traffic based recommendations and actuations
-    traffic_duration = current_data['duration_in_traffic_min']
-    avg_duration = current_data['avg_duration']
-    if traffic_duration > avg_duration * 1.5:
-        recommendations.append({
-            'type': 'traffic',
-            'priority': 'high',
-            'message': 'Severe traffic congestion. Consider alternative routes or delay travel.'
-        })
-        # Adjust traffic light timing
-        actuations.append(
-            city_actuator.control_traffic_lights('congested_intersection', 'extend_green')
-        )
-        # Update digital signs
-        actuations.append(
-            city_actuator.update_digital_signs(
-                'highway_entrance',
-                'HEAVY TRAFFIC - USE ALTERNATE ROUTES'
-            )
-        )
-    
-    # Combined conditions
-    if aqi_level > 100 and traffic_duration > avg_duration * 1.2:
-        recommendations.append({
-            'type': 'combined',
-            'priority': 'high',
-            'message': 'High pollution and traffic levels. Consider working remotely or using public transportation.'
-        })
-        # Implement combined response
-        actuations.append(
-            city_actuator.update_digital_signs(
-                'city_entrance',
-                'HIGH POLLUTION & TRAFFIC - CONSIDER PUBLIC TRANSPORT'
-            )
-        )
-    
+    if commands:
+        result = city_actuator.apply_batch(commands)
+        if result['status'] == 'success':
+            actuations = [{'status': 'success', 'message': message} for message in result['messages']]
+        else:
+            actuations = [result]
+
     return {
         'recommendations': recommendations,
         'actuations': actuations
@@ -591,6 +1053,51 @@ def activate_emergency_protocol():
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@app.route('/api/actuate/batch', methods=['POST'])
+def actuate_batch():
+    """
+    Applies many commands in one request, all or none, e.g.
+    {"commands": [{"type": "traffic_signals", "district": "...", "action": "optimize_flow"}, ...]}
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('commands'), list):
+        return jsonify({'error': "Expected a JSON body with a 'commands' list"}), 400
+    result = city_actuator.apply_batch(data['commands'])
+    if result['status'] != 'success':
+        return jsonify(result), 400
+    return jsonify(result)
+
+@app.route('/api/actuate/events')
+def get_actuation_events():
+    """
+    Returns the newest actuation events, filtered by ``district``, ``command``,
+    ``start`` and ``end`` (ISO timestamps or e.g. -1h relative to now).
+    """
+    try:
+        command = request.args.get('command') or None
+        if command is not None and command not in COMMAND_TYPES:
+            raise QueryError(f"Invalid command '{command}'. Use one of: {COMMAND_TYPES}")
+        now = pd.Timestamp.now()
+        start = parse_time(request.args.get('start'), now)
+        end = parse_time(request.args.get('end'), now)
+        try:
+            limit = int(request.args.get('limit', 100))
+        except ValueError:
+            raise QueryError(f"Invalid limit '{request.args.get('limit')}'")
+        if not 1 <= limit <= MAX_ACTUATION_EVENTS:
+            raise QueryError(f"'limit' must be between 1 and {MAX_ACTUATION_EVENTS}")
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+    events = city_actuator.log.query(
+        target=request.args.get('district') or None,
+        command=command,
+        since=None if start is None else start.to_pydatetime().timestamp(),
+        until=None if end is None else end.to_pydatetime().timestamp(),
+        limit=limit
+    )
+    return jsonify({'events': events, 'count': len(events)})
+
 def generate_current_status(current_data):
     return {
         "overall_status": calculate_overall_status(current_data),
@@ -634,6 +1141,27 @@ def get_traffic_status(congestion):
     else:
         return "Congested"
 
+def warm_up():
+    """
+    Loads the datasets, rollups and forecast model ahead of the first request.
+    gunicorn calls this before a worker accepts connections (see gunicorn.conf.py).
+    """
+    started = time.time()
+    dataset = dataset_cache.get()
+    if dataset is not None:
+        rollup_store.sync(dataset)
+        stats_store.sync(dataset)
+    raw_dataset = raw_dataset_cache.get()
+    if raw_dataset is not None:
+        raw_rollup_store.sync(raw_dataset)
+    region_dataset_cache.get()
+    if dataset is None or raw_dataset is None:
+        # Requests answer 500 until the data can be read; the server still starts
+        logger.error("Warm-up could not load the data")
+    forecaster.load()
+    logger.info(f"Warmed up in {time.time() - started:.2f}s")
+
 if __name__ == '__main__':
+    warm_up()
     port = int(os.environ.get("PORT", 10000))
     app.run(host="0.0.0.0", port=port, debug=False)
@@ -12,6 +12,25 @@ class ApiService {
     }
   }
 
+  // Fetches only readings appended since `cursor` (pass null for the first call).
+  // Returns { cursor, count, has_more, data }; keep `cursor` for the next refresh.
+  async getDelta(cursor, fields) {
+    const params = [];
+    if (cursor) params.push(`cursor=${encodeURIComponent(cursor)}`);
+    if (fields) params.push(`fields=${encodeURIComponent(fields.join(','))}`);
+    const query = params.length ? `?${params.join('&')}` : '';
+    try {
+      const response = await fetch(`${CONFIG.API_BASE_URL}/api/delta${query}`);
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+      return await response.json();
+    } catch (error) {
+      console.error('API Error (delta):', error);
+      throw error;
+    }
+  }
+
   _getMockData(endpoint) {
     switch (endpoint) {
       case 'locations':
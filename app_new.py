@@ -1,10 +1,15 @@
-from flask import Flask, jsonify, render_template
+from flask import Flask, jsonify, render_template, request
 from flask_cors import CORS
 import pandas as pd
 from datetime import datetime, timedelta
 import os
+import json
 import logging
+import time
 import traceback
+from dataset import DatasetCache, read_merged
+from http_cache import conditional
+from timeseries import QueryError, parse_time, range_bounds
 
 app = Flask(__name__, template_folder='templates')
 CORS(app)
@@ -16,6 +21,9 @@ logger = logging.getLogger(__name__)
 # Update the data file path to be relative
 DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Merged_Air_Quality_and_Traffic_Data.csv')
 
+# Readings are read from DATABASE_URL (e.g. sqlite:///smart_city.db) when set, otherwise from DATA_FILE
+DATA_SOURCE = os.environ.get('DATABASE_URL') or DATA_FILE
+
 def get_traffic_status(congestion):
     if congestion < 10:
         return "Low"
@@ -36,67 +44,106 @@ def get_air_quality_level(pm25):
 def index():
     return render_template('index.html')
 
+def load_dashboard_frame(path):
+    """
+    Loads the merged CSV sorted by timestamp for the dashboard.
+    Returns None if it can't be read.
+    """
+    logger.info(f"Attempting to read data from: {path}")
+    df = read_merged(path)
+    if df is None:
+        logger.error(f"Failed to load data from {path}")
+        return None
+    return df.sort_values('timestamp')
+
+# Shared cache of the dashboard data, reloaded only when DATA_SOURCE changes
+dataset_cache = DatasetCache(DATA_SOURCE, loader=load_dashboard_frame)
+
+# Default dashboard date range (Nov 28 to Dec 6, inclusive)
+DASHBOARD_START = pd.Timestamp('2023-11-28')
+DASHBOARD_END = pd.Timestamp('2023-12-06') + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns')
+
+def build_dashboard_response(dataset, start=DASHBOARD_START, end=DASHBOARD_END):
+    """
+    Builds the serialized /api/dashboard body for a date range.
+    """
+    # Binary search on the sorted timestamps instead of a full-column comparison
+    timestamps = dataset.column('timestamp')
+    lo, hi = range_bounds(timestamps, start, end)
+    if lo == hi:
+        raise ValueError("No data available for the dashboard date range")
+    in_range = slice(lo, hi)
+
+    pm25 = dataset.column('pm2_5')[in_range].astype(float)
+    pm10 = dataset.column('pm10')[in_range].astype(float)
+    traffic = dataset.column('duration_in_traffic_min')[in_range].astype(float)
+    pm25_values = pm25.tolist()
+
+    # Format timestamps for display in one vectorized pass
+    labels = pd.DatetimeIndex(timestamps[in_range]).strftime('%b %d').tolist()
+    data_points = [
+        {
+            'timestamp': label,
+            'indoor_pm25': pm25_value,
+            'outdoor_pm25': pm25_value,
+            'pm10': pm10_value,
+            'traffic_density': traffic_value
+        }
+        for label, pm25_value, pm10_value, traffic_value in zip(labels, pm25_values, pm10.tolist(), traffic.tolist())
+    ]
+
+    # Calculate statistics from the latest data point
+    latest_pm25, latest_pm10, latest_traffic = pm25[-1], pm10[-1], traffic[-1]
+    stats = {
+        'indoor_range': f"{latest_pm25:.2f} µg/m³",
+        'outdoor_pm25': f"{latest_pm25:.2f} µg/m³",
+        'traffic_congestion': {
+            'level': get_traffic_status(latest_traffic),
+            'current_density': f"{latest_traffic:.1f}"
+        },
+        'air_quality': {
+            'status': get_air_quality_level(latest_pm25),
+            'pm10_level': f"{latest_pm10:.1f} µg/m³"
+        }
+    }
+
+    return json.dumps({
+        'data_points': data_points,
+        'stats': stats
+    }, separators=(',', ':'))
+
 @app.route('/api/dashboard')
+@conditional(lambda: dataset_cache.file_version())
 def get_dashboard_data():
     try:
-        # Log the current directory and data file path
-        logger.info(f"Current working directory: {os.getcwd()}")
-        logger.info(f"Attempting to read data from: {DATA_FILE}")
-        logger.info(f"Data file exists: {os.path.exists(DATA_FILE)}")
-        
-        # Load the data from CSV
-        df = pd.read_csv(DATA_FILE)
-        
-        # Convert timestamp to datetime
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        
-        # Sort by timestamp
-        df = df.sort_values('timestamp')
-        
-        # Create dates from Nov 28 to Dec 6
-        start_date = pd.Timestamp('2023-11-28')
-        end_date = pd.Timestamp('2023-12-06')
-        
-        # Filter data for the specific date range
-        df = df[(df['timestamp'].dt.date >= start_date.date()) & 
-                (df['timestamp'].dt.date <= end_date.date())]
-        
-        # Format timestamp for display
-        formatted_df = df.copy()
-        formatted_df['timestamp'] = formatted_df['timestamp'].dt.strftime('%b %d')
-        
-        # Create response data
-        data_points = []
-        for _, row in formatted_df.iterrows():
-            data_points.append({
-                'timestamp': row['timestamp'],
-                'indoor_pm25': float(row['pm2_5']),
-                'outdoor_pm25': float(row['pm2_5']),
-                'pm10': float(row['pm10']),
-                'traffic_density': float(row['duration_in_traffic_min'])
-            })
-        
-        # Calculate statistics from the latest data point
-        latest_data = df.iloc[-1]
-        stats = {
-            'indoor_range': f"{float(latest_data['pm2_5']):.2f} µg/m³",
-            'outdoor_pm25': f"{float(latest_data['pm2_5']):.2f} µg/m³",
-            'traffic_congestion': {
-                'level': get_traffic_status(float(latest_data['duration_in_traffic_min'])),
-                'current_density': f"{float(latest_data['duration_in_traffic_min']):.1f}"
-            },
-            'air_quality': {
-                'status': get_air_quality_level(float(latest_data['pm2_5'])),
-                'pm10_level': f"{float(latest_data['pm10']):.1f} µg/m³"
-            }
-        }
-        
-        return jsonify({
-            'data_points': data_points,
-            'stats': stats
-        })
-        
+        dataset = dataset_cache.get()
+        if dataset is None:
+            return jsonify({'error': f"Failed to load data from {DATA_SOURCE}"}), 500
+        if 'start' in request.args or 'end' in request.args:
+            latest = dataset.column('timestamp')[-1] if len(dataset) else None
+            start = parse_time(request.args.get('start'), latest)
+            end = parse_time(request.args.get('end'), latest)
+            body = build_dashboard_response(dataset, start, end)
+        else:
+            # The default range is built once per data version
+            body = dataset.memo('dashboard_response', build_dashboard_response)
+        return app.response_class(body, mimetype='application/json')
+
+    except QueryError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error in dashboard route: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         return jsonify({'error': str(e)}), 500
+
+def warm_up():
+    """
+    Loads the dashboard data ahead of the first request.
+    gunicorn calls this before a worker accepts connections (see gunicorn.conf.py).
+    """
+    started = time.time()
+    if dataset_cache.get() is None:
+        # Requests answer 500 until the data can be read; the server still starts
+        logger.error("Warm-up could not load the dashboard data")
+        return
+    logger.info(f"Warmed up in {time.time() - started:.2f}s")
@@ -0,0 +1,263 @@
+"""
+Benchmarks for data loading, the dashboard helpers and every API route.
+
+    python benchmarks/run_benchmarks.py --rows 1e5 --stations 5
+    python benchmarks/run_benchmarks.py --save-baseline
+    python benchmarks/run_benchmarks.py --check
+
+The data is generated with synthetic.py (or read from --data) and app.py
+serves it through the Flask test client, so no server is started. Each
+benchmark runs --repeat times after an untimed setup step, and the median
+time is reported. Peak memory (Python and NumPy allocations, via
+tracemalloc) is taken from one more run, kept apart so tracing doesn't
+inflate the times.
+
+"cold" runs start from a freshly loaded snapshot with the derived caches
+and rollups empty, as after a deploy; "warm" runs repeat a request that
+was just served. load_data[parse] parses and cleans the CSV, while
+load_data[shared] maps a version another worker already published.
+
+Results are compared with the baseline recorded at the same scale, and
+times more than --tolerance slower are flagged (--check makes that an
+error). Baselines are only comparable on the machine that recorded them.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+
+import synthetic
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Slowdowns smaller than this are within timer noise and never flagged
+NOISE_FLOOR_MS = 1.0
+
+# Routes benchmarked as (method, path, JSON body)
+ROUTES = [
+    ('GET', '/api/dashboard', None),
+    ('GET', '/api/smart-city-data', None),
+    ('GET', '/api/location-data', None),
+    ('GET', '/api/location-data?start=-7d&resolution=1h', None),
+    ('GET', '/api/air-traffic-data', None),
+    ('GET', '/api/air-traffic-data?points=2000', None),
+    ('GET', '/api/delta?limit=10000', None),
+    ('GET', '/api/aggregates', None),
+    ('GET', '/api/aggregates?resolution=1h', None),
+    ('GET', '/api/rolling-correlations', None),
+    ('GET', '/api/profiles', None),
+    ('GET', '/api/anomalies', None),
+    ('GET', '/api/rules/backtest', None),
+    ('GET', '/api/forecast', None),
+    ('GET', '/api/actuate/events', None),
+    ('GET', '/Merged_Air_Quality_and_Traffic_Data.csv', None),
+    ('POST', '/api/actuate/traffic-lights', {'district': 'Station 1', 'action': 'optimize_flow'}),
+    ('POST', '/api/actuate/batch', {'commands': [
+        {'type': 'traffic_signals', 'district': f"Station {i}", 'action': 'optimize_flow'} for i in range(500)
+    ]})
+]
+
+# Rows the benchmark's forecast model is trained on
+FORECAST_TRAINING_ROWS = 5000
+
+Benchmark = namedtuple('Benchmark', ['name', 'run', 'setup'])
+
+
+def load_app(data_path, workdir):
+    """
+    Imports app.py serving ``data_path``, with its shared datasets and forecast
+    model kept in ``workdir`` and background training off.
+    """
+    os.environ['DATA_FILE'] = data_path
+    os.environ['SHARED_DATASET_DIR'] = os.path.join(workdir, 'shared')
+    os.environ['FORECAST_MODEL_PATH'] = os.path.join(workdir, 'forecaster.joblib')
+    os.environ['FORECAST_TRAINING'] = '0'
+    os.environ.pop('DATABASE_URL', None)
+    sys.path.insert(0, PROJECT_DIR)
+    import app
+
+    logging.disable(logging.INFO)
+    return app
+
+
+def train_forecaster(app):
+    """
+    Fits the forecast model on the benchmark data, so /api/forecast has one to serve.
+    """
+    import forecast
+
+    # Serving cost doesn't depend on how much history the model saw; this keeps training short
+    forecast.MAX_TRAINING_ROWS = FORECAST_TRAINING_ROWS
+    started = time.time()
+    bundle = forecast.train(app.dataset_cache.get())
+    if bundle is None:
+        print("Too little data to train a forecaster; /api/forecast will return 503")
+        return
+    forecast.save(bundle, app.forecaster.path)
+    print(f"Trained a forecaster in {time.time() - started:.1f}s")
+
+
+def reset(app):
+    """
+    Replaces every snapshot with a fresh one and empties the derived caches.
+    """
+    from http_cache import clear_cache
+    from online_stats import StatsStore
+    from rollups import RollupStore
+
+    for cache in (app.dataset_cache, app.region_dataset_cache, app.raw_dataset_cache):
+        cache.reload()
+    app.rollup_store = RollupStore(app.SERIES_FIELDS)
+    app.raw_rollup_store = RollupStore(app.SERIES_FIELDS)
+    app.stats_store = StatsStore(app.SERIES_FIELDS)
+    clear_cache()
+
+
+def build_benchmarks(app):
+    shared_dir = app.dataset_cache.shared_dir
+    client = app.app.test_client()
+    state = {}
+
+    def unpublish():
+        shutil.rmtree(shared_dir, ignore_errors=True)
+
+    def load():
+        app.dataset_cache.reload()
+        app.load_data()
+
+    def keep_frame():
+        state['frame'] = app.load_data()
+
+    benchmarks = [
+        Benchmark('load_data[parse]', load, unpublish),
+        Benchmark('load_data[shared]', load, app.dataset_cache.get),
+        Benchmark('generate_hourly_data', app.generate_hourly_data, lambda: reset(app)),
+        Benchmark('generate_insights', lambda: app.generate_insights(state['frame']), keep_frame)
+    ]
+    for method, path, body in ROUTES:
+        def request(method=method, path=path, body=body):
+            response = client.open(path, method=method, json=body)
+            response.get_data()
+            state[path] = response.status_code
+
+        benchmarks.append(Benchmark(f"{method} {path} cold", request, lambda: reset(app)))
+        benchmarks.append(Benchmark(f"{method} {path} warm", request, request))
+    return benchmarks, state
+
+
+def measure(benchmark, repeat):
+    """
+    Returns the median time (ms) and the peak traced memory (MB) of a benchmark.
+    """
+    times = []
+    for _ in range(repeat):
+        benchmark.setup()
+        started = time.perf_counter()
+        benchmark.run()
+        times.append((time.perf_counter() - started) * 1000)
+
+    benchmark.setup()
+    tracemalloc.start()
+    try:
+        benchmark.run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(times), peak / 2**20
+
+
+def read_baseline(path, rows, stations):
+    try:
+        with open(path) as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if baseline.get('rows') != rows or baseline.get('stations') != stations:
+        print(f"Baseline {path} was recorded with {baseline.get('rows')} rows and "
+              f"{baseline.get('stations')} stations; not comparing")
+        return None
+    return baseline['results']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time data loading, dashboard helpers and API routes")
+    parser.add_argument('--rows', type=float, default=1e5, help="rows of synthetic data (e.g. 1e6)")
+    parser.add_argument('--stations', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data', help="benchmark an existing merged CSV instead of synthetic data")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--only', help="run only benchmarks whose name contains this text")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="record these results as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="flag times more than this fraction slower than the baseline")
+    parser.add_argument('--check', action='store_true', help="exit with status 1 if anything is flagged")
+    args = parser.parse_args()
+    rows = int(args.rows)
+
+    workdir = tempfile.mkdtemp(prefix='smart-city-bench-')
+    try:
+        data_path = args.data or os.path.join(workdir, 'Merged_Air_Quality_and_Traffic_Data.csv')
+        if not args.data:
+            started = time.time()
+            written = synthetic.write_csv(data_path, rows, args.stations, seed=args.seed)
+            print(f"Generated {written} rows for {args.stations} stations in {time.time() - started:.1f}s")
+        app = load_app(os.path.abspath(data_path), workdir)
+        if not args.only or any(args.only in f"GET /api/forecast {mode}" for mode in ('cold', 'warm')):
+            train_forecaster(app)
+        benchmarks, statuses = build_benchmarks(app)
+        if args.only:
+            benchmarks = [benchmark for benchmark in benchmarks if args.only in benchmark.name]
+
+        baseline = None if args.save_baseline else read_baseline(args.baseline, rows, args.stations)
+        results = {}
+        flagged = []
+        print(f"{'benchmark':<58} {'time':>10} {'baseline':>10} {'change':>8} {'peak':>9}")
+        for benchmark in benchmarks:
+            elapsed, peak = measure(benchmark, args.repeat)
+            results[benchmark.name] = {'time_ms': round(elapsed, 3), 'peak_mb': round(peak, 2)}
+            line = f"{benchmark.name:<58} {elapsed:>8.1f}ms"
+            previous = (baseline or {}).get(benchmark.name)
+            if previous:
+                change = elapsed / previous['time_ms'] - 1 if previous['time_ms'] else 0.0
+                line += f" {previous['time_ms']:>8.1f}ms {change:>+7.0%}"
+                if change > args.tolerance and elapsed - previous['time_ms'] > NOISE_FLOOR_MS:
+                    flagged.append(benchmark.name)
+                    line += " !"
+            else:
+                line += f" {'':>10} {'':>8}"
+            status = statuses.get(benchmark.name.split(' ')[1]) if ' ' in benchmark.name else None
+            line += f" {peak:>7.1f}MB" + (f"  (HTTP {status})" if status and status >= 400 else '')
+            print(line)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({
+                'rows': rows,
+                'stations': args.stations,
+                'repeat': args.repeat,
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'recorded': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'results': results
+            }, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    if flagged:
+        print(f"{len(flagged)} benchmark(s) more than {args.tolerance:.0%} slower than the baseline: {flagged}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
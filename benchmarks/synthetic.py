@@ -0,0 +1,192 @@
+"""
+Synthetic merged air quality and traffic data at city scale.
+
+Writes a CSV with the schema of Merged_Air_Quality_and_Traffic_Data.csv
+(plus a ``location`` column when there is more than one station):
+
+    python benchmarks/synthetic.py synthetic.csv --rows 1000000 --stations 20
+
+Each station reports about every 10 minutes, a few minutes offset from the
+others. Traffic has morning and evening peaks that are weaker at weekends;
+PM2.5 and PM10 follow a night-time inversion plus a traffic contribution,
+NO2 follows traffic and O3 peaks in the afternoon. Every series gets AR(1)
+noise, so consecutive readings are correlated like real ones. Like the
+logged data, the output has outages (runs of missing readings per station),
+missing pm2_5/no2 values, exact duplicate rows and a few AQI outliers.
+
+Rows are generated and written in chunks, so 10^7 rows need no more memory
+than 10^6.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+TIMESTAMP_FORMAT = '%m/%d/%Y %H:%M'
+COLUMNS = ['timestamp', 'pm2_5', 'pm10', 'no2', 'o3', 'aqi', 'distance_km', 'duration_min',
+           'duration_in_traffic_min']
+
+START = '2023-11-26 21:30'
+INTERVAL = pd.Timedelta(minutes=10)
+
+# Chance per station and interval that an outage starts, and its mean length in intervals
+GAP_RATE = 0.002
+GAP_LENGTH = 6
+# Share of pm2_5 and no2 readings that are missing
+MISSING_RATE = 0.018
+# Share of rows written twice
+DUPLICATE_RATE = 0.003
+# Share of AQI values replaced by an out-of-scale reading
+OUTLIER_RATE = 0.001
+OUTLIER_VALUES = [50.0, 120.0, 400.0]
+
+# Correlation between consecutive noise terms
+AR_COEFFICIENT = 0.9
+# Intervals generated per chunk (times the number of stations)
+CHUNK_STEPS = 100000
+
+
+def _peak(hours, center, width):
+    # Circular distance, so peaks near midnight wrap around
+    distance = (hours - center + 12) % 24 - 12
+    return np.exp(-(distance / width) ** 2)
+
+
+def _station_profiles(stations, rng):
+    return {
+        'name': [f"Station {i + 1}" for i in range(stations)],
+        'offset': rng.integers(0, 10, stations),
+        'distance': np.round(rng.uniform(2.0, 12.0, stations), 1),
+        'pm_base': rng.uniform(120.0, 220.0, stations),
+        'traffic_weight': rng.uniform(0.5, 1.5, stations)
+    }
+
+
+def _ar_noise(shape, state, rng):
+    """
+    AR(1) noise with unit variance, continuing from ``state`` (one value per column).
+    """
+    from scipy.signal import lfilter
+
+    innovations = rng.standard_normal(shape) * np.sqrt(1 - AR_COEFFICIENT ** 2)
+    noise = lfilter([1.0], [1.0, -AR_COEFFICIENT], innovations, axis=0, zi=AR_COEFFICIENT * state[None, :])[0]
+    return noise, noise[-1]
+
+
+def _gaps(steps, stations, rng):
+    """
+    Returns a steps x stations mask of readings lost to outages.
+    """
+    starts = np.argwhere(rng.random((steps, stations)) < GAP_RATE)
+    change = np.zeros((steps + 1, stations), dtype=np.int64)
+    if len(starts):
+        ends = np.minimum(starts[:, 0] + rng.geometric(1.0 / GAP_LENGTH, len(starts)), steps)
+        np.add.at(change, (starts[:, 0], starts[:, 1]), 1)
+        np.add.at(change, (ends, starts[:, 1]), -1)
+    return np.cumsum(change, axis=0)[:steps] > 0
+
+
+def generate(rows, stations=1, start=START, seed=0, chunk_steps=CHUNK_STEPS):
+    """
+    Yields DataFrames of about ``rows`` readings in total, sorted by timestamp,
+    with parsed timestamps and a ``location`` column.
+    """
+    rng = np.random.default_rng(seed)
+    profiles = _station_profiles(stations, rng)
+    steps = max(1, -(-rows // stations))
+    start = pd.Timestamp(start)
+    noise_state = {name: np.zeros(stations) for name in ('traffic', 'pm', 'no2', 'o3')}
+
+    for first in range(0, steps, chunk_steps):
+        count = min(chunk_steps, steps - first)
+        step_times = pd.date_range(start + INTERVAL * first, periods=count, freq=INTERVAL)
+        # Station offsets plus up to a minute of jitter, like the logger's readings
+        offsets = profiles['offset'][None, :] + rng.integers(0, 2, (count, stations))
+        times = step_times.to_numpy()[:, None] + offsets.astype('timedelta64[m]')
+
+        hours = np.asarray(step_times.hour + step_times.minute / 60)[:, None]
+        weekend = np.asarray(step_times.weekday >= 5)[:, None]
+
+        noise = {}
+        for name in noise_state:
+            noise[name], noise_state[name] = _ar_noise((count, stations), noise_state[name], rng)
+
+        rush = 0.6 * _peak(hours, 9.5, 1.5) + 0.7 * _peak(hours, 18.5, 1.8)
+        congestion = 1.0 + np.where(weekend, 0.5, 1.0) * rush * profiles['traffic_weight'] + 0.08 * noise['traffic']
+        congestion = np.maximum(congestion, 0.9)
+        duration = np.round(profiles['distance'] * 2.9, 0) * np.ones((count, 1))
+        duration_in_traffic = duration * congestion
+
+        inversion = 0.35 * _peak(hours, 3.0, 4.0)
+        pm2_5 = np.maximum(profiles['pm_base'] * (1 + inversion) + 40 * (congestion - 1) + 20 * noise['pm'], 5.0)
+        pm10 = pm2_5 * 1.45 + 12 * rng.standard_normal((count, stations))
+        no2 = np.maximum(40 + 30 * (congestion - 1) + 6 * noise['no2'], 1.0)
+        o3 = np.maximum(22 + 12 * _peak(hours, 15.0, 4.0) - 0.15 * (no2 - 50) + 3 * noise['o3'], 1.0)
+        # OpenWeather's 1-5 index, with the occasional out-of-scale reading seen in the logs
+        aqi = (np.digitize(pm2_5, [50.0, 100.0, 150.0, 200.0]) + 1).astype(float)
+        outliers = rng.random((count, stations)) < OUTLIER_RATE
+        aqi[outliers] = rng.choice(OUTLIER_VALUES, int(outliers.sum()))
+
+        pm2_5[rng.random((count, stations)) < MISSING_RATE] = np.nan
+        no2[rng.random((count, stations)) < MISSING_RATE] = np.nan
+
+        keep = ~_gaps(count, stations, rng)
+        # Rows are laid out time-major, so they come out sorted by interval
+        copies = np.where(rng.random((count, stations)) < DUPLICATE_RATE, 2, 1)[keep]
+        df = pd.DataFrame({
+            'timestamp': times[keep],
+            'pm2_5': pm2_5[keep],
+            'pm10': pm10[keep],
+            'no2': no2[keep],
+            'o3': o3[keep],
+            'aqi': aqi[keep],
+            'distance_km': np.broadcast_to(profiles['distance'], (count, stations))[keep],
+            'duration_min': duration[keep],
+            'duration_in_traffic_min': duration_in_traffic[keep],
+            'location': np.broadcast_to(np.array(profiles['name'], dtype=object), (count, stations))[keep]
+        })
+        df = df.iloc[np.repeat(np.arange(len(df)), copies)]
+        yield df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+
+
+def write_csv(path, rows, stations=1, start=START, seed=0):
+    """
+    Writes the generated readings to ``path`` in the merged CSV format and
+    returns the number of rows written.
+    """
+    written = 0
+    columns = COLUMNS + (['location'] if stations > 1 else [])
+    with open(path, 'w', newline='') as f:
+        for chunk in generate(rows, stations, start, seed):
+            minutes = chunk['timestamp'].to_numpy().astype('datetime64[m]')
+            # Only the distinct minutes are formatted, which is much faster than formatting every row
+            unique, inverse = np.unique(minutes, return_inverse=True)
+            chunk['timestamp'] = pd.DatetimeIndex(unique).strftime(TIMESTAMP_FORMAT).to_numpy()[inverse]
+            chunk.index = pd.RangeIndex(written, written + len(chunk))
+            chunk[columns].to_csv(f, header=written == 0, float_format='%.6g')
+            written += len(chunk)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic merged air quality and traffic data")
+    parser.add_argument('output', help="CSV file to write")
+    parser.add_argument('--rows', type=float, default=1e5, help="approximate number of rows (e.g. 1e6)")
+    parser.add_argument('--stations', type=int, default=1)
+    parser.add_argument('--start', default=START, help="timestamp of the first reading")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    if args.rows < 1 or args.stations < 1:
+        parser.error("--rows and --stations must be positive")
+
+    started = time.time()
+    written = write_csv(args.output, int(args.rows), args.stations, args.start, args.seed)
+    size = os.path.getsize(args.output) / 2**20
+    print(f"Wrote {written} rows ({size:.1f} MB) to {args.output} in {time.time() - started:.1f}s", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+Columnar on-disk format for the merged air quality and traffic dataset.
+
+A bundle is a directory next to the CSV (``<name>.columns/``) holding one
+``.npy`` file per column plus a ``manifest.json`` describing dtypes, row
+count and the CSV it was converted from. Timestamps are stored as
+datetime64[ns], so loading a bundle needs no date parsing, and every column
+can be memory-mapped.
+
+Usage:
+    python columnar.py convert Merged_Air_Quality_and_Traffic_Data.csv
+    python columnar.py sync Merged_Air_Quality_and_Traffic_Data.csv --interval 60
+"""
+import argparse
+import json
+import logging
+import os
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+FORMAT_VERSION = 1
+TIMESTAMP_FORMAT = '%m/%d/%Y %H:%M'
+
+# Text columns kept in the bundle
+STRING_COLUMNS = ['location']
+
+
+def bundle_dir(csv_path):
+    """
+    Returns the bundle directory used for a CSV file.
+    """
+    root, _ = os.path.splitext(csv_path)
+    return root + '.columns'
+
+
+def manifest_path(csv_path):
+    return os.path.join(bundle_dir(csv_path), MANIFEST_NAME)
+
+
+def _source_signature(csv_path):
+    try:
+        st = os.stat(csv_path)
+    except OSError:
+        return None
+    return {'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+
+
+def read_manifest(csv_path):
+    try:
+        with open(manifest_path(csv_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_fresh(csv_path, manifest=None):
+    """
+    A bundle is fresh when it was converted from the CSV as it is now,
+    or when the CSV no longer exists and the bundle is the only copy.
+    """
+    manifest = manifest if manifest is not None else read_manifest(csv_path)
+    if manifest is None or manifest.get('format_version') != FORMAT_VERSION:
+        return False
+    source = _source_signature(csv_path)
+    return source is None or source == manifest.get('source')
+
+
+def convert(csv_path):
+    """
+    Converts a merged CSV into a columnar bundle and returns the manifest.
+    Non-numeric columns other than the timestamp and STRING_COLUMNS are not stored.
+    """
+    source = _source_signature(csv_path)
+    df = pd.read_csv(csv_path, index_col=0)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format=TIMESTAMP_FORMAT, errors='coerce')
+
+    directory = bundle_dir(csv_path)
+    os.makedirs(directory, exist_ok=True)
+
+    # Column files get a unique token so readers of the previous manifest are never
+    # handed a half-written file; the manifest itself is swapped in atomically.
+    token = uuid.uuid4().hex[:12]
+    columns = {}
+    skipped = []
+    for name in df.columns:
+        series = df[name]
+        if name == 'timestamp':
+            values = series.to_numpy(dtype='datetime64[ns]')
+        elif pd.api.types.is_numeric_dtype(series):
+            values = series.to_numpy()
+        elif name in STRING_COLUMNS:
+            # Fixed-width unicode, so the column can still be memory-mapped without pickling
+            values = series.fillna('').astype(str).to_numpy().astype(str)
+        else:
+            skipped.append(name)
+            continue
+        filename = f"{name}.{token}.npy"
+        np.save(os.path.join(directory, filename), np.ascontiguousarray(values), allow_pickle=False)
+        columns[name] = {'file': filename, 'dtype': values.dtype.str}
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'rows': len(df),
+        'columns': columns,
+        'skipped_columns': skipped,
+        'source': source,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    tmp_path = os.path.join(directory, f".{MANIFEST_NAME}.{token}")
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(directory, MANIFEST_NAME))
+
+    # Remove column files from earlier conversions
+    current = {col['file'] for col in columns.values()}
+    for filename in os.listdir(directory):
+        if filename.endswith('.npy') and filename not in current:
+            try:
+                os.remove(os.path.join(directory, filename))
+            except OSError:
+                pass
+
+    logger.info(f"Converted {csv_path} to {directory} ({len(df)} rows, {len(columns)} columns)")
+    return manifest
+
+
+def sync(csv_path):
+    """
+    Converts the CSV only if its bundle is missing or stale.
+    Returns True if a conversion happened.
+    """
+    if is_fresh(csv_path) or not os.path.exists(csv_path):
+        return False
+    convert(csv_path)
+    return True
+
+
+def load_columns(csv_path, mmap_mode='r'):
+    """
+    Loads the bundle for a CSV as a dict of NumPy arrays.
+    Returns None if there is no fresh bundle, so callers can fall back to the CSV.
+    """
+    manifest = read_manifest(csv_path)
+    if not is_fresh(csv_path, manifest):
+        return None
+    directory = bundle_dir(csv_path)
+    try:
+        return {
+            name: np.load(os.path.join(directory, col['file']), mmap_mode=mmap_mode, allow_pickle=False)
+            for name, col in manifest['columns'].items()
+        }
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to load columnar bundle {directory}: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert merged CSV data to the columnar format")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help="convert CSV files unconditionally")
+    convert_parser.add_argument('csv', nargs='+')
+
+    sync_parser = subparsers.add_parser('sync', help="convert CSV files whose bundle is missing or stale")
+    sync_parser.add_argument('csv', nargs='+')
+    sync_parser.add_argument('--interval', type=float, default=0,
+                             help="keep checking every INTERVAL seconds instead of exiting")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == 'convert':
+        for csv_path in args.csv:
+            convert(csv_path)
+        return
+
+    while True:
+        for csv_path in args.csv:
+            try:
+                if not sync(csv_path):
+                    logger.debug(f"{csv_path} is up to date")
+            except Exception as e:
+                logger.error(f"Failed to sync {csv_path}: {e}")
+        if args.interval <= 0:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""
+Optional SQLite storage backend for readings.
+
+Readings live in one table keyed by (location_id, timestamp), stored
+without a rowid so rows are clustered by that key, plus an index on
+timestamp for cross-location range scans. Timestamps are stored as epoch
+seconds. Databases are opened in WAL mode, so the ingest process can write
+while every gunicorn worker reads; each process keeps one pooled engine per
+URL that all Flask requests share (forked workers reset theirs with
+dispose_engines()).
+
+The backend is enabled by pointing the data source at a database URL, e.g.
+``DATABASE_URL=sqlite:///smart_city.db``. read_merged() and DatasetCache
+accept such URLs in place of the CSV path.
+"""
+import argparse
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+READING_FIELDS = [
+    'pm2_5', 'pm10', 'no2', 'o3', 'aqi', 'distance_km', 'duration_min', 'duration_in_traffic_min'
+]
+
+# Location of readings recorded before sites were tracked (the logger's original Delhi station)
+DEFAULT_LOCATION = 'Delhi'
+
+# Milliseconds a connection waits for a competing writer before failing
+BUSY_TIMEOUT = 5000
+
+POOL_SIZE = 5
+
+# SQLAlchemy and the tables below are set up by _define_schema() on first use,
+# so processes that read the CSV never pay for importing it
+sa = None
+metadata = locations = readings = None
+
+
+def _define_schema():
+    global sa, metadata, locations, readings
+    if sa is not None:
+        return
+    # Called with _engines_lock held
+    try:
+        import sqlalchemy as sa
+        import sqlalchemy.pool
+    except ImportError:  # Optional dependency
+        raise RuntimeError("The database backend requires SQLAlchemy (pip install sqlalchemy)")
+    metadata = sa.MetaData()
+
+    locations = sa.Table(
+        'locations', metadata,
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('name', sa.String, nullable=False, unique=True),
+        sa.Column('latitude', sa.Float),
+        sa.Column('longitude', sa.Float)
+    )
+
+    readings = sa.Table(
+        'readings', metadata,
+        sa.Column('location_id', sa.Integer, sa.ForeignKey('locations.id'), primary_key=True),
+        sa.Column('timestamp', sa.Integer, primary_key=True),
+        *(sa.Column(field, sa.Float) for field in READING_FIELDS),
+        sa.Index('ix_readings_timestamp', 'timestamp'),
+        sqlite_with_rowid=False
+    )
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def is_database_url(source):
+    return isinstance(source, str) and '://' in source
+
+
+def database_path(url):
+    """
+    Returns the file behind a sqlite:/// URL, or None for other databases.
+    """
+    prefix = 'sqlite:///'
+    if url.startswith(prefix) and url != prefix and ':memory:' not in url:
+        return url[len(prefix):]
+    return None
+
+
+def watch_paths(url):
+    """
+    Files whose mtime and size change whenever the database is written.
+    """
+    path = database_path(url)
+    if path is None:
+        return []
+    return [path, path + '-wal']
+
+
+def _configure_sqlite(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT}')
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+
+def get_engine(url):
+    """
+    Returns the process-wide engine for a URL, creating its schema on first use.
+    """
+    with _engines_lock:
+        _define_schema()
+        engine = _engines.get(url)
+        if engine is None:
+            if url.startswith('sqlite'):
+                engine = sa.create_engine(
+                    url,
+                    poolclass=sa.pool.QueuePool,
+                    pool_size=POOL_SIZE,
+                    connect_args={'check_same_thread': False, 'timeout': BUSY_TIMEOUT / 1000}
+                )
+                sa.event.listen(engine, 'connect', _configure_sqlite)
+            else:
+                engine = sa.create_engine(url, pool_size=POOL_SIZE, pool_pre_ping=True)
+            metadata.create_all(engine)
+            _engines[url] = engine
+        return engine
+
+
+def dispose_engines():
+    """
+    Drops the pooled connections of every engine, for a process just forked
+    from one that had them open (gunicorn's preloading master). The parent's
+    connections are left open for the parent; the child opens its own.
+    """
+    with _engines_lock:
+        for engine in _engines.values():
+            try:
+                engine.dispose(close=False)
+            except TypeError:  # SQLAlchemy < 1.4.33
+                engine.dispose()
+
+
+def _to_epoch(value):
+    return int(pd.Timestamp(value).value // 10**9)
+
+
+class ReadingStore:
+    """
+    Reads and writes readings in the database at ``url``.
+    """
+    def __init__(self, url):
+        self.url = url
+        self.engine = get_engine(url)
+        self._location_ids = {}
+
+    def location_id(self, conn, name, latitude=None, longitude=None):
+        if name in self._location_ids:
+            return self._location_ids[name]
+        row = conn.execute(sa.select(locations.c.id).where(locations.c.name == name)).first()
+        if row is None:
+            result = conn.execute(locations.insert().values(name=name, latitude=latitude, longitude=longitude))
+            location_id = result.inserted_primary_key[0]
+        else:
+            location_id = row[0]
+        return location_id
+
+    def insert_frame(self, df, location=DEFAULT_LOCATION):
+        """
+        Bulk-inserts a frame with a timestamp column and reading columns in one
+        transaction (one executemany). Rows for an existing (location, timestamp)
+        replace it. A ``location`` column in the frame overrides ``location``.
+        Returns the number of rows written.
+        """
+        if df.empty:
+            return 0
+        df = df.dropna(subset=['timestamp'])
+        # Rows without a location of their own belong to ``location``, not to one named 'nan'
+        names = df['location'].fillna(location).astype(str) if 'location' in df else pd.Series(location, index=df.index)
+        values = pd.DataFrame({
+            'timestamp': df['timestamp'].to_numpy().astype('datetime64[s]').astype(np.int64),
+            **{field: df[field].astype(float) if field in df else np.nan for field in READING_FIELDS}
+        }, index=df.index)
+        statement = readings.insert().prefix_with('OR REPLACE', dialect='sqlite')
+        with self.engine.begin() as conn:
+            ids = {name: self.location_id(conn, name) for name in names.unique()}
+            values.insert(0, 'location_id', names.map(ids))
+            # NULL instead of NaN, as Python scalars for the DB-API driver
+            rows = values.astype(object).where(values.notna(), None).to_dict('records')
+            conn.execute(statement, rows)
+        # Only cached once committed, so a rolled-back insert can't leave a stale id
+        self._location_ids.update(ids)
+        return len(rows)
+
+    def query(self, start=None, end=None, location=None, fields=None):
+        """
+        Returns readings with start <= timestamp <= end (either bound may be
+        None) as a DataFrame sorted by timestamp. The range and location filters
+        run in SQL against the primary key or the timestamp index.
+        """
+        fields = READING_FIELDS if fields is None else list(fields)
+        statement = sa.select(
+            readings.c.timestamp, locations.c.name.label('location'), *(readings.c[field] for field in fields)
+        ).select_from(readings.join(locations))
+        if start is not None:
+            statement = statement.where(readings.c.timestamp >= _to_epoch(start))
+        if end is not None:
+            statement = statement.where(readings.c.timestamp <= _to_epoch(end))
+        if location is not None:
+            statement = statement.where(locations.c.name == location)
+        statement = statement.order_by(readings.c.timestamp, readings.c.location_id)
+
+        with self.engine.connect() as conn:
+            rows = conn.execute(statement).fetchall()
+        columns = ['timestamp', 'location'] + fields
+        df = pd.DataFrame.from_records(rows, columns=columns)
+        df['timestamp'] = pd.to_datetime(df['timestamp'].astype(np.int64), unit='s')
+        return df.astype({field: float for field in fields})
+
+    def summary(self, fields=()):
+        """
+        Returns the latest timestamp (None if there are no readings) and the
+        mean of each of ``fields`` over every reading. MAX(timestamp) is read
+        from the timestamp index; the means take one scan in SQL.
+        """
+        statement = sa.select(
+            sa.func.max(readings.c.timestamp), *(sa.func.avg(readings.c[field]) for field in fields)
+        )
+        with self.engine.connect() as conn:
+            latest, *means = conn.execute(statement).first()
+        latest = None if latest is None else pd.Timestamp(latest, unit='s')
+        return latest, {field: np.nan if mean is None else float(mean) for field, mean in zip(fields, means)}
+
+
+def read_frame(url):
+    """
+    Reads every reading from a database, shaped like read_merged_csv() output.
+    Returns None if the database holds no readings.
+    """
+    df = ReadingStore(url).query()
+    if df.empty:
+        logger.error(f"No readings in database {url}")
+        return None
+    return df
+
+
+def import_csv(url, csv_path, location=DEFAULT_LOCATION):
+    """
+    Loads a merged CSV into the database (e.g. to seed it from existing history).
+    """
+    from dataset import read_merged_csv
+
+    df = read_merged_csv(csv_path)
+    if df is None:
+        raise ValueError(f"Failed to read {csv_path}")
+    count = ReadingStore(url).insert_frame(df, location)
+    logger.info(f"Imported {count} readings from {csv_path} into {url}")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import merged CSV data into the readings database")
+    parser.add_argument('url', help="database URL, e.g. sqlite:///smart_city.db")
+    parser.add_argument('csv', nargs='+')
+    parser.add_argument('--location', default=DEFAULT_LOCATION)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    for csv_path in args.csv:
+        import_csv(args.url, csv_path, args.location)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""
+Concurrent collector for air quality and traffic readings.
+
+Every polling round fetches all configured locations from OpenWeather and
+all origin/destination pairs from the Google Directions API at once. Each
+provider gets one pooled keep-alive session with its own concurrency limit
+and request timeout, and requests within a round are started at jittered
+offsets so a large site list doesn't hit a provider in a single burst.
+Timeouts, dropped connections and 429/5xx answers are retried a few times
+with exponential backoff before the reading is given up for the round.
+
+Base URLs are configurable, so the collector can be run against the stub
+server in stub_providers.py instead of the real APIs.
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import namedtuple
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+OPENWEATHER_URL = "http://api.openweathermap.org/data/2.5/air_pollution"
+DIRECTIONS_URL = "https://maps.googleapis.com/maps/api/directions/json"
+
+# Seconds between polling rounds
+INTERVAL = 600
+
+# Fraction of the interval over which the requests of a round are randomly spread
+JITTER = 0.1
+
+# Retries of a failed request, and the delay before the first one (doubled for each further retry)
+RETRIES = 2
+BACKOFF = 0.5
+
+# Answers worth retrying; other errors (bad key, bad request) would fail again
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+Location = namedtuple('Location', ['name', 'lat', 'lon'])
+# ``location`` names the Location a route's traffic belongs to, if any
+Route = namedtuple('Route', ['name', 'origin', 'destination', 'location'], defaults=[None])
+
+
+class Provider:
+    """
+    One upstream API: a pooled session, a concurrency limit, a timeout and
+    a retry policy. The session is opened by the collector's running loop.
+    """
+    def __init__(self, name, url, key, concurrency=5, timeout=10.0, retries=RETRIES, backoff=BACKOFF):
+        self.name = name
+        self.url = url
+        self.key = key
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = None
+        self._semaphore = None
+
+    async def open(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=INTERVAL)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            raise_for_status=True
+        )
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _get_json(self, params):
+        async with self._semaphore:
+            async with self.session.get(self.url, params=params) as response:
+                return await response.json(content_type=None)
+
+    async def get_json(self, params):
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._get_json(params)
+            except aiohttp.ClientResponseError as e:
+                if e.status not in RETRY_STATUSES or attempt == self.retries:
+                    raise
+                reason = e.status
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt == self.retries:
+                    raise
+                reason = repr(e)
+            delay = self.backoff * 2 ** attempt
+            logger.warning(f"{self.name} request failed ({reason}); retrying in {delay:g}s")
+            # The semaphore is released while waiting, so other requests can use the slot
+            await asyncio.sleep(delay)
+
+
+def parse_air_quality(data, location):
+    entry = data["list"][0]
+    return {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(entry["dt"])),
+        "pm2_5": entry["components"]["pm2_5"],
+        "pm10": entry["components"]["pm10"],
+        "no2": entry["components"]["no2"],
+        "o3": entry["components"]["o3"],
+        "aqi": entry["main"]["aqi"],
+        "location": location.name,
+        "latitude": location.lat,
+        "longitude": location.lon
+    }
+
+
+def parse_directions(data, route):
+    if data.get("status", "OK") != "OK":
+        raise ValueError(f"Directions status {data.get('status')}: {data.get('error_message', '')}")
+    leg = data["routes"][0]["legs"][0]
+    return {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+        "distance": leg["distance"]["text"],
+        "duration": leg["duration"]["text"],
+        "duration_in_traffic": leg.get("duration_in_traffic", {}).get("text", "N/A"),
+        "start_address": leg["start_address"],
+        "end_address": leg["end_address"],
+        "route": route.name,
+        "location": route.location,
+        "distance_m": leg["distance"]["value"],
+        "duration_s": leg["duration"]["value"],
+        "duration_in_traffic_s": leg.get("duration_in_traffic", {}).get("value")
+    }
+
+
+class Collector:
+    """
+    Polls every location and route concurrently on a jittered schedule.
+    ``on_air_quality`` and ``on_traffic`` receive the list of rows collected
+    in each round.
+    """
+    def __init__(self, locations, routes, openweather, directions,
+                 on_air_quality=None, on_traffic=None, interval=INTERVAL, jitter=JITTER):
+        self.locations = list(locations)
+        self.routes = list(routes)
+        self.openweather = openweather
+        self.directions = directions
+        self.on_air_quality = on_air_quality
+        self.on_traffic = on_traffic
+        self.interval = interval
+        self.jitter = jitter
+
+    async def _delay(self):
+        spread = self.interval * self.jitter
+        if spread > 0:
+            await asyncio.sleep(random.uniform(0, spread))
+
+    async def fetch_air_quality(self, location):
+        await self._delay()
+        try:
+            data = await self.openweather.get_json({
+                "lat": location.lat,
+                "lon": location.lon,
+                "appid": self.openweather.key
+            })
+            return parse_air_quality(data, location)
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, IndexError, ValueError) as e:
+            logger.error(f"Error fetching air quality data for {location.name}: {e!r}")
+            return None
+
+    async def fetch_traffic(self, route):
+        await self._delay()
+        try:
+            data = await self.directions.get_json({
+                "origin": route.origin,
+                "destination": route.destination,
+                "mode": "driving",
+                "departure_time": "now",
+                "traffic_model": "best_guess",
+                "key": self.directions.key
+            })
+            return parse_directions(data, route)
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, IndexError, ValueError) as e:
+            logger.error(f"Error fetching traffic data for {route.name}: {e!r}")
+            return None
+
+    async def collect_once(self):
+        """
+        Runs one polling round and returns (air_quality_rows, traffic_rows).
+        Failed requests are logged and left out.
+        """
+        results = await asyncio.gather(
+            *(self.fetch_air_quality(location) for location in self.locations),
+            *(self.fetch_traffic(route) for route in self.routes)
+        )
+        split = len(self.locations)
+        air_quality = [row for row in results[:split] if row is not None]
+        traffic = [row for row in results[split:] if row is not None]
+        return air_quality, traffic
+
+    def _deliver(self, air_quality, traffic):
+        if air_quality and self.on_air_quality is not None:
+            self.on_air_quality(air_quality)
+        if traffic and self.on_traffic is not None:
+            self.on_traffic(traffic)
+
+    async def run(self, runtime=None, rounds=None):
+        """
+        Polls until ``runtime`` seconds have passed or ``rounds`` rounds have run.
+        Rounds are scheduled on a fixed grid, so slow rounds don't cause drift.
+        """
+        await self.openweather.open()
+        await self.directions.open()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        completed = 0
+        try:
+            while True:
+                air_quality, traffic = await self.collect_once()
+                logger.info(
+                    f"Collected {len(air_quality)}/{len(self.locations)} air quality and "
+                    f"{len(traffic)}/{len(self.routes)} traffic readings"
+                )
+                self._deliver(air_quality, traffic)
+                completed += 1
+                if rounds is not None and completed >= rounds:
+                    break
+                next_round = started + completed * self.interval
+                if runtime is not None and next_round - started >= runtime:
+                    break
+                await asyncio.sleep(max(0.0, next_round - loop.time()))
+        finally:
+            await self.openweather.close()
+            await self.directions.close()
@@ -0,0 +1,96 @@
+"""
+Local stand-in for the OpenWeather air pollution and Google Directions APIs.
+
+    python stub_providers.py --port 8765 --delay 0.2 --fail-rate 0.05
+
+then point the collector at it:
+
+    python data_loggernew.py --openweather-url http://127.0.0.1:8765/data/2.5/air_pollution \\
+        --directions-url http://127.0.0.1:8765/maps/api/directions/json --interval 5
+
+``--failures N`` answers the first N requests to each API with 503, to see
+the collector retry. GET /stats reports how many requests and TCP
+connections the stub has served, which shows whether the collector is
+reusing connections.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from aiohttp import web
+
+
+def make_app(delay=0.0, fail_rate=0.0, failures=0):
+    stats = {'requests': 0, 'connections': set(), 'in_flight': 0, 'max_in_flight': 0}
+    remaining_failures = {}
+
+    async def respond(request, payload):
+        stats['requests'] += 1
+        remaining = remaining_failures.get(request.path, failures)
+        remaining_failures[request.path] = remaining - 1
+        stats['connections'].add(request.transport.get_extra_info('peername'))
+        stats['in_flight'] += 1
+        stats['max_in_flight'] = max(stats['max_in_flight'], stats['in_flight'])
+        try:
+            if delay:
+                await asyncio.sleep(random.uniform(0, 2 * delay))
+            if remaining > 0 or random.random() < fail_rate:
+                raise web.HTTPServiceUnavailable()
+            return web.json_response(payload)
+        finally:
+            stats['in_flight'] -= 1
+
+    async def air_pollution(request):
+        return await respond(request, {
+            "coord": {"lat": float(request.query['lat']), "lon": float(request.query['lon'])},
+            "list": [{
+                "dt": int(time.time()),
+                "main": {"aqi": random.randint(1, 5)},
+                "components": {
+                    "pm2_5": round(random.uniform(10, 300), 2),
+                    "pm10": round(random.uniform(20, 400), 2),
+                    "no2": round(random.uniform(5, 80), 2),
+                    "o3": round(random.uniform(10, 120), 2)
+                }
+            }]
+        })
+
+    async def directions(request):
+        meters = random.randint(2000, 20000)
+        seconds = meters // 10
+        in_traffic = int(seconds * random.uniform(1.0, 2.5))
+        return await respond(request, {
+            "status": "OK",
+            "routes": [{"legs": [{
+                "distance": {"text": f"{meters / 1000:.1f} km", "value": meters},
+                "duration": {"text": f"{seconds // 60} mins", "value": seconds},
+                "duration_in_traffic": {"text": f"{in_traffic // 60} mins", "value": in_traffic},
+                "start_address": request.query['origin'],
+                "end_address": request.query['destination']
+            }]}]
+        })
+
+    async def show_stats(request):
+        return web.json_response({
+            'requests': stats['requests'],
+            'connections': len(stats['connections']),
+            'max_in_flight': stats['max_in_flight']
+        })
+
+    app = web.Application()
+    app.router.add_get('/data/2.5/air_pollution', air_pollution)
+    app.router.add_get('/maps/api/directions/json', directions)
+    app.router.add_get('/stats', show_stats)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.0, help='mean response delay in seconds')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--failures', type=int, default=0, help='answer the first N requests to each API with 503')
+    args = parser.parse_args()
+    web.run_app(make_app(args.delay, args.fail_rate, args.failures), host=args.host, port=args.port)
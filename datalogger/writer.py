@@ -0,0 +1,219 @@
+"""
+Buffered, batched output for collected readings.
+
+A BatchWriter keeps rows in memory and writes them in one go once
+``batch_size`` rows are pending or ``flush_interval`` seconds have passed
+since the last flush. Output files are kept open between flushes and, with
+daily rotation, named after the UTC date of each row's timestamp
+(``air_quality_2024-12-06.csv``).
+
+Durability is chosen with ``fsync``:
+
+    'never'  leave writeback to the OS (fastest)
+    'flush'  fsync after every batch
+    'close'  fsync only when a file is rotated out or the writer closes
+
+Besides CSV, rows can be written as fixed-width binary records described by
+a NumPy dtype (``fmt='binary'``). Each ``.bin`` file gets a ``.json`` sidecar
+with the dtype so read_records() can load it with np.fromfile.
+"""
+import csv
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FSYNC_POLICIES = ('never', 'flush', 'close')
+FORMATS = ('csv', 'binary')
+
+
+def _existing_header(path):
+    if not os.path.isfile(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, newline='') as f:
+        return next(csv.reader(f), None)
+
+
+def _to_value(value, kind):
+    if kind == 'M':
+        return np.datetime64(str(value).replace(' ', 'T'))
+    if kind == 'S':
+        return b'' if value is None else str(value).encode('utf-8')
+    if value is None or value == '':
+        return np.nan if kind == 'f' else 0
+    return value
+
+
+def to_records(rows, dtype):
+    """
+    Converts a list of row dicts into a structured array of ``dtype``.
+    Missing floats become NaN; strings are UTF-8 encoded and truncated to the field width.
+    """
+    records = np.zeros(len(rows), dtype=dtype)
+    for name in dtype.names:
+        kind = dtype[name].kind
+        records[name] = [_to_value(row.get(name), kind) for row in rows]
+    return records
+
+
+def read_records(path):
+    """
+    Loads a binary file written by BatchWriter as a structured array.
+    """
+    with open(path + '.json') as f:
+        descr = json.load(f)['dtype']
+    return np.fromfile(path, dtype=np.dtype([tuple(field) for field in descr]))
+
+
+class _CsvFile:
+    def __init__(self, path, fieldnames):
+        # A file started with an older set of columns keeps its header
+        header = _existing_header(path)
+        self.file = open(path, 'a', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=header or fieldnames, extrasaction='ignore')
+        if header is None:
+            self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+
+class _BinaryFile:
+    def __init__(self, path, dtype):
+        self.dtype = dtype
+        sidecar = path + '.json'
+        if not os.path.exists(sidecar):
+            with open(sidecar, 'w') as f:
+                json.dump({'dtype': dtype.descr}, f)
+        self.file = open(path, 'ab')
+
+    def write(self, rows):
+        self.file.write(to_records(rows, self.dtype).tobytes())
+
+
+class BatchWriter:
+    """
+    Buffers rows for one output stream (e.g. air quality) and writes them in batches.
+    ``schema`` is a list of (column, NumPy dtype) pairs; CSV output only uses the names.
+    """
+    def __init__(self, directory, prefix, schema, fmt='csv', batch_size=500, flush_interval=60.0,
+                 fsync='close', rotate_daily=True):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format '{fmt}'. Use one of: {list(FORMATS)}")
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy '{fsync}'. Use one of: {list(FSYNC_POLICIES)}")
+        self.directory = directory
+        self.prefix = prefix
+        self.fieldnames = [name for name, _ in schema]
+        self.dtype = np.dtype(schema)
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.rotate_daily = rotate_daily
+        self._pending = []
+        self._files = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._timer = None
+        self._closed = False
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, row):
+        extension = 'csv' if self.fmt == 'csv' else 'bin'
+        if not self.rotate_daily:
+            return os.path.join(self.directory, f"{self.prefix}.{extension}")
+        day = str(row.get('timestamp', ''))[:10]
+        return os.path.join(self.directory, f"{self.prefix}_{day}.{extension}")
+
+    def write(self, rows):
+        """
+        Queues rows, flushing if a size or age threshold has been reached.
+        """
+        with self._lock:
+            self._pending.extend(rows)
+            if (len(self._pending) >= self.batch_size
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _open(self, path):
+        if path not in self._files:
+            if self.rotate_daily:
+                # A new day's file means earlier days are complete
+                for old in list(self._files):
+                    self._close_file(old)
+            if self.fmt == 'csv':
+                self._files[path] = _CsvFile(path, self.fieldnames)
+            else:
+                self._files[path] = _BinaryFile(path, self.dtype)
+        return self._files[path]
+
+    def _close_file(self, path):
+        handle = self._files.pop(path).file
+        handle.flush()
+        if self.fsync != 'never':
+            os.fsync(handle.fileno())
+        handle.close()
+
+    def _flush(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        groups = {}
+        for row in rows:
+            groups.setdefault(self.path_for(row), []).append(row)
+        for path in sorted(groups):
+            output = self._open(path)
+            output.write(groups[path])
+            output.file.flush()
+            if self.fsync == 'flush':
+                os.fsync(output.file.fileno())
+        logger.debug(f"Wrote {len(rows)} {self.prefix} rows to {len(groups)} file(s)")
+
+    def _tick(self):
+        with self._lock:
+            if self._closed:
+                return
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush()
+            self._schedule()
+
+    def _schedule(self):
+        self._timer = threading.Timer(self.flush_interval, self._tick)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def start(self):
+        """
+        Starts a background timer so buffered rows are flushed within
+        ``flush_interval`` even when no new rows arrive.
+        """
+        with self._lock:
+            if self._timer is None and not self._closed:
+                self._schedule()
+        return self
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            if self._timer is not None:
+                self._timer.cancel()
+            self._flush()
+            for path in list(self._files):
+                self._close_file(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,354 @@
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import columnar
+import database
+import shared_dataset
+
+logger = logging.getLogger(__name__)
+
+# Columns every merged dataset must provide
+REQUIRED_COLUMNS = ['timestamp', 'pm2_5', 'pm10', 'no2', 'o3', 'aqi', 'duration_in_traffic_min', 'distance_km']
+AIR_QUALITY_COLUMNS = ['pm2_5', 'pm10', 'no2', 'o3', 'aqi']
+TRAFFIC_COLUMNS = ['duration_in_traffic_min', 'distance_km']
+
+# Monitoring station of each reading; files from before it existed hold one station
+LOCATION_COLUMN = 'location'
+DEFAULT_LOCATION = database.DEFAULT_LOCATION
+
+TIMESTAMP_FORMAT = '%m/%d/%Y %H:%M'
+RESAMPLE_RULE = '10min'
+
+
+def read_merged_csv(path):
+    """
+    Reads the merged CSV and parses its timestamps.
+    Returns None if the file is missing, empty or lacks required columns.
+    """
+    if not os.path.exists(path):
+        logger.error(f"CSV file not found at path: {path}")
+        return None
+
+    # Read CSV file with index_col=0 to skip the index column
+    df = pd.read_csv(path, index_col=0)
+
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing_columns:
+        logger.error(f"Missing required columns in CSV: {missing_columns}")
+        return None
+
+    if df.empty:
+        logger.error("CSV file is empty")
+        return None
+
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format=TIMESTAMP_FORMAT, errors='coerce')
+    return with_location(df)
+
+
+def with_location(df):
+    if LOCATION_COLUMN not in df.columns:
+        df[LOCATION_COLUMN] = DEFAULT_LOCATION
+    return df
+
+
+def read_merged(path):
+    """
+    Reads the merged dataset, preferring a fresh columnar bundle over the CSV.
+    ``path`` may also be a database URL (see database.py).
+    """
+    if database.is_database_url(path):
+        logger.info(f"Loading readings from database: {path}")
+        return database.read_frame(path)
+    columns = columnar.load_columns(path)
+    if columns is None:
+        return read_merged_csv(path)
+
+    logger.info(f"Loading columnar data from: {columnar.bundle_dir(path)}")
+    df = pd.DataFrame(columns)
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing_columns:
+        logger.warning(f"Columnar bundle is missing {missing_columns}, falling back to CSV")
+        return read_merged_csv(path)
+    return with_location(df)
+
+
+def clean_frame(df):
+    """
+    Drops duplicates, resamples to 10-minute intervals and fills gaps.
+    """
+    logger.info(f"Total rows before dropping duplicates: {len(df)}")
+    df = df.drop_duplicates()
+    logger.info(f"Total rows after dropping duplicates: {len(df)}")
+
+    # Resample data to 10-minute intervals (non-numeric columns cannot be averaged)
+    df = df.dropna(subset=['timestamp']).set_index('timestamp')
+    df = df.select_dtypes(include=[np.number]).resample(RESAMPLE_RULE).mean().reset_index()
+    logger.info(f"Total rows after resampling: {len(df)}")
+
+    # Air quality gaps are filled with the column mean
+    for col in AIR_QUALITY_COLUMNS:
+        df[col] = df[col].fillna(df[col].mean())
+
+    # For traffic data, use forward fill for missing values
+    for col in TRAFFIC_COLUMNS:
+        df[col] = df[col].ffill()
+
+    return df
+
+
+def load_clean_frame(path):
+    """
+    Loads and cleans the merged dataset, returning None on any failure.
+    """
+    try:
+        logger.info(f"Loading data from path: {path}")
+        df = read_merged(path)
+        if df is None:
+            return None
+        df = clean_frame(df)
+        logger.info(f"Data loaded and cleaned successfully. Shape: {df.shape}")
+        return df
+    except pd.errors.EmptyDataError:
+        logger.error("CSV file is empty")
+        return None
+    except pd.errors.ParserError as e:
+        logger.error(f"Error parsing CSV file: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Unexpected error loading CSV file: {e}")
+        return None
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded cache for results of parameterized queries.
+    """
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def get_or_build(self, key, builder):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        value = builder()
+        self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class Dataset:
+    """
+    Immutable snapshot of the cleaned dataset.
+    Columns are stored as read-only NumPy arrays shared by every request.
+    """
+    def __init__(self, columns, version):
+        self.version = version
+        self._columns = {}
+        for name, values in columns.items():
+            values = np.asarray(values)
+            values.flags.writeable = False
+            self._columns[name] = values
+        self._memo = {}
+        self._memo_lock = threading.RLock()
+        self._query_cache = LRUCache()
+
+    @classmethod
+    def from_frame(cls, df, version):
+        return cls({col: df[col].to_numpy() for col in df.columns}, version)
+
+    def __len__(self):
+        return len(self._columns['timestamp'])
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def column(self, name):
+        return self._columns[name]
+
+    def frame(self):
+        """
+        Returns a DataFrame view over the shared arrays.
+        Adding or replacing columns only affects the caller's frame;
+        writing into the shared arrays raises ValueError.
+        """
+        return pd.DataFrame(self._columns, copy=False)
+
+    def memo(self, key, builder):
+        """
+        Returns a value derived from this snapshot, building it on first use.
+        Memoized values live exactly as long as the snapshot does.
+        """
+        try:
+            return self._memo[key]
+        except KeyError:
+            pass
+        with self._memo_lock:
+            if key not in self._memo:
+                self._memo[key] = builder(self)
+            return self._memo[key]
+
+    def cached(self, key, builder):
+        """
+        Like memo(), but for results keyed by request parameters: only the
+        most recently used entries are kept.
+        """
+        return self._query_cache.get_or_build(key, lambda: builder(self))
+
+
+class DatasetCache:
+    """
+    Process-wide cache holding one cleaned Dataset per data file.
+    The file is only re-read when the mtime or size of the CSV or its
+    columnar manifest (or of a SQLite database and its WAL) changes, or on reload().
+    Loaded versions are published to ``shared_dir`` (see shared_dataset.py),
+    so other processes map the same arrays instead of loading their own, and
+    a version published by another process's forced reload is picked up too.
+    """
+    def __init__(self, path, loader=load_clean_frame, shared_dir=shared_dataset.SHARED_DIR):
+        self.path = path
+        if database.is_database_url(path):
+            self.watch_paths = database.watch_paths(path)
+        else:
+            self.watch_paths = [path, columnar.manifest_path(path)]
+        self._loader = loader
+        self.shared_dir = shared_dir
+        self._shared_key = shared_dataset.dataset_key(path, loader) if shared_dir else None
+        self._lock = threading.Lock()
+        # (file signature, version) the current snapshot was loaded for
+        self._state = None
+        self._dataset = None
+        self._hold = None
+
+    def _stat_signature(self):
+        signature = []
+        for watch_path in self.watch_paths:
+            try:
+                st = os.stat(watch_path)
+            except OSError:
+                signature.append(None)
+                continue
+            signature.append((st.st_mtime_ns, st.st_size))
+        if not any(signature):
+            return None
+        return tuple(signature)
+
+    @staticmethod
+    def _version_of(signature):
+        # Derived from file metadata only, so every worker agrees on the version
+        return hashlib.sha1(repr(signature).encode()).hexdigest()[:16]
+
+    def _current(self):
+        """
+        Returns the signature of the data files and the version to serve for it:
+        the one derived from the signature, or one a forced reload published for it.
+        """
+        signature = self._stat_signature()
+        if signature is None:
+            return None, None
+        version = self._version_of(signature)
+        if self.shared_dir:
+            published = shared_dataset.current_version(self.shared_dir, self._shared_key)
+            if published is not None and published.startswith(f"{version}."):
+                version = published
+        return signature, version
+
+    def file_version(self):
+        """
+        Returns the version the data files are at now, without loading them.
+        """
+        return self._current()[1]
+
+    def _serve(self, dataset, hold=None):
+        shared_dataset.release(self._hold)
+        self._dataset = dataset
+        self._hold = hold
+
+    def _load(self, signature, version, force=False):
+        version = version or self._version_of(signature)
+        if force:
+            # A forced reload re-reads the source even when the files look unchanged,
+            # so it is published as a new version rather than mapped from the old one
+            version = f"{self._version_of(signature)}.{uuid.uuid4().hex[:8]}"
+        shared = self.shared_dir and signature is not None
+        columns = None
+        if shared and not force:
+            columns = shared_dataset.open_columns(self.shared_dir, self._shared_key, version)
+        if columns is not None:
+            self._serve(Dataset(columns, version), shared_dataset.hold(self.shared_dir, self._shared_key, version))
+            logger.info(f"Dataset cache mapped shared version {version} ({len(self._dataset)} rows)")
+            self._state = (signature, version)
+            return
+
+        df = self._loader(self.path)
+        if df is None:
+            self._serve(None)
+        else:
+            if shared:
+                columns = shared_dataset.publish(self.shared_dir, self._shared_key, version, df)
+            if columns is not None:
+                self._serve(Dataset(columns, version), shared_dataset.hold(self.shared_dir, self._shared_key, version))
+            else:
+                self._serve(Dataset.from_frame(df, version))
+            logger.info(f"Dataset cache loaded version {version} ({len(self._dataset)} rows)")
+        # A private forced version still belongs to the files' own version, which is what _current() sees
+        self._state = (signature, version if columns is not None or not force else self._version_of(signature))
+
+    def get(self):
+        """
+        Returns the current Dataset snapshot, or None if the data cannot be loaded.
+        """
+        signature, version = self._current()
+        if signature is not None and (signature, version) == self._state:
+            return self._dataset
+        with self._lock:
+            signature, version = self._current()
+            if signature is None or (signature, version) != self._state:
+                self._load(signature, version)
+            return self._dataset
+
+    def reload(self, force=False):
+        """
+        Reloads the data regardless of its signature. A version another
+        process already published is mapped unless ``force`` is set, in which
+        case the source is read and cleaned again and published as a new
+        version that other processes switch to on their next get().
+        """
+        with self._lock:
+            self._load(*self._current(), force)
+            return self._dataset
+
+    @property
+    def version(self):
+        dataset = self.get()
+        return dataset.version if dataset is not None else None
@@ -0,0 +1,342 @@
+"""
+AQI forecasting, trained off the request path.
+
+A random forest predicts AQI at several horizons at once (one output per
+horizon) from lagged values and trailing means of the cleaned 10-minute
+series plus the time of day and week. The fitted model is saved with
+joblib together with the version of the data it was trained on, so workers
+load it at startup instead of retraining. scikit-learn and joblib are only
+imported when a model is trained or loaded, which keeps importing this
+module (and the app) fast.
+
+Training always runs in a separate process, either started in the
+background by Forecaster or by hand (or from cron):
+
+    python forecast.py train Merged_Air_Quality_and_Traffic_Data.csv
+
+Fitting the forest holds the GIL for seconds at a time, so a thread would
+stall a (gevent) web worker's requests and could outlive its timeout.
+A lock file next to the model keeps several workers from training at once;
+the others pick the new model up when its file changes.
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataset import DatasetCache
+
+logger = logging.getLogger(__name__)
+
+TARGET = 'aqi'
+INPUT_FIELDS = ['aqi', 'pm2_5', 'pm10', 'no2', 'o3', 'duration_in_traffic_min']
+
+# Lags and trailing-mean windows, in 10-minute steps of the cleaned series
+LAGS = [0, 1, 2, 3, 6, 12, 36, 144]
+ROLLING_WINDOWS = [6, 36, 144]
+LOOKBACK = max(LAGS + [window - 1 for window in ROLLING_WINDOWS])
+
+# Forecast horizons and their length in steps
+HORIZONS = {
+    '10m': 1,
+    '1h': 6,
+    '3h': 18,
+    '6h': 36,
+    '12h': 72,
+    '24h': 144
+}
+
+DEFAULT_MODEL_PATH = os.environ.get(
+    'FORECAST_MODEL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'aqi_forecaster.joblib')
+)
+
+MIN_TRAINING_ROWS = 500
+# Only the most recent rows are used, which bounds training time
+MAX_TRAINING_ROWS = 50000
+
+# A model is retrained for new data at most this often
+RETRAIN_INTERVAL = 3600
+# A lock file older than this is assumed to be left over from a crashed trainer
+LOCK_TIMEOUT = 3600
+
+
+def feature_names():
+    names = []
+    for field in INPUT_FIELDS:
+        names += [f"{field}_lag{lag}" for lag in LAGS]
+        names += [f"{field}_mean{window}" for window in ROLLING_WINDOWS]
+    return names + ['hour_sin', 'hour_cos', 'weekday']
+
+
+def build_features(dataset, lo=0, hi=None):
+    """
+    Returns the feature matrix for rows [lo, hi) of a cleaned dataset.
+    Rows without enough history before them contain NaN.
+    """
+    hi = len(dataset) if hi is None else hi
+    start = max(0, lo - LOOKBACK)
+    columns = []
+    for field in INPUT_FIELDS:
+        series = pd.Series(dataset.column(field)[start:hi], dtype=float)
+        columns += [series.shift(lag) for lag in LAGS]
+        columns += [series.rolling(window).mean() for window in ROLLING_WINDOWS]
+    features = np.column_stack([column.to_numpy() for column in columns])[lo - start:]
+
+    timestamps = pd.DatetimeIndex(dataset.column('timestamp')[lo:hi])
+    hours = timestamps.hour + timestamps.minute / 60
+    calendar = np.column_stack([
+        np.sin(2 * np.pi * hours / 24),
+        np.cos(2 * np.pi * hours / 24),
+        timestamps.weekday
+    ])
+    return np.hstack([features, calendar])
+
+
+def build_targets(dataset):
+    """
+    Returns the AQI ``steps`` rows ahead of every row, one column per horizon.
+    """
+    target = pd.Series(dataset.column(TARGET), dtype=float)
+    return np.column_stack([target.shift(-steps).to_numpy() for steps in HORIZONS.values()])
+
+
+def train(dataset):
+    """
+    Fits a model on a dataset snapshot and returns it as a bundle ready to save.
+    Returns None if there is too little data.
+    """
+    lo = max(0, len(dataset) - MAX_TRAINING_ROWS)
+    if len(dataset) - lo < MIN_TRAINING_ROWS:
+        logger.warning(f"Not enough data to train a forecaster ({len(dataset)} rows)")
+        return None
+    features = build_features(dataset, lo)
+    targets = build_targets(dataset)[lo:]
+    usable = ~(np.isnan(features).any(axis=1) | np.isnan(targets).any(axis=1))
+    if usable.sum() < MIN_TRAINING_ROWS:
+        logger.warning(f"Not enough data to train a forecaster ({int(usable.sum())} usable rows)")
+        return None
+
+    from sklearn.ensemble import RandomForestRegressor
+
+    started = time.time()
+    model = RandomForestRegressor(
+        n_estimators=100, max_depth=12, min_samples_leaf=5, max_features=0.3, random_state=0
+    )
+    model.fit(features[usable], targets[usable])
+    logger.info(f"Trained AQI forecaster on {int(usable.sum())} rows in {time.time() - started:.1f}s")
+    return {
+        'model': model,
+        'features': feature_names(),
+        'horizons': list(HORIZONS),
+        'data_version': dataset.version,
+        'trained_at': time.time(),
+        'training_rows': int(usable.sum())
+    }
+
+
+def save(bundle, path):
+    import joblib
+
+    # Written to a temporary file first so readers never see a partial model
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    joblib.dump(bundle, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def model_stamp(bundle):
+    return None if bundle is None else f"{bundle['data_version']}-{bundle['trained_at']:.0f}"
+
+
+class Forecaster:
+    """
+    Serves predictions from the saved model at ``path`` and retrains it in a
+    background thread when the data has moved on.
+    """
+    def __init__(self, path, dataset_cache, train_in_background=True, retrain_interval=RETRAIN_INTERVAL):
+        self.path = path
+        self.dataset_cache = dataset_cache
+        self.train_in_background = train_in_background
+        self.retrain_interval = retrain_interval
+        self._bundle = None
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._process = None
+        self._process_version = None
+        # Data version the last training attempt failed on; not retried until the data changes
+        self._failed_version = None
+
+    def load(self):
+        """
+        Loads the saved model if its file changed since it was last read.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return self._bundle
+        if mtime == self._mtime:
+            return self._bundle
+        with self._lock:
+            if mtime != self._mtime:
+                import joblib
+
+                try:
+                    bundle = joblib.load(self.path)
+                except Exception as e:
+                    logger.error(f"Could not load forecast model {self.path}: {e}")
+                    return self._bundle
+                if bundle.get('features') != feature_names() or bundle.get('horizons') != list(HORIZONS):
+                    logger.warning(f"Ignoring forecast model {self.path} built for different features")
+                    bundle = None
+                else:
+                    logger.info(f"Loaded forecast model trained on data version {bundle['data_version']}")
+                self._bundle = bundle
+                self._mtime = mtime
+        return self._bundle
+
+    @property
+    def stamp(self):
+        """
+        Identifies the loaded model, or None if there is none.
+        """
+        return model_stamp(self.load())
+
+    @property
+    def training(self):
+        if self._process is None:
+            return False
+        returncode = self._process.poll()
+        if returncode is None:
+            return True
+        if returncode != 0:
+            logger.error(f"Forecast training for data version {self._process_version} failed ({returncode})")
+            self._failed_version = self._process_version
+        self._process = None
+        return False
+
+    def needs_training(self, dataset):
+        if dataset.version == self._failed_version:
+            return False
+        bundle = self.load()
+        if bundle is None:
+            return True
+        return (bundle['data_version'] != dataset.version
+                and time.time() - bundle['trained_at'] >= self.retrain_interval)
+
+    def refresh(self, dataset):
+        """
+        Starts training in a child process if the model is missing or out of
+        date. Never waits for training to finish.
+        """
+        if not self.train_in_background or self.training or not self.needs_training(dataset):
+            return
+        with self._lock:
+            if self.training:
+                return
+            command = [sys.executable, os.path.abspath(__file__), 'train', self.dataset_cache.path,
+                       '--model', self.path, '--if-needed']
+            try:
+                self._process = subprocess.Popen(command, stdin=subprocess.DEVNULL)
+            except OSError as e:
+                logger.error(f"Could not start forecast training: {e}")
+                self._failed_version = dataset.version
+                return
+            self._process_version = dataset.version
+
+    def _acquire_lock(self):
+        lock_path = self.path + '.lock'
+        try:
+            if time.time() - os.path.getmtime(lock_path) > LOCK_TIMEOUT:
+                os.remove(lock_path)
+        except OSError:
+            pass
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return lock_path
+        except FileExistsError:
+            return None
+
+    def train_if_needed(self):
+        """
+        Trains and saves a model in this process if the saved one is missing or
+        was trained on other data. Returns False if training failed.
+        """
+        lock_path = self._acquire_lock()
+        if lock_path is None:
+            logger.info("Forecast model is being trained by another process")
+            return True
+        try:
+            dataset = self.dataset_cache.get()
+            if dataset is None:
+                logger.error(f"Failed to load {self.dataset_cache.path}")
+                return False
+            bundle = self.load()
+            if bundle is not None and bundle['data_version'] == dataset.version:
+                return True
+            bundle = train(dataset)
+            if bundle is None:
+                return False
+            save(bundle, self.path)
+            return True
+        except Exception as e:
+            logger.error(f"Forecast training failed: {e}")
+            return False
+        finally:
+            os.remove(lock_path)
+
+    def predict(self, dataset, lo, hi, horizons):
+        """
+        Returns a DataFrame with the origin timestamp and predicted AQI for each
+        requested horizon, for forecasts made at rows [lo, hi). All rows are
+        predicted in one batch; results are cached per model and data version.
+        Returns None if no model is available.
+        """
+        bundle = self.load()
+        if bundle is None:
+            return None
+        key = ('forecast', model_stamp(bundle), lo, hi, tuple(horizons))
+        return dataset.cached(key, lambda ds: self._predict(bundle, ds, lo, hi, horizons))
+
+    @staticmethod
+    def _predict(bundle, dataset, lo, hi, horizons):
+        features = build_features(dataset, lo, hi)
+        # Rows without a full history behind them can't be forecast from
+        complete = ~np.isnan(features).any(axis=1)
+        predictions = np.full((len(features), len(bundle['horizons'])), np.nan)
+        if complete.any():
+            predictions[complete] = bundle['model'].predict(features[complete])
+        columns = {name: predictions[:, i] for i, name in enumerate(bundle['horizons']) if name in horizons}
+        return pd.DataFrame({'timestamp': dataset.column('timestamp')[lo:hi], **columns})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the AQI forecaster and save it")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train', help="fit a model on the merged data")
+    train_parser.add_argument('source', help="merged CSV or database URL")
+    train_parser.add_argument('--model', default=DEFAULT_MODEL_PATH, help="where to save the model")
+    train_parser.add_argument('--if-needed', action='store_true',
+                              help="only train if the saved model was trained on other data")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.if_needed:
+        forecaster = Forecaster(args.model, DatasetCache(args.source), train_in_background=False)
+        sys.exit(0 if forecaster.train_if_needed() else 1)
+    dataset = DatasetCache(args.source).get()
+    if dataset is None:
+        parser.error(f"Failed to load {args.source}")
+    bundle = train(dataset)
+    if bundle is None:
+        parser.error("Not enough data to train")
+    save(bundle, args.model)
+    logger.info(f"Saved model to {args.model}")
+
+
+if __name__ == '__main__':
+    main()
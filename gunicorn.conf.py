@@ -0,0 +1,65 @@
+"""
+gunicorn settings tuned for a fast cold start:
+
+    gunicorn -c gunicorn.conf.py app:app
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+With preload_app the application, and with it pandas, Flask and the rest, is
+imported once in the master. when_ready() then loads the data there, before
+any worker is forked, so workers start with both already in (copy-on-write)
+memory. post_fork() drops any database connections inherited from the
+master, and post_worker_init() runs the app's warm_up() in each worker
+before it accepts connections; after a preload that only confirms the data
+is current, and without one (GUNICORN_PRELOAD=0) it does the loading.
+
+Workers are gevent workers, so each open /api/live stream is a greenlet
+rather than a thread and long-lived streams don't starve the other
+endpoints. The standard library is patched here, before the app is
+preloaded, so the locks and threads it creates are gevent-aware.
+"""
+import importlib
+import os
+import sys
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+# Concurrent connections per gevent worker, open live streams included
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', '1000'))
+# Only used by the gthread worker class
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+timeout = 120
+
+if worker_class == 'gevent':
+    from gevent import monkey
+
+    monkey.patch_all()
+
+
+def _warm_up(app_uri, log):
+    module = importlib.import_module(app_uri.split(':')[0])
+    warm_up = getattr(module, 'warm_up', None)
+    if warm_up is None:
+        return
+    try:
+        warm_up()
+    except Exception:
+        # A failed warm-up only costs the first requests their speed, so it mustn't stop the server
+        log.exception("Warm-up failed; serving without it")
+
+
+def when_ready(server):
+    if preload_app:
+        _warm_up(server.app.app_uri, server.log)
+
+
+def post_fork(server, worker):
+    # Database connections the master opened while warming up must not be shared with workers
+    database = sys.modules.get('database')
+    if database is not None:
+        database.dispose_engines()
+
+
+def post_worker_init(worker):
+    _warm_up(worker.app.app_uri, worker.log)
@@ -0,0 +1,166 @@
+"""
+Conditional GET and compression for data endpoints.
+
+Responses are tagged with a strong ETag derived from the dataset version,
+the request path, the query parameters and the negotiated content encoding.
+Clients that send a matching If-None-Match get a bodiless 304. Full bodies
+are compressed (brotli when the optional ``brotli`` package is installed,
+otherwise gzip) and cached per ETag, so an unchanged poll never re-runs the
+view or the compressor. Files are not read into memory: they are sent with
+send_file(), which answers If-None-Match and Range requests itself.
+"""
+import functools
+import gzip
+import hashlib
+import logging
+import os
+
+from flask import make_response, request, send_from_directory
+
+from dataset import LRUCache
+
+try:
+    import brotli
+except ImportError:  # Optional dependency
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+
+# Encodings in order of preference
+ENCODINGS = (['br'] if brotli is not None else []) + ['gzip', 'identity']
+
+# Total size of the cached bodies, so large responses can't pile up in every worker
+BODY_CACHE_BYTES = int(os.environ.get('BODY_CACHE_BYTES', 64 * 1024 * 1024))
+
+
+class BodyCache(LRUCache):
+    """
+    LRUCache of (body, ...) tuples that is also bounded by the total body size.
+    Bodies larger than the whole budget are not cached.
+    """
+    def __init__(self, maxsize, maxbytes):
+        super().__init__(maxsize)
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+
+    def set(self, key, value):
+        size = len(value[0])
+        if size > self.maxbytes:
+            return
+        with self._lock:
+            previous = self._items.pop(key, None)
+            if previous is not None:
+                self.nbytes -= len(previous[0])
+            self._items[key] = value
+            self.nbytes += size
+            while len(self._items) > self.maxsize or self.nbytes > self.maxbytes:
+                _, evicted = self._items.popitem(last=False)
+                self.nbytes -= len(evicted[0])
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.nbytes = 0
+
+
+_body_cache = BodyCache(maxsize=64, maxbytes=BODY_CACHE_BYTES)
+
+
+def clear_cache():
+    """
+    Drops every cached response body.
+    """
+    _body_cache.clear()
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def negotiate_encoding():
+    encoding = request.accept_encodings.best_match(ENCODINGS, default='identity')
+    return None if encoding == 'identity' else encoding
+
+
+def make_etag(version, encoding=None):
+    """
+    Returns the ETag value for the current request at a given dataset version.
+    """
+    args = '&'.join(f"{key}={value}" for key, value in sorted(request.args.items(multi=True)))
+    digest = hashlib.sha1(f"{version}|{request.path}|{args}".encode()).hexdigest()[:32]
+    return f"{digest}-{encoding}" if encoding else digest
+
+
+def send_versioned_file(directory, filename, version):
+    """
+    Sends a file with send_from_directory(), tagged with the ETag of ``version``
+    so clients can revalidate with If-None-Match. The file is streamed as is.
+    """
+    etag = make_etag(version) if version is not None else True
+    return send_from_directory(directory, filename, etag=etag, conditional=True)
+
+
+def _finish(response, etag):
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def conditional(version_func):
+    """
+    Decorates a GET view whose output only depends on the request and on the
+    dataset version returned by ``version_func``.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                version = version_func()
+            except Exception as e:
+                logger.warning(f"Could not determine data version for {request.path}: {e}")
+                version = None
+            if version is None:
+                return view(*args, **kwargs)
+
+            encoding = negotiate_encoding()
+            etag = make_etag(version, encoding)
+            # The identity representation has the base ETag and is equally valid
+            if request.if_none_match.contains(etag) or request.if_none_match.contains(make_etag(version)):
+                return _finish(make_response('', 304), etag)
+
+            cached = _body_cache.get(etag)
+            if cached is not None:
+                body, mimetype, body_encoding, body_etag = cached
+                response = make_response(body)
+                response.mimetype = mimetype
+                if body_encoding:
+                    response.headers['Content-Encoding'] = body_encoding
+                return _finish(response, body_etag)
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            if response.is_streamed or response.direct_passthrough:
+                # Generated bodies are sent as produced, and files are never read into
+                # memory (use send_versioned_file for those); both still get an ETag for 304s
+                return _finish(response, make_etag(version))
+
+            body = response.get_data()
+            body_encoding, body_etag = None, make_etag(version)
+            if encoding and len(body) >= MIN_COMPRESS_SIZE:
+                body = compress(body, encoding)
+                body_encoding, body_etag = encoding, etag
+                response.set_data(body)
+                response.headers['Content-Encoding'] = encoding
+                response.headers.pop('Accept-Ranges', None)
+            _body_cache.set(etag, (body, response.mimetype, body_encoding, body_etag))
+            return _finish(response, body_etag)
+        return wrapper
+    return decorator
@@ -0,0 +1,490 @@
+"""
+Incremental merge of the logger's air quality and traffic files into the
+merged dataset read by the API.
+
+Each run reads only the bytes appended to the logger CSVs since the last
+checkpoint, joins every air quality reading to the traffic reading nearest
+in time (within a tolerance) and appends the result to the merged CSV.
+A reading is only joined once traffic data up to ``timestamp + tolerance``
+has arrived, or once it is more than ``max_lag`` behind the newest air
+quality reading; until then it is carried in the checkpoint together with
+the few traffic rows it could still match. Adding ten minutes of data costs
+ten minutes of work, however long the history is.
+
+The checkpoint is written after the merged rows, so a crash in between can
+repeat a batch; clean_frame() drops such duplicates on load, and database
+inserts replace rows with the same (location, timestamp).
+
+Traffic rows carry the numeric seconds/meters from the Directions response;
+rows from older loggers only have text ('1 hour 5 mins', '12.3 km'), which
+is parsed with vectorized regex extraction. ``backfill`` adds the numeric
+columns to such files in bulk.
+
+Every merged row is also scored for spikes, dropouts and gaps (see
+anomalies.py) as it is appended; the detector state travels in the
+checkpoint and anomalies are appended to ``<merged>.anomalies.csv``.
+``anomalies`` rebuilds that file from the full merged history.
+
+Usage:
+    python ingest.py merge /path/to/logger/data Merged_Air_Quality_and_Traffic_Data.csv
+    python ingest.py merge /path/to/logger/data Merged_Air_Quality_and_Traffic_Data.csv --interval 600 --columnar
+    python ingest.py backfill /path/to/logger/data/traffic_data*.csv
+    python ingest.py anomalies Merged_Air_Quality_and_Traffic_Data.csv
+"""
+import argparse
+import glob
+import io
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import anomalies
+import columnar
+import database
+from dataset import read_merged_csv
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_VERSION = 2
+TIMESTAMP_FORMAT = '%m/%d/%Y %H:%M'
+LOGGER_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Logger files, including daily-rotated ones (air_quality_2024-12-06.csv)
+AIR_QUALITY_PATTERN = 'air_quality*.csv'
+TRAFFIC_PATTERN = 'traffic_data*.csv'
+
+AIR_QUALITY_FIELDS = ['pm2_5', 'pm10', 'no2', 'o3', 'aqi']
+TRAFFIC_FIELDS = ['distance_km', 'duration_min', 'duration_in_traffic_min']
+MERGED_COLUMNS = ['timestamp', 'location'] + AIR_QUALITY_FIELDS + TRAFFIC_FIELDS
+
+DURATION_PATTERN = r'(?:(\d+)\s*days?)?\s*(?:(\d+)\s*hours?)?\s*(?:(\d+)\s*mins?)?'
+DISTANCE_PATTERN = r'(?P<value>[\d.,]+)\s*(?P<unit>km|m)\b'
+
+TOLERANCE = pd.Timedelta(minutes=10)
+MAX_LAG = pd.Timedelta(hours=1)
+
+
+def checkpoint_path(merged_path):
+    root, _ = os.path.splitext(merged_path)
+    return root + '.ingest.json'
+
+
+def anomalies_path(merged_path):
+    root, _ = os.path.splitext(merged_path)
+    return root + '.anomalies.csv'
+
+
+def parse_seconds(text):
+    """
+    Converts Directions duration texts ('23 mins', '1 hour 5 mins', '2 days 3 hours')
+    to seconds, over a whole column at once. Unparseable values become NaN.
+    """
+    parts = text.astype('string').str.extract(DURATION_PATTERN)
+    parts = parts.apply(pd.to_numeric, errors='coerce')
+    seconds = (parts.fillna(0) * [86400, 3600, 60]).sum(axis=1)
+    return seconds.where(parts.notna().any(axis=1)).astype(float)
+
+
+def parse_meters(text):
+    """
+    Converts Directions distance texts ('12.3 km', '850 m', '1,204 km') to meters.
+    """
+    parts = text.astype('string').str.extract(DISTANCE_PATTERN)
+    value = pd.to_numeric(parts['value'].str.replace(',', '', regex=False), errors='coerce')
+    return (value * np.where(parts['unit'].eq('km').fillna(False), 1000.0, 1.0)).astype(float)
+
+
+# Numeric columns recorded by the logger, with the text field and parser used when they are missing
+NUMERIC_TRAFFIC_FIELDS = {
+    'distance_m': ('distance', parse_meters),
+    'duration_s': ('duration', parse_seconds),
+    'duration_in_traffic_s': ('duration_in_traffic', parse_seconds)
+}
+
+
+def traffic_numbers(df):
+    """
+    Returns distance_m, duration_s and duration_in_traffic_s for logger traffic
+    rows, preferring the numeric values recorded by the logger and parsing
+    the text fields where they are missing (rows from older loggers).
+    """
+    numbers = {}
+    for column, (source, parse) in NUMERIC_TRAFFIC_FIELDS.items():
+        parsed = parse(df[source]) if source in df else pd.Series(np.nan, index=df.index)
+        if column in df:
+            parsed = pd.to_numeric(df[column], errors='coerce').fillna(parsed)
+        numbers[column] = parsed
+    return pd.DataFrame(numbers, index=df.index)
+
+
+def _location(df, default):
+    if 'location' not in df:
+        return pd.Series(default, index=df.index, dtype=object)
+    return df['location'].astype(object).where(df['location'].notna(), default)
+
+
+def traffic_values(df):
+    """
+    Returns the numeric traffic columns of a frame of logger traffic rows.
+    Routes logged without a location can be matched by any location.
+    """
+    numbers = traffic_numbers(df)
+    return pd.DataFrame({
+        'timestamp': df['timestamp'].astype('datetime64[ns]'),
+        'location': _location(df, None),
+        'distance_km': numbers['distance_m'] / 1000,
+        'duration_min': numbers['duration_s'] / 60,
+        'duration_in_traffic_min': numbers['duration_in_traffic_s'] / 60
+    })
+
+
+def backfill(path, chunksize=100_000):
+    """
+    Adds or completes the numeric traffic columns of a logger traffic CSV,
+    rewriting it in chunks. Returns the number of rows processed.
+    """
+    tmp_path = f"{path}.tmp"
+    rows = 0
+    with open(tmp_path, 'w', newline='') as out:
+        for i, chunk in enumerate(pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunksize)):
+            numbers = traffic_numbers(chunk)
+            for column in NUMERIC_TRAFFIC_FIELDS:
+                chunk[column] = numbers[column].round(0).astype('Int64')
+            chunk.to_csv(out, header=i == 0, index=False)
+            rows += len(chunk)
+    os.replace(tmp_path, path)
+    logger.info(f"Backfilled numeric traffic columns for {rows} rows in {path}")
+    return rows
+
+
+def air_quality_values(df, location=database.DEFAULT_LOCATION):
+    """
+    Returns the air quality columns of a frame of logger rows; rows logged
+    without a location (older loggers) are assigned ``location``.
+    """
+    return pd.DataFrame({
+        'timestamp': df['timestamp'].astype('datetime64[ns]'),
+        'location': _location(df, location),
+        **{field: pd.to_numeric(df[field], errors='coerce') for field in AIR_QUALITY_FIELDS}
+    })
+
+
+def _skip_rows(f, rows):
+    """
+    Returns the offset after the header and the first ``rows`` lines of a file.
+    """
+    f.seek(0)
+    f.readline()
+    for _ in range(rows):
+        f.readline()
+    return f.tell()
+
+
+def read_appended(path, state):
+    """
+    Reads the complete lines appended to a CSV since ``state['offset']``,
+    advancing the offset. A partially written last line is left for the next run.
+    If the header changed (e.g. the file was rewritten by backfill), reading
+    resumes after the same number of rows instead of at the old byte offset.
+    """
+    with open(path, 'rb') as f:
+        first = f.readline()
+        if not first.endswith(b'\n'):
+            return None
+        header = first.decode('utf-8').strip().split(',')
+        if state.get('header') is None:
+            state.update(header=header, offset=f.tell(), rows=0)
+        elif header != state['header']:
+            logger.info(f"Header of {path} changed, resuming after row {state.get('rows', 0)}")
+            state.update(header=header, offset=_skip_rows(f, state.get('rows', 0)))
+        f.seek(state['offset'])
+        data = f.read()
+    end = data.rfind(b'\n') + 1
+    if end == 0:
+        return None
+    df = pd.read_csv(io.BytesIO(data[:end]), names=state['header'], header=None)
+    state['offset'] += end
+    state['rows'] = state.get('rows', 0) + data[:end].count(b'\n')
+    return df
+
+
+def read_new_rows(directory, pattern, files):
+    """
+    Returns the rows appended to all files matching ``pattern`` since the
+    offsets recorded in ``files``, which is updated in place.
+    """
+    frames = []
+    for path in sorted(glob.glob(os.path.join(directory, pattern))):
+        state = files.setdefault(os.path.basename(path), {'offset': 0, 'header': None, 'rows': 0})
+        if os.path.getsize(path) < state['offset']:
+            logger.warning(f"{path} shrank since the last run, reading it from the start")
+            state.update(offset=0, header=None, rows=0)
+        df = read_appended(path, state)
+        if df is not None and len(df):
+            frames.append(df)
+    if not frames:
+        return None
+    df = pd.concat(frames, ignore_index=True)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format=LOGGER_TIMESTAMP_FORMAT, errors='coerce')
+    return df.dropna(subset=['timestamp'])
+
+
+def _frame_from_state(records, columns, location=None):
+    if records and len(records[0]) == len(columns) - 1:
+        # Version 1 checkpoints had no location column
+        records = [[record[0], location] + record[1:] for record in records]
+    df = pd.DataFrame(records, columns=columns)
+    df['timestamp'] = pd.to_datetime(df['timestamp']).astype('datetime64[ns]')
+    df['location'] = df['location'].astype(object)
+    return df.astype({column: float for column in columns if column not in ('timestamp', 'location')})
+
+
+def _frame_to_state(df):
+    # Not DataFrame.to_json, which rounds floats to 10 decimal places
+    df = df.assign(timestamp=df['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%S')).astype(object)
+    return df.where(df.notna(), None).to_numpy().tolist()
+
+
+def _next_index(merged_path):
+    """
+    Returns the index for the next row of an existing merged CSV by reading its last line.
+    """
+    if not os.path.exists(merged_path) or os.path.getsize(merged_path) == 0:
+        return 0
+    with open(merged_path, 'rb') as f:
+        f.seek(max(0, os.path.getsize(merged_path) - 4096))
+        lines = f.read().splitlines()
+    try:
+        return int(lines[-1].split(b',')[0]) + 1
+    except (IndexError, ValueError):
+        return 0
+
+
+class Checkpoint:
+    """
+    Read offsets per logger file plus the rows still waiting to be joined.
+    """
+    def __init__(self, path, merged_path, location=database.DEFAULT_LOCATION):
+        self.path = path
+        state = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            if state.get('format_version') not in (1, CHECKPOINT_VERSION):
+                raise ValueError(f"Unsupported checkpoint format in {path}")
+        self.air_quality_files = state.get('air_quality_files', {})
+        self.traffic_files = state.get('traffic_files', {})
+        self.pending = _frame_from_state(
+            state.get('pending', []), ['timestamp', 'location'] + AIR_QUALITY_FIELDS, location
+        )
+        self.traffic_tail = _frame_from_state(state.get('traffic_tail', []), ['timestamp', 'location'] + TRAFFIC_FIELDS)
+        self.last_air_quality = state.get('last_air_quality')
+        self.next_index = state['next_index'] if 'next_index' in state else _next_index(merged_path)
+        self.anomaly_state = state.get('anomalies')
+
+    def save(self):
+        state = {
+            'format_version': CHECKPOINT_VERSION,
+            'air_quality_files': self.air_quality_files,
+            'traffic_files': self.traffic_files,
+            'pending': _frame_to_state(self.pending),
+            'traffic_tail': _frame_to_state(self.traffic_tail),
+            'last_air_quality': self.last_air_quality,
+            'next_index': self.next_index,
+            'anomalies': self.anomaly_state
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+def join(air_quality, traffic, tolerance=TOLERANCE, max_lag=MAX_LAG):
+    """
+    Splits air quality rows into those that can be joined now and those that
+    must wait for more traffic data. Returns (joined, waiting).
+    """
+    air_quality = air_quality.sort_values('timestamp', kind='stable').reset_index(drop=True)
+    traffic = traffic.sort_values('timestamp', kind='stable').reset_index(drop=True)
+    if air_quality.empty:
+        return air_quality.reindex(columns=MERGED_COLUMNS), air_quality
+
+    ready = air_quality['timestamp'] <= air_quality['timestamp'].max() - max_lag
+    if not traffic.empty:
+        ready |= air_quality['timestamp'] + tolerance <= traffic['timestamp'].max()
+    # Traffic for a reading's own location first, then routes logged without a location
+    located = traffic[traffic['location'].notna()]
+    shared = traffic[traffic['location'].isna()].drop(columns='location')
+    joined = pd.merge_asof(
+        air_quality[ready].reset_index(drop=True), located,
+        on='timestamp', by='location', direction='nearest', tolerance=tolerance
+    )
+    if len(shared):
+        fallback = pd.merge_asof(
+            joined[['timestamp']], shared, on='timestamp', direction='nearest', tolerance=tolerance
+        )
+        missing = joined[TRAFFIC_FIELDS].isna().all(axis=1)
+        joined.loc[missing, TRAFFIC_FIELDS] = fallback.loc[missing, TRAFFIC_FIELDS].to_numpy()
+    return joined[MERGED_COLUMNS], air_quality[~ready].reset_index(drop=True)
+
+
+def append_merged(merged_path, joined, start_index):
+    """
+    Appends joined rows to the merged CSV in its existing column order.
+    """
+    exists = os.path.exists(merged_path) and os.path.getsize(merged_path) > 0
+    columns = MERGED_COLUMNS
+    if exists:
+        with open(merged_path, newline='') as f:
+            header = f.readline().strip().split(',')[1:]
+        columns = [column for column in header if column in joined.columns]
+    out = joined.assign(timestamp=joined['timestamp'].dt.strftime(TIMESTAMP_FORMAT))
+    out = out.reindex(columns=columns)
+    out.index = pd.RangeIndex(start_index, start_index + len(out))
+    with open(merged_path, 'a', newline='') as f:
+        out.to_csv(f, header=not exists)
+
+
+def append_anomalies(path, found, overwrite=False):
+    exists = not overwrite and os.path.exists(path) and os.path.getsize(path) > 0
+    out = found.assign(timestamp=found['timestamp'].dt.strftime(TIMESTAMP_FORMAT))
+    with open(path, 'a' if exists else 'w', newline='') as f:
+        out.to_csv(f, header=not exists, index=False, columns=anomalies.ANOMALY_COLUMNS)
+
+
+def ingest(data_dir, merged_path, tolerance=TOLERANCE, max_lag=MAX_LAG, database_url=None,
+           location=database.DEFAULT_LOCATION):
+    """
+    Merges rows appended to the logger files since the last run into the merged CSV
+    and, if ``database_url`` is given, into the readings database.
+    Returns the number of rows appended.
+    """
+    checkpoint = Checkpoint(checkpoint_path(merged_path), merged_path, location)
+
+    new_air_quality = read_new_rows(data_dir, AIR_QUALITY_PATTERN, checkpoint.air_quality_files)
+    new_traffic = read_new_rows(data_dir, TRAFFIC_PATTERN, checkpoint.traffic_files)
+
+    frames = [checkpoint.pending]
+    if new_air_quality is not None:
+        frames.append(air_quality_values(new_air_quality, location))
+    air_quality = pd.concat(frames, ignore_index=True) if len(frames) > 1 else checkpoint.pending
+
+    frames = [checkpoint.traffic_tail]
+    if new_traffic is not None:
+        frames.append(traffic_values(new_traffic))
+    traffic = pd.concat(frames, ignore_index=True) if len(frames) > 1 else checkpoint.traffic_tail
+
+    joined, waiting = join(air_quality, traffic, tolerance, max_lag)
+    if len(joined):
+        append_merged(merged_path, joined, checkpoint.next_index)
+        checkpoint.next_index += len(joined)
+        if database_url is not None:
+            database.ReadingStore(database_url).insert_frame(joined, location)
+
+        detector = anomalies.AnomalyDetector(state=checkpoint.anomaly_state)
+        found = detector.update_frame(joined)
+        checkpoint.anomaly_state = detector.state()
+        if len(found):
+            append_anomalies(anomalies_path(merged_path), found)
+            logger.warning(f"Found {len(found)} anomalies in the new rows: {found['kind'].value_counts().to_dict()}")
+
+    if len(air_quality):
+        latest = air_quality['timestamp'].max()
+        if checkpoint.last_air_quality is not None:
+            latest = max(latest, pd.Timestamp(checkpoint.last_air_quality))
+        checkpoint.last_air_quality = latest.isoformat()
+
+    # Keep only traffic rows that a waiting or future air quality row could still match
+    if len(traffic):
+        cutoff = traffic['timestamp'].max() - max_lag - tolerance
+        if checkpoint.last_air_quality is not None:
+            cutoff = max(cutoff, pd.Timestamp(checkpoint.last_air_quality) - tolerance)
+        if len(waiting):
+            cutoff = min(cutoff, waiting['timestamp'].min() - tolerance)
+        traffic = traffic[traffic['timestamp'] >= cutoff]
+    checkpoint.pending = waiting
+    checkpoint.traffic_tail = traffic.sort_values('timestamp', kind='stable').reset_index(drop=True)
+    checkpoint.save()
+
+    logger.info(f"Appended {len(joined)} merged rows to {merged_path}, {len(waiting)} waiting for traffic data")
+    return len(joined)
+
+
+def rebuild_anomalies(merged_path):
+    """
+    Scores the whole merged history, rewrites the anomalies file and stores
+    the detector state in the checkpoint so later merges continue from it.
+    """
+    df = read_merged_csv(merged_path)
+    if df is None:
+        raise ValueError(f"Failed to read {merged_path}")
+    df = df.dropna(subset=['timestamp']).sort_values('timestamp', kind='stable')
+    detector = anomalies.AnomalyDetector()
+    found = detector.update_frame(df)
+    append_anomalies(anomalies_path(merged_path), found, overwrite=True)
+    checkpoint = Checkpoint(checkpoint_path(merged_path), merged_path)
+    checkpoint.anomaly_state = detector.state()
+    checkpoint.save()
+    logger.info(f"Found {len(found)} anomalies in {len(df)} rows of {merged_path}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge logger readings into the merged dataset")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    merge_parser = subparsers.add_parser('merge', help="append new logger readings to the merged CSV")
+    merge_parser.add_argument('data_dir', help="directory the data logger writes to")
+    merge_parser.add_argument('merged', help="merged CSV to append to")
+    merge_parser.add_argument('--tolerance', default='10min', help="max distance to the nearest traffic reading")
+    merge_parser.add_argument('--max-lag', default='1h',
+                              help="join readings this far behind the newest one even without later traffic data")
+    merge_parser.add_argument('--interval', type=float, default=0,
+                              help="keep ingesting every INTERVAL seconds instead of exiting")
+    merge_parser.add_argument('--columnar', action='store_true', help="refresh the columnar bundle after appending")
+    merge_parser.add_argument('--database',
+                              help="also insert merged rows into this database, e.g. sqlite:///smart_city.db")
+    merge_parser.add_argument('--location', default=database.DEFAULT_LOCATION,
+                              help="location for readings logged without one")
+
+    backfill_parser = subparsers.add_parser(
+        'backfill', help="add numeric distance/duration columns to existing traffic CSVs"
+    )
+    backfill_parser.add_argument('csv', nargs='+')
+
+    anomalies_parser = subparsers.add_parser('anomalies', help="rebuild the anomalies file from the merged history")
+    anomalies_parser.add_argument('merged')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == 'backfill':
+        for csv_path in args.csv:
+            backfill(csv_path)
+        return
+    if args.command == 'anomalies':
+        rebuild_anomalies(args.merged)
+        return
+
+    tolerance = pd.Timedelta(args.tolerance)
+    max_lag = pd.Timedelta(args.max_lag)
+    while True:
+        try:
+            appended = ingest(args.data_dir, args.merged, tolerance, max_lag, args.database, args.location)
+            if appended and args.columnar:
+                columnar.sync(args.merged)
+        except Exception as e:
+            logger.error(f"Failed to ingest into {args.merged}: {e}")
+        if args.interval <= 0:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Server-Sent Events push channel for new readings.
+
+A single producer thread watches the dataset cache and, whenever rows are
+appended, broadcasts one ``reading`` event per new row plus ``threshold``
+events when a metric moves into a different band. Each connected client
+only owns a small bounded queue; under an async worker (gunicorn's gevent
+worker class) the producer and every idle connection are greenlets rather
+than OS threads.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from timeseries import QueryError, cursor_position, make_cursor
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for new data
+POLL_INTERVAL = 5.0
+
+# Seconds of silence after which a comment is sent to keep proxies from closing the stream
+HEARTBEAT_INTERVAL = 15.0
+
+# Events buffered per client before it is considered too slow and dropped
+CLIENT_QUEUE_SIZE = 256
+
+# Larger appends (e.g. a rewritten file) produce one 'reset' event instead of one event per row
+MAX_EVENTS_PER_BATCH = 100
+
+
+def format_event(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def classify(value, thresholds):
+    """
+    Returns the name of the highest threshold ``value`` exceeds, or None.
+    ``thresholds`` maps band names to lower bounds, e.g. SMART_FEATURES['air_quality'].
+    """
+    level = None
+    for name, bound in sorted(thresholds.items(), key=lambda item: item[1]):
+        if value > bound:
+            level = name
+    return level
+
+
+class Broadcaster:
+    """
+    Fans events out from one producer to many subscriber queues.
+    """
+    def __init__(self, queue_size=CLIENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def publish(self, message):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # A client that stopped reading is cut off instead of growing memory
+                self.unsubscribe(subscriber)
+                try:
+                    subscriber.put_nowait(None)
+                except queue.Full:
+                    pass
+
+
+class LiveFeed:
+    """
+    Watches a DatasetCache and broadcasts readings appended to it.
+    The producer thread starts with the first subscriber.
+    """
+    def __init__(self, dataset_cache, fields, thresholds, poll_interval=POLL_INTERVAL):
+        self.dataset_cache = dataset_cache
+        self.fields = list(fields)
+        self.thresholds = thresholds
+        self.poll_interval = poll_interval
+        self.broadcaster = Broadcaster()
+        self._cursor = None
+        self._levels = {}
+        self._version = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='live-feed', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Live feed poll failed: {e}")
+            time.sleep(self.poll_interval)
+
+    def reading(self, dataset, index):
+        row = {'timestamp': pd.Timestamp(dataset.column('timestamp')[index]).isoformat()}
+        for field in self.fields:
+            value = dataset.column(field)[index]
+            row[field] = None if np.isnan(value) else float(value)
+        return row
+
+    def poll(self):
+        """
+        Publishes events for rows appended since the last poll.
+        """
+        dataset = self.dataset_cache.get()
+        if dataset is None or dataset.version == self._version:
+            return
+        self._version = dataset.version
+        timestamps = dataset.column('timestamp')
+        if self._cursor is None:
+            # History is available through the other endpoints; only new rows are pushed
+            self._cursor = make_cursor(timestamps, len(timestamps))
+            return
+
+        lo = cursor_position(timestamps, self._cursor)
+        hi = len(timestamps)
+        self._cursor = make_cursor(timestamps, hi)
+        if hi - lo > MAX_EVENTS_PER_BATCH:
+            self.broadcaster.publish(format_event('reset', {'rows': hi - lo}, self._cursor))
+            return
+
+        for index in range(lo, hi):
+            event_id = make_cursor(timestamps, index + 1)
+            row = self.reading(dataset, index)
+            self.broadcaster.publish(format_event('reading', row, event_id))
+            for field, thresholds in self.thresholds.items():
+                if row.get(field) is None:
+                    continue
+                level = classify(row[field], thresholds)
+                previous = self._levels.get(field, level)
+                self._levels[field] = level
+                if level != previous:
+                    self.broadcaster.publish(format_event('threshold', {
+                        'timestamp': row['timestamp'],
+                        'field': field,
+                        'value': row[field],
+                        'from': previous,
+                        'to': level
+                    }, event_id))
+
+    def replay(self, last_event_id):
+        """
+        Yields 'reading' events a reconnecting client missed since ``last_event_id``.
+        """
+        dataset = self.dataset_cache.get()
+        if dataset is None or self._cursor is None:
+            return
+        timestamps = dataset.column('timestamp')
+        try:
+            lo = cursor_position(timestamps, last_event_id)
+        except QueryError:
+            return
+        hi = cursor_position(timestamps, self._cursor)
+        if hi - lo > MAX_EVENTS_PER_BATCH:
+            yield format_event('reset', {'rows': hi - lo}, self._cursor)
+            return
+        for index in range(lo, hi):
+            yield format_event('reading', self.reading(dataset, index), make_cursor(timestamps, index + 1))
+
+    def stream(self, last_event_id=None, heartbeat=HEARTBEAT_INTERVAL):
+        """
+        Yields the SSE body for one client until it disconnects or falls behind.
+        """
+        self._ensure_started()
+        subscriber = self.broadcaster.subscribe()
+        try:
+            yield 'retry: 5000\n\n'
+            if last_event_id:
+                yield from self.replay(last_event_id)
+            while True:
+                try:
+                    message = subscriber.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            self.broadcaster.unsubscribe(subscriber)
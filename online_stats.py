@@ -0,0 +1,227 @@
+"""
+Mergeable running statistics for the metric columns.
+
+OnlineStats keeps, for every pair of fields, the number of rows where both
+are present, the mean of each over those rows, their sums of squared
+deviations and their co-moment. Batches are folded in with the pairwise
+(Chan et al.) form of Welford's update, so accumulators built over separate
+shards (days, workers) can be merged exactly and means, variances, extrema
+and Pearson correlations are read off without touching the rows again.
+Missing values are skipped per column and per pair, as pandas does.
+
+StatsStore keeps one accumulator per day of a dataset plus their total,
+brought up to date incrementally as rows are appended.
+"""
+import bisect
+import threading
+
+import numpy as np
+import pandas as pd
+
+from rollups import to_ns
+
+DAY_NS = int(pd.Timedelta(days=1).value)
+
+
+class OnlineStats:
+    """
+    Running count, means, second moments and extrema of a set of fields.
+    """
+    def __init__(self, fields):
+        self.fields = list(fields)
+        self._index = {field: i for i, field in enumerate(self.fields)}
+        k = len(self.fields)
+        # Entry [i, j] describes field i over the rows where fields i and j are both present
+        self._n = np.zeros((k, k))
+        self._mean = np.zeros((k, k))
+        self._m2 = np.zeros((k, k))
+        self._comoment = np.zeros((k, k))
+        self._minimum = np.full(k, np.nan)
+        self._maximum = np.full(k, np.nan)
+
+    @classmethod
+    def from_columns(cls, columns, fields=None):
+        stats = cls(fields if fields is not None else list(columns))
+        stats.update(columns)
+        return stats
+
+    def _combine(self, n, mean, m2, comoment):
+        """
+        Merges moments of another set of rows into this accumulator.
+        """
+        total = self._n + n
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = mean - self._mean
+            weight = np.where(total > 0, n / total, 0.0)
+            cross = np.where(total > 0, self._n * n / total, 0.0)
+        delta = np.nan_to_num(delta)
+        self._comoment = self._comoment + comoment + delta * delta.T * cross
+        self._m2 = self._m2 + m2 + delta * delta * cross
+        self._mean = self._mean + delta * weight
+        self._n = total
+
+    def update(self, columns):
+        """
+        Folds a batch of rows (a mapping of field name to equal-length arrays) in.
+        """
+        values = np.column_stack([np.asarray(columns[field], dtype=float) for field in self.fields])
+        if len(values) == 0:
+            return self
+        valid = ~np.isnan(values)
+        weights = valid.astype(float)
+
+        # Shift by the column means first so the sums below don't lose precision
+        with np.errstate(invalid='ignore'):
+            shift = np.nanmean(np.where(valid.any(axis=0), values, 0.0), axis=0)
+        centered = np.where(valid, values - shift, 0.0)
+
+        n = weights.T @ weights
+        sums = centered.T @ weights
+        squares = (centered * centered).T @ weights
+        products = centered.T @ centered
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(n > 0, sums / n, 0.0)
+        m2 = squares - mean * sums
+        comoment = products - mean * sums.T
+        self._combine(n, mean + shift[:, None], np.maximum(m2, 0.0), comoment)
+
+        self._minimum = np.fmin(self._minimum, np.fmin.reduce(values, axis=0))
+        self._maximum = np.fmax(self._maximum, np.fmax.reduce(values, axis=0))
+        return self
+
+    def merge(self, other):
+        """
+        Folds another accumulator over the same fields in, as if its rows had been added.
+        """
+        if other.fields != self.fields:
+            raise ValueError("Cannot merge statistics over different fields")
+        self._combine(other._n, other._mean, other._m2, other._comoment)
+        self._minimum = np.fmin(self._minimum, other._minimum)
+        self._maximum = np.fmax(self._maximum, other._maximum)
+        return self
+
+    def count(self, field):
+        i = self._index[field]
+        return int(self._n[i, i])
+
+    def mean(self, field):
+        i = self._index[field]
+        return float(self._mean[i, i]) if self._n[i, i] else np.nan
+
+    def var(self, field):
+        i = self._index[field]
+        return float(self._m2[i, i] / (self._n[i, i] - 1)) if self._n[i, i] > 1 else np.nan
+
+    def std(self, field):
+        return float(np.sqrt(self.var(field)))
+
+    def min(self, field):
+        return float(self._minimum[self._index[field]])
+
+    def max(self, field):
+        return float(self._maximum[self._index[field]])
+
+    def corr(self, a, b):
+        """
+        Pearson correlation over the rows where both fields are present.
+        """
+        i, j = self._index[a], self._index[b]
+        denominator = np.sqrt(self._m2[i, j] * self._m2[j, i])
+        if self._n[i, j] < 2 or denominator == 0:
+            return np.nan
+        return float(np.clip(self._comoment[i, j] / denominator, -1.0, 1.0))
+
+
+class StatsStore:
+    """
+    Daily OnlineStats shards of a dataset and their running total.
+    """
+    def __init__(self, fields, width=DAY_NS):
+        self.fields = list(fields)
+        self.width = width
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.version = None
+        self.first = None
+        self._starts = []
+        self._shards = {}
+        self.total = OnlineStats(self.fields)
+
+    def _add(self, ts_ns, columns):
+        # Rows are sorted, so each shard is one contiguous slice
+        buckets = ts_ns - ts_ns % self.width
+        starts, offsets = np.unique(buckets, return_index=True)
+        bounds = list(offsets) + [len(ts_ns)]
+        for start, lo, hi in zip(starts.tolist(), bounds[:-1], bounds[1:]):
+            shard = self._shards.get(start)
+            if shard is None:
+                shard = self._shards[start] = OnlineStats(self.fields)
+                self._starts.append(start)
+            shard.update({field: columns[field][lo:hi] for field in self.fields})
+
+    def sync(self, dataset):
+        """
+        Brings the shards up to date with a dataset snapshot. When the snapshot
+        extends the previous one, only its last day is rebuilt and newer rows
+        added; otherwise every shard is rebuilt.
+        """
+        if self.version == dataset.version:
+            return
+        with self._lock:
+            if self.version == dataset.version:
+                return
+            ts_ns = to_ns(dataset.column('timestamp'))
+            if not len(ts_ns) or ts_ns[0] != self.first or not self._starts:
+                self._reset()
+                lo = 0
+            else:
+                # The last day may have changed (e.g. its final bucket gained rows), so it is redone
+                last = self._starts.pop()
+                del self._shards[last]
+                lo = int(np.searchsorted(ts_ns, last, side='left'))
+            self._add(ts_ns[lo:], {field: dataset.column(field)[lo:] for field in self.fields})
+            total = OnlineStats(self.fields)
+            for start in self._starts:
+                total.merge(self._shards[start])
+            self.total = total
+            self.first = ts_ns[0] if len(ts_ns) else None
+            self.version = dataset.version
+
+    def summary(self, dataset, lo=0, hi=None):
+        """
+        Returns OnlineStats for rows [lo, hi) of a dataset: whole days come from
+        their shards and only rows of partially covered days are scanned.
+        """
+        hi = len(dataset) if hi is None else hi
+        with self._lock:
+            self.sync(dataset)
+            if lo == 0 and hi == len(dataset):
+                return self.total
+            result = OnlineStats(self.fields)
+            if lo >= hi:
+                return result
+            ts_ns = to_ns(dataset.column('timestamp'))
+
+            # Shrink [lo, hi) to the rows of the days it covers completely
+            first_day = ts_ns[lo] - ts_ns[lo] % self.width
+            whole_lo = lo
+            if lo > 0 and ts_ns[lo - 1] >= first_day:
+                whole_lo = int(np.searchsorted(ts_ns, first_day + self.width, side='left'))
+            last_day = ts_ns[hi - 1] - ts_ns[hi - 1] % self.width
+            whole_hi = hi
+            if hi < len(ts_ns) and ts_ns[hi] < last_day + self.width:
+                whole_hi = int(np.searchsorted(ts_ns, last_day, side='left'))
+
+            if whole_lo >= whole_hi:
+                whole_lo = whole_hi = hi
+            else:
+                first = bisect.bisect_left(self._starts, ts_ns[whole_lo] - ts_ns[whole_lo] % self.width)
+                last = bisect.bisect_right(self._starts, ts_ns[whole_hi - 1])
+                for start in self._starts[first:last]:
+                    result.merge(self._shards[start])
+            for a, b in ((lo, whole_lo), (whole_hi, hi)):
+                if a < b:
+                    result.update({field: dataset.column(field)[a:b] for field in self.fields})
+            return result
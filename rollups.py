@@ -0,0 +1,385 @@
+"""
+Pre-aggregated rollups of the metric columns at 10-minute, hourly and daily
+granularity.
+
+Every level keeps count, sum, min, max and sum of squares per metric and per
+bucket, so means, extremes and standard deviations over any range can be
+combined from buckets without touching raw rows. When a new snapshot only
+appends to the previous one, its new rows are folded into the existing
+buckets and only the last day is recomputed; whether it is an append is
+checked against a digest of the rows kept, since cleaning can rewrite
+history (gap fills use the column mean) as well as extend it.
+"""
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+# (name, bucket width) from finest to coarsest; each width divides the next
+LEVELS = [
+    ('10m', pd.Timedelta(minutes=10)),
+    ('1h', pd.Timedelta(hours=1)),
+    ('1d', pd.Timedelta(days=1))
+]
+
+STATS = ('count', 'sum', 'min', 'max', 'sumsq')
+
+NAT = np.datetime64('NaT').astype('datetime64[ns]').view(np.int64)
+
+
+def to_ns(timestamps):
+    """
+    Returns timestamps as int64 nanoseconds since the epoch.
+    """
+    return np.asarray(timestamps).astype('datetime64[ns]').view(np.int64)
+
+
+def _empty_stats(size):
+    return {
+        'count': np.zeros(size, dtype=np.int64),
+        'sum': np.zeros(size),
+        'min': np.full(size, np.nan),
+        'max': np.full(size, np.nan),
+        'sumsq': np.zeros(size)
+    }
+
+
+def _bucket_stats(values, first):
+    """
+    Reduces sorted values into per-bucket stats; ``first`` holds bucket start offsets.
+    """
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    return {
+        'count': np.add.reduceat(valid.astype(np.int64), first),
+        'sum': np.add.reduceat(filled, first),
+        'min': np.fmin.reduceat(values, first),
+        'max': np.fmax.reduceat(values, first),
+        'sumsq': np.add.reduceat(filled * filled, first)
+    }
+
+
+def _merge_into(target, source, index=None):
+    """
+    Combines stats from source into target (at the given positions, if any).
+    """
+    index = slice(None) if index is None else index
+    target['count'][index] += source['count']
+    target['sum'][index] += source['sum']
+    target['sumsq'][index] += source['sumsq']
+    target['min'][index] = np.fmin(target['min'][index], source['min'])
+    target['max'][index] = np.fmax(target['max'][index], source['max'])
+
+
+class RollupLevel:
+    """
+    Buckets of one width, kept sorted by bucket start in growable arrays.
+    """
+    def __init__(self, name, width, metrics):
+        self.name = name
+        self.width = int(pd.Timedelta(width).value)
+        self.metrics = list(metrics)
+        self.size = 0
+        self._starts = np.empty(0, dtype=np.int64)
+        self._stats = {metric: _empty_stats(0) for metric in self.metrics}
+
+    @property
+    def starts(self):
+        return self._starts[:self.size]
+
+    def stats(self, metric):
+        return {stat: values[:self.size] for stat, values in self._stats[metric].items()}
+
+    def _reserve(self, extra):
+        needed = self.size + extra
+        if needed <= len(self._starts):
+            return
+        capacity = max(needed, 2 * len(self._starts), 64)
+        starts = np.empty(capacity, dtype=np.int64)
+        starts[:self.size] = self.starts
+        self._starts = starts
+        for metric in self.metrics:
+            grown = _empty_stats(capacity)
+            for stat in STATS:
+                grown[stat][:self.size] = self._stats[metric][stat][:self.size]
+            self._stats[metric] = grown
+
+    def add(self, ts_ns, columns):
+        """
+        Folds rows (int64 ns timestamps and a dict of value arrays) into the buckets.
+        """
+        if len(ts_ns) == 0:
+            return
+        buckets = ts_ns - ts_ns % self.width
+        order = np.argsort(buckets, kind='stable')
+        buckets = buckets[order]
+        new_starts, first = np.unique(buckets, return_index=True)
+        incoming = {
+            metric: _bucket_stats(np.asarray(columns[metric], dtype=float)[order], first)
+            for metric in self.metrics
+        }
+
+        starts = self.starts
+        pos = np.searchsorted(starts, new_starts)
+        existing = pos < self.size
+        existing[existing] = starts[pos[existing]] == new_starts[existing]
+
+        # Rows landing in buckets we already have are merged in place
+        if existing.any():
+            for metric in self.metrics:
+                _merge_into(
+                    {stat: self._stats[metric][stat] for stat in STATS},
+                    {stat: values[existing] for stat, values in incoming[metric].items()},
+                    pos[existing]
+                )
+
+        fresh = ~existing
+        count = int(fresh.sum())
+        if not count:
+            return
+        if self.size == 0 or new_starts[fresh][0] > starts[-1]:
+            # Common case: new buckets extend the end of the series
+            self._reserve(count)
+            self._starts[self.size:self.size + count] = new_starts[fresh]
+            for metric in self.metrics:
+                for stat in STATS:
+                    self._stats[metric][stat][self.size:self.size + count] = incoming[metric][stat][fresh]
+            self.size += count
+            return
+
+        # Late rows for buckets before the end: rebuild the arrays with the new buckets inserted
+        insert_at = pos[fresh]
+        merged_starts = np.insert(starts, insert_at, new_starts[fresh])
+        merged_stats = {
+            metric: {
+                stat: np.insert(self._stats[metric][stat][:self.size], insert_at, incoming[metric][stat][fresh])
+                for stat in STATS
+            }
+            for metric in self.metrics
+        }
+        self._starts = merged_starts
+        self._stats = merged_stats
+        self.size = len(merged_starts)
+
+    def truncate(self, start):
+        """
+        Drops the buckets starting at or after ``start``.
+        """
+        self.size = int(np.searchsorted(self.starts, start, side='left'))
+
+    def bounds(self, lo, hi):
+        """
+        Returns positions of the buckets starting in [lo, hi).
+        """
+        starts = self.starts
+        return int(np.searchsorted(starts, lo, side='left')), int(np.searchsorted(starts, hi, side='left'))
+
+
+def summarize(stats):
+    """
+    Turns combined count/sum/min/max/sumsq into mean, min, max and sample std.
+    """
+    count = stats['count']
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = stats['sum'] / count
+        variance = (stats['sumsq'] - stats['sum'] * mean) / (count - 1)
+    std = np.sqrt(np.maximum(variance, 0.0))
+    return {'count': count, 'mean': mean, 'min': stats['min'], 'max': stats['max'], 'std': std}
+
+
+class RollupStore:
+    """
+    The rollup pyramid for a set of metrics.
+    """
+    def __init__(self, metrics, levels=LEVELS):
+        self.metrics = list(metrics)
+        self.levels = [RollupLevel(name, width, self.metrics) for name, width in levels]
+        self._by_name = {level.name: level for level in self.levels}
+        self._lock = threading.RLock()
+        self.version = None
+        self.first = None
+        self.last = None
+        # Rows before the last (coarsest) bucket at the previous sync, where that bucket
+        # starts, and running digests of those rows per column
+        self._kept = 0
+        self._tail = None
+        self._digests = None
+
+    def level(self, name):
+        return self._by_name[name]
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def _reset(self):
+        self.levels = [RollupLevel(level.name, level.width, self.metrics) for level in self.levels]
+        self._by_name = {level.name: level for level in self.levels}
+        self.first = None
+        self.last = None
+        self._kept = 0
+        self._tail = None
+        self._digests = None
+
+    def add_rows(self, timestamps, columns):
+        """
+        Adds new rows to every level. Cost is proportional to the number of new rows.
+        """
+        ts_ns = to_ns(timestamps)
+        valid = ts_ns != NAT
+        if not valid.all():
+            ts_ns = ts_ns[valid]
+            columns = {metric: np.asarray(columns[metric])[valid] for metric in self.metrics}
+        if len(ts_ns) == 0:
+            return
+        with self._lock:
+            for level in self.levels:
+                level.add(ts_ns, columns)
+            self.first = ts_ns.min() if self.first is None else min(self.first, ts_ns.min())
+            self.last = ts_ns.max() if self.last is None else max(self.last, ts_ns.max())
+
+    def _columns(self, dataset):
+        return [to_ns(dataset.column('timestamp'))] + [
+            np.asarray(dataset.column(metric), dtype=float) for metric in self.metrics
+        ]
+
+    @staticmethod
+    def _digest(columns, lo, hi, digests=None):
+        """
+        Feeds rows [lo, hi) of every column into per-column digests (new ones if not given).
+        """
+        digests = digests or [hashlib.sha1() for _ in columns]
+        for digest, values in zip(digests, columns):
+            digest.update(np.ascontiguousarray(values[lo:hi]).view(np.uint8))
+        return digests
+
+    def sync(self, dataset):
+        """
+        Brings the rollups up to date with a dataset snapshot. If its rows before
+        the last day seen are unchanged, that day is recomputed and newer rows
+        added; otherwise (rows inserted, removed or rewritten) the rollups are rebuilt.
+        """
+        if self.version == dataset.version:
+            return
+        with self._lock:
+            if self.version == dataset.version:
+                return
+            columns = self._columns(dataset)
+            ts_ns = columns[0]
+            lo = 0
+            digests = None
+            if self._digests is not None and len(ts_ns) >= self._kept:
+                digests = self._digest(columns, 0, self._kept)
+                if [d.digest() for d in digests] == [d.digest() for d in self._digests]:
+                    lo = self._kept
+                    for level in self.levels if self._tail is not None else ():
+                        level.truncate(self._tail)
+                else:
+                    digests = None
+            if digests is None:
+                self._reset()
+            self.add_rows(ts_ns[lo:].view('datetime64[ns]'), {
+                metric: values[lo:] for metric, values in zip(self.metrics, columns[1:])
+            })
+
+            # The last day can still change (its final rows are resampled again), so it is
+            # left out of the digest and recomputed on the next sync
+            valid = ts_ns[ts_ns != NAT]
+            self.first = valid.min() if len(valid) else None
+            self.last = valid.max() if len(valid) else None
+            width = self.levels[-1].width
+            self._tail = None if self.last is None else self.last - self.last % width
+            kept = lo if self._tail is None else int(np.searchsorted(ts_ns, self._tail, side='left'))
+            self._digests = self._digest(columns, lo, kept, digests)
+            self._kept = kept
+            self.version = dataset.version
+
+    def series(self, name, start=None, end=None, metrics=None):
+        """
+        Returns a DataFrame with one row per bucket of a level whose start lies in
+        [start, end], with <metric>_mean/_min/_max/_std/_count columns.
+        """
+        metrics = self.metrics if metrics is None else metrics
+        level = self.level(name)
+        lo = np.iinfo(np.int64).min if start is None else pd.Timestamp(start).value - pd.Timestamp(start).value % level.width
+        hi = np.iinfo(np.int64).max if end is None else pd.Timestamp(end).value + 1
+        data = {}
+        with self._lock:
+            a, b = level.bounds(lo, hi)
+            data['timestamp'] = level.starts[a:b].copy().view('datetime64[ns]')
+            for metric in metrics:
+                summary = summarize({stat: values[a:b].copy() for stat, values in level.stats(metric).items()})
+                for stat, values in summary.items():
+                    data[f"{metric}_{stat}"] = values
+        return pd.DataFrame(data)
+
+    def means(self, name, start=None, end=None, metrics=None):
+        """
+        Returns bucket means shaped like a resampled frame (timestamp plus one
+        column per metric), skipping buckets with no values.
+        """
+        metrics = self.metrics if metrics is None else metrics
+        df = self.series(name, start, end, metrics)
+        counts = df[[f"{metric}_count" for metric in metrics]].to_numpy()
+        df = df[counts.sum(axis=1) > 0] if len(df) else df
+        return pd.DataFrame(
+            {'timestamp': df['timestamp'].to_numpy(), **{metric: df[f"{metric}_mean"].to_numpy() for metric in metrics}}
+        )
+
+    def _cover(self, lo, hi, index):
+        """
+        Splits [lo, hi) into (level, lo, hi) pieces, using the coarsest buckets
+        that fit entirely inside the range and finer ones at the edges.
+        """
+        if lo >= hi:
+            return []
+        level = self.levels[index]
+        if index == 0:
+            return [(level, lo, hi)]
+        full_lo = -(-lo // level.width) * level.width
+        full_hi = hi // level.width * level.width
+        if full_lo >= full_hi:
+            return self._cover(lo, hi, index - 1)
+        return (
+            [(level, full_lo, full_hi)]
+            + self._cover(lo, full_lo, index - 1)
+            + self._cover(full_hi, hi, index - 1)
+        )
+
+    def aggregate(self, start=None, end=None, metrics=None):
+        """
+        Returns {metric: {count, mean, min, max, std}} over [start, end],
+        at the granularity of the finest level.
+        """
+        metrics = self.metrics if metrics is None else metrics
+        with self._lock:
+            return self._aggregate(start, end, metrics)
+
+    def _aggregate(self, start, end, metrics):
+        finest = self.levels[0].width
+        pieces = []
+        if self.first is not None:
+            lo = self.first if start is None else pd.Timestamp(start).value
+            hi = self.last if end is None else pd.Timestamp(end).value
+            lo = lo - lo % finest
+            hi = hi - hi % finest + finest
+            pieces = self._cover(lo, hi, len(self.levels) - 1)
+
+        result = {}
+        for metric in metrics:
+            total = {stat: values[0] for stat, values in _empty_stats(1).items()}
+            for level, piece_lo, piece_hi in pieces:
+                a, b = level.bounds(piece_lo, piece_hi)
+                if a == b:
+                    continue
+                stats = level.stats(metric)
+                total['count'] += stats['count'][a:b].sum()
+                total['sum'] += stats['sum'][a:b].sum()
+                total['sumsq'] += stats['sumsq'][a:b].sum()
+                total['min'] = np.fmin(total['min'], np.fmin.reduce(stats['min'][a:b]))
+                total['max'] = np.fmax(total['max'], np.fmax.reduce(stats['max'][a:b]))
+            result[metric] = {
+                stat: int(value) if stat == 'count' else float(value)
+                for stat, value in summarize(total).items()
+            }
+        return result
@@ -0,0 +1,270 @@
+"""
+Cleaned datasets shared between processes through memory-mapped files.
+
+Loading and cleaning the data in every gunicorn worker would leave each
+worker with its own copy of the arrays. Instead, the first process to load
+a version of a dataset publishes the cleaned columns as ``.npy`` files in a
+directory named after the dataset and version, with a manifest recording
+the format, version, row count and column dtypes. Every process then
+memory-maps those files read-only, so the kernel keeps a single copy of the
+pages however many workers use them. The files go under /dev/shm when it
+exists, so they live in RAM rather than on disk.
+
+A version is written to a temporary directory and renamed into place, so
+readers only ever see complete versions. When two processes publish the
+same version at once, one rename wins and the other process maps the
+winner's files. Each dataset also has a pointer file naming its latest
+published version, so a version published by a forced reload (which the
+data files' metadata can't name) is found by every process.
+
+Every process holds a shared flock on the manifest of the version it
+serves. Publishing removes all versions, of any dataset, that no process
+holds, such as those left by older code or other data paths; processes
+still mapping a removed version keep reading its pages until they move on,
+since files unlinked while mapped stay readable.
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+POINTER_SUFFIX = '.current'
+
+# Temporary directories older than this are assumed to be left over from a crashed publisher
+TMP_TIMEOUT = 3600
+# Versions younger than this are never removed, so their publisher has time to map and hold them
+MIN_AGE = 60
+
+
+def _default_dir():
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'smart-city-datasets')
+
+
+# Where shared datasets are published; set SHARED_DATASET_DIR to an empty string to keep datasets private
+SHARED_DIR = os.environ.get('SHARED_DATASET_DIR', _default_dir())
+
+
+def _code_stamp(loader):
+    # Changing the loading code must not reuse columns published by the old code
+    stamps = []
+    for module_name in (loader.__module__, __name__, 'dataset'):
+        module = sys.modules.get(module_name)
+        try:
+            stamps.append(os.stat(module.__file__).st_mtime_ns)
+        except (AttributeError, OSError, TypeError):
+            stamps.append(None)
+    return stamps
+
+
+def dataset_key(path, loader):
+    """
+    Names the shared copies of the data at ``path`` as produced by ``loader``.
+    """
+    source = path if '://' in path else os.path.abspath(path)
+    identity = f"{source}|{loader.__module__}.{loader.__qualname__}|{_code_stamp(loader)}"
+    return hashlib.sha1(identity.encode()).hexdigest()[:16]
+
+
+def shareable_columns(df):
+    """
+    Returns the frame's columns as arrays that can be saved without pickling,
+    or None if a column can't be (text columns become fixed-width unicode).
+    """
+    columns = {}
+    for name in df.columns:
+        values = df[name].to_numpy()
+        if values.dtype.kind in 'OT':
+            if not all(isinstance(value, str) for value in values):
+                return None
+            values = values.astype(str)
+        elif values.dtype.kind not in 'biufmM':
+            return None
+        columns[str(name)] = np.ascontiguousarray(values)
+    return columns
+
+
+def _version_dir(directory, key, version):
+    return os.path.join(directory, f"{key}-{version}")
+
+
+def _pointer_path(directory, key):
+    return os.path.join(directory, f"{key}{POINTER_SUFFIX}")
+
+
+def current_version(directory, key):
+    """
+    Returns the version last published for ``key``, or None.
+    """
+    try:
+        with open(_pointer_path(directory, key)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _set_current_version(directory, key, version):
+    tmp_path = f"{_pointer_path(directory, key)}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, 'w') as f:
+            f.write(version)
+        os.replace(tmp_path, _pointer_path(directory, key))
+    except OSError as e:
+        logger.warning(f"Could not record the current version of shared dataset {key}: {e}")
+
+
+def hold(directory, key, version):
+    """
+    Marks a published version as in use by this process until release() is
+    called with the returned handle, so other processes don't remove it.
+    Returns None if it can't be held.
+    """
+    if fcntl is None:
+        return None
+    try:
+        fd = os.open(os.path.join(_version_dir(directory, key, version), MANIFEST_NAME), os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except OSError:
+        # It is being removed; the mapped pages stay readable regardless
+        os.close(fd)
+        return None
+    return fd
+
+
+def release(handle):
+    if handle is not None:
+        os.close(handle)
+
+
+def open_columns(directory, key, version):
+    """
+    Memory-maps a published version read-only. Returns None if it hasn't
+    been published (or was removed meanwhile).
+    """
+    version_dir = _version_dir(directory, key, version)
+    try:
+        with open(os.path.join(version_dir, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        if manifest.get('format_version') != FORMAT_VERSION or manifest.get('version') != version:
+            return None
+        columns = {
+            name: np.load(os.path.join(version_dir, f"{i}.npy"), mmap_mode='r', allow_pickle=False)
+            for i, name in enumerate(manifest['columns'])
+        }
+    except (OSError, ValueError, KeyError):
+        return None
+    if any(len(values) != manifest['rows'] for values in columns.values()):
+        return None
+    return columns
+
+
+def publish(directory, key, version, df):
+    """
+    Publishes a cleaned frame as ``version`` and returns its columns
+    memory-mapped from the shared files. Returns None if the frame can't be
+    shared or the files can't be written.
+    """
+    columns = shareable_columns(df)
+    if columns is None:
+        logger.info(f"Dataset {key} has columns that can't be shared; keeping it private")
+        return None
+
+    tmp_dir = os.path.join(directory, f".tmp-{key}-{uuid.uuid4().hex[:12]}")
+    try:
+        os.makedirs(tmp_dir)
+        for i, values in enumerate(columns.values()):
+            np.save(os.path.join(tmp_dir, f"{i}.npy"), values, allow_pickle=False)
+        manifest = {
+            'format_version': FORMAT_VERSION,
+            'version': version,
+            'rows': len(df),
+            'columns': {name: values.dtype.str for name, values in columns.items()},
+            'pid': os.getpid()
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f)
+        try:
+            os.rename(tmp_dir, _version_dir(directory, key, version))
+            logger.info(f"Published shared dataset {key} version {version} ({len(df)} rows)")
+        except OSError:
+            # Another process published this version first
+            pass
+    except OSError as e:
+        logger.warning(f"Could not publish shared dataset to {directory}: {e}")
+        return None
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    _set_current_version(directory, key, version)
+    remove_unused(directory, keep=os.path.basename(_version_dir(directory, key, version)))
+    return open_columns(directory, key, version)
+
+
+def _in_use(version_dir):
+    if fcntl is None:
+        return True
+    try:
+        if time.time() - os.path.getmtime(version_dir) < MIN_AGE:
+            return True
+        fd = os.open(os.path.join(version_dir, MANIFEST_NAME), os.O_RDONLY)
+    except OSError:
+        # Not a complete version
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return False
+    except OSError:
+        return True
+    finally:
+        os.close(fd)
+
+
+def remove_unused(directory, keep=None):
+    """
+    Removes every version no process holds (other than ``keep``), along with
+    pointers to datasets that have no versions left and stale temporary directories.
+    """
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    versions = set()
+    for name in names:
+        path = os.path.join(directory, name)
+        if name.startswith('.tmp-'):
+            try:
+                if time.time() - os.path.getmtime(path) > TMP_TIMEOUT:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+        elif os.path.isdir(path):
+            if name == keep or _in_use(path):
+                versions.add(name.split('-', 1)[0])
+            else:
+                shutil.rmtree(path, ignore_errors=True)
+                logger.info(f"Removed unused shared dataset {name}")
+    for name in names:
+        if name.endswith(POINTER_SUFFIX) and name[:-len(POINTER_SUFFIX)] not in versions:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
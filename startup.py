@@ -0,0 +1,75 @@
+"""
+Reports how long the app takes to become ready to serve:
+
+    python startup.py app --path /api/dashboard --path /api/smart-city-data
+
+prints the time to import the app module in a fresh interpreter (from
+``python -X importtime``) with the packages that account for most of it,
+how long its warm_up() takes and the latency of a first request to each path.
+"""
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_times(module):
+    """
+    Imports ``module`` in a fresh interpreter and returns the total import time
+    and the time spent importing each top-level package, in seconds.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        capture_output=True, text=True, cwd=PROJECT_DIR
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    packages = {}
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0.0) + int(own) / 1e6
+        if name == module:
+            total = int(cumulative) / 1e6
+    return total, packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import, warm-up and first-request times")
+    parser.add_argument('module', nargs='?', default='app', help="application module (app or app_new)")
+    parser.add_argument('--path', action='append', help="path to request after warm-up (repeatable)")
+    parser.add_argument('--top', type=int, default=10, help="number of packages to list")
+    args = parser.parse_args()
+    paths = args.path or ['/api/dashboard']
+
+    total, packages = import_times(args.module)
+    print(f"import {args.module}: {total:.2f}s in a fresh interpreter")
+    for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {package:<24} {seconds:.3f}s")
+
+    sys.path.insert(0, PROJECT_DIR)
+    started = time.perf_counter()
+    module = importlib.import_module(args.module)
+    print(f"import {args.module}: {time.perf_counter() - started:.2f}s in this process")
+    if hasattr(module, 'warm_up'):
+        started = time.perf_counter()
+        module.warm_up()
+        print(f"warm_up(): {time.perf_counter() - started:.2f}s")
+
+    client = module.app.test_client()
+    for path in paths:
+        started = time.perf_counter()
+        response = client.get(path)
+        print(f"GET {path}: {response.status_code} in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Incremental JSON serialization for large column arrays.
+
+stream_json() walks a response template and yields the JSON text piece by
+piece. Leaves wrapped in StreamedColumn are serialized CHUNK_SIZE values at
+a time, so only one chunk is ever converted to Python objects and the first
+bytes can be sent before the whole body has been produced.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+CHUNK_SIZE = 5000
+
+
+class StreamedColumn:
+    """
+    An array to be serialized in chunks, with an optional per-chunk transform
+    (e.g. timestamp formatting or NaN filling).
+    """
+    def __init__(self, values, transform=None, chunk_size=CHUNK_SIZE):
+        self.values = values
+        self.transform = transform
+        self.chunk_size = chunk_size
+
+    def chunks(self):
+        for start in range(0, len(self.values), self.chunk_size):
+            chunk = self.values[start:start + self.chunk_size]
+            if self.transform is not None:
+                chunk = self.transform(chunk)
+            yield list(chunk) if isinstance(chunk, (list, pd.Index)) else np.asarray(chunk).tolist()
+
+
+def format_timestamps(fmt):
+    """
+    Returns a chunk transform that formats datetime64 values with strftime.
+    """
+    return lambda chunk: pd.DatetimeIndex(chunk).strftime(fmt)
+
+
+def fill_nan(value):
+    """
+    Returns a chunk transform that replaces NaN with ``value``.
+    """
+    return lambda chunk: np.where(np.isnan(chunk), value, chunk)
+
+
+def _stream_column(column):
+    yield '['
+    first = True
+    for chunk in column.chunks():
+        if not chunk:
+            continue
+        text = json.dumps(chunk)[1:-1]
+        yield text if first else ',' + text
+        first = False
+    yield ']'
+
+
+def stream_json(value):
+    """
+    Yields the JSON encoding of a template of dicts, lists, scalars and StreamedColumns.
+    """
+    if isinstance(value, StreamedColumn):
+        yield from _stream_column(value)
+    elif isinstance(value, dict):
+        yield '{'
+        for i, (key, item) in enumerate(value.items()):
+            yield (',' if i else '') + json.dumps(str(key)) + ':'
+            yield from stream_json(item)
+        yield '}'
+    elif isinstance(value, (list, tuple)):
+        yield '['
+        for i, item in enumerate(value):
+            if i:
+                yield ','
+            yield from stream_json(item)
+        yield ']'
+    else:
+        yield json.dumps(value)
+
+
+def buffered(parts, size=64 * 1024):
+    """
+    Coalesces small text pieces into chunks of roughly ``size`` bytes.
+    """
+    buffer = []
+    length = 0
+    for part in parts:
+        buffer.append(part)
+        length += len(part)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer)
@@ -0,0 +1,9 @@
+import os
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The app modules and the data logger are flat scripts, imported by module name
+for path in (PROJECT_DIR, os.path.join(PROJECT_DIR, 'datalogger')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
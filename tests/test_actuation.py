@@ -0,0 +1,86 @@
+"""
+ActuationLog checked against a plain list of every event appended.
+"""
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from actuation import COMMAND_TYPES, ActuationLog
+
+TARGETS = ['Downtown', 'Industrial', 'Harbor', 'Airport']
+
+
+START = 1_700_000_000.0
+
+
+def events(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return [
+        (COMMAND_TYPES[rng.integers(len(COMMAND_TYPES))], TARGETS[rng.integers(len(TARGETS))],
+         f"action {rng.integers(5)}")
+        for _ in range(count)
+    ]
+
+
+def fill(log, all_events, batch_sizes):
+    """
+    Appends the events in batches of the given sizes, one batch (numbered from 1)
+    a minute. Returns every event appended as (time, batch, event).
+    """
+    appended, position = [], 0
+    for batch, size in enumerate(batch_sizes, 1):
+        chunk = all_events[position:position + size]
+        timestamp = START + 60 * batch
+        log.append(chunk, batch, timestamp)
+        appended += [(timestamp, batch, event) for event in chunk]
+        position += size
+    return appended
+
+
+def expected(appended, capacity, target=None, command=None, since=None, until=None, limit=100):
+    matching = [
+        {'time': datetime.fromtimestamp(timestamp).isoformat(), 'batch': batch, 'command': event[0],
+         'target': event[1], 'detail': event[2]}
+        for timestamp, batch, event in appended[-capacity:]
+        if (target is None or event[1] == target) and (command is None or event[0] == command)
+        and (since is None or timestamp >= since) and (until is None or timestamp <= until)
+    ]
+    return matching[::-1][:limit]
+
+
+@pytest.mark.parametrize('capacity, batch_sizes', [(1000, [5, 10, 1]), (10, [3, 4, 5, 7, 1]), (7, [20]), (5, [5, 5])])
+def test_query_returns_the_newest_events_first(capacity, batch_sizes):
+    log = ActuationLog(capacity)
+    appended = fill(log, events(sum(batch_sizes)), batch_sizes)
+    assert len(log) == min(len(appended), capacity)
+    assert log.query(limit=capacity) == expected(appended, capacity, limit=capacity)
+
+
+@pytest.mark.parametrize('filters', [
+    {'target': 'Harbor'},
+    {'command': 'ventilation'},
+    {'target': 'Downtown', 'command': 'public_alert'},
+    {'since': START + 300},
+    {'until': START + 420},
+    {'since': START + 240, 'until': START + 360, 'limit': 5},
+    {'limit': 3}
+])
+def test_filters_match_the_reference(filters):
+    log = ActuationLog(64)
+    appended = fill(log, events(100, seed=1), [10] * 10)
+    assert log.query(**filters) == expected(appended, 64, **filters)
+
+
+def test_unknown_targets_match_nothing():
+    log = ActuationLog(10)
+    fill(log, events(5), [5])
+    assert log.query(target='Nowhere') == []
+    assert ActuationLog(10).query() == []
+
+
+def test_single_commands_have_no_batch():
+    log = ActuationLog(10)
+    log.append([('ventilation', 'Harbor', 'increase')], timestamp=START)
+    assert log.query() == [{'time': datetime.fromtimestamp(START).isoformat(), 'batch': None,
+                            'command': 'ventilation', 'target': 'Harbor', 'detail': 'increase'}]
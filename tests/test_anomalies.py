@@ -0,0 +1,167 @@
+"""
+Anomaly scores checked against sample-by-sample references (pandas for the
+EWMA mean and the rolling median/MAD), and the batch detector against
+feeding it one reading at a time.
+"""
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from anomalies import ALPHA, MAD_SCALE, WARMUP, AnomalyDetector, detect, ewma_scores, robust_scores
+
+FIELDS = ['pm2_5', 'no2']
+
+
+def series(rows=500, seed=0, missing=0.05):
+    rng = np.random.default_rng(seed)
+    values = 100 + np.cumsum(rng.standard_normal(rows)) + 3 * rng.standard_normal(rows)
+    values[rng.random(rows) < missing] = np.nan
+    return values
+
+
+def reference_ewma(values, alpha=ALPHA, warmup=WARMUP):
+    """
+    The EWMA z-score recurrences one sample at a time.
+    """
+    scores = np.full(len(values), np.nan)
+    expected = np.full(len(values), np.nan)
+    mean, var, count = None, 0.0, 0
+    for i, value in enumerate(values):
+        if np.isnan(value):
+            continue
+        mean = value if mean is None else mean
+        deviation = value - mean
+        if count >= warmup and var > 0:
+            scores[i] = deviation / np.sqrt(var)
+        expected[i] = mean
+        mean, var, count = mean + alpha * deviation, (1 - alpha) * (var + alpha * deviation ** 2), count + 1
+    return scores, expected
+
+
+def test_ewma_matches_reference():
+    values = series()
+    scores, expected, state = ewma_scores(values)
+    reference_scores, reference_expected = reference_ewma(values)
+    np.testing.assert_allclose(scores, reference_scores, rtol=1e-9)
+    np.testing.assert_allclose(expected, reference_expected, rtol=1e-12)
+
+    # The expected value is the pandas EWMA of the samples before each one
+    present = values[~np.isnan(values)]
+    ewm = pd.Series(present).ewm(alpha=ALPHA, adjust=False).mean().to_numpy()
+    np.testing.assert_allclose(expected[~np.isnan(values)], np.concatenate([[present[0]], ewm[:-1]]), rtol=1e-12)
+    assert state[0] == pytest.approx(ewm[-1], rel=1e-12)
+    assert state[2] == len(present)
+
+
+def test_ewma_continues_from_state():
+    values = series(seed=1)
+    whole, whole_expected, whole_state = ewma_scores(values)
+    state, parts, expected = None, [], []
+    for chunk in np.array_split(values, [1, 5, 13, 200, 201, 450]):
+        scores, chunk_expected, state = ewma_scores(chunk, state=state)
+        parts.append(scores)
+        expected.append(chunk_expected)
+    np.testing.assert_allclose(np.concatenate(parts), whole, rtol=1e-9)
+    np.testing.assert_allclose(np.concatenate(expected), whole_expected, rtol=1e-12)
+    np.testing.assert_allclose(state, whole_state, rtol=1e-12)
+
+
+def test_missing_samples_leave_the_state_unchanged():
+    values = series(seed=2, missing=0.3)
+    scores, _, state = ewma_scores(values)
+    present = ~np.isnan(values)
+    compact, _, compact_state = ewma_scores(values[present])
+    assert np.isnan(scores[~present]).all()
+    np.testing.assert_allclose(scores[present], compact, rtol=1e-12)
+    assert state == compact_state
+    assert ewma_scores(np.full(5, np.nan))[2] is None
+
+
+def test_robust_scores_match_pandas():
+    values = series(rows=400, seed=3, missing=0.2)
+    window, min_periods = 48, 20
+    scores, medians = robust_scores(values, window, min_periods)
+
+    rolling = pd.Series(values).rolling(window, min_periods=min_periods)
+    expected_medians = rolling.median().shift(1).to_numpy(copy=True)
+    expected_mads = rolling.apply(lambda w: np.nanmedian(np.abs(w - np.nanmedian(w))), raw=True).shift(1).to_numpy(copy=True)
+    # Only samples with a full window behind them are scored
+    expected_medians[:window] = np.nan
+    np.testing.assert_allclose(medians, expected_medians, rtol=1e-12)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        expected_scores = np.where(expected_mads > 0, (values - expected_medians) / (MAD_SCALE * expected_mads),
+                                   np.nan)
+    expected_scores[:window] = np.nan
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-9)
+
+
+def readings(rows=300, seed=0, locations=('North', 'South')):
+    rng = np.random.default_rng(seed)
+    per_location = rows // len(locations)
+    timestamps = pd.date_range('2024-01-01', periods=per_location, freq='10min')
+    # A 45 minute silence at the second location
+    timestamps_south = timestamps.where(timestamps < timestamps[100], timestamps + pd.Timedelta(minutes=35))
+    df = pd.DataFrame({
+        'timestamp': np.concatenate([timestamps, timestamps_south]),
+        'location': np.repeat(locations, per_location),
+        **{field: 50 + rng.standard_normal(rows) for field in FIELDS}
+    })
+    df.loc[rng.random(rows) < 0.03, 'no2'] = np.nan
+    df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
+    # Spikes well after the warmup
+    df.loc[[60, 200], 'pm2_5'] = [90.0, 5.0]
+    return df
+
+
+def as_frame(anomalies):
+    df = pd.DataFrame(anomalies)
+    # Gaps have no field
+    df['field'] = df['field'].astype(object).where(df['field'].notna(), None)
+    return df.sort_values(['timestamp', 'location', 'kind', 'field'], kind='stable').reset_index(drop=True)
+
+
+def test_update_frame_matches_update():
+    df = readings()
+    batch = AnomalyDetector(FIELDS).update_frame(df)
+
+    detector = AnomalyDetector(FIELDS)
+    rows = []
+    for row in df.to_dict('records'):
+        rows += detector.update(row['timestamp'], row, row['location'])
+    pd.testing.assert_frame_equal(as_frame(batch), as_frame(rows), check_dtype=False, rtol=1e-9)
+
+
+def test_spikes_dropouts_and_gaps_are_found():
+    df = readings()
+    found = detect(df, FIELDS)
+    spikes = found[found['kind'] == 'spike']
+    assert set(zip(spikes['timestamp'], spikes['location'], spikes['field'])) >= {
+        (df['timestamp'][i], df['location'][i], 'pm2_5') for i in (60, 200)
+    }
+    assert (found['kind'] == 'dropout').sum() == df['no2'].isna().sum()
+    gaps = found[found['kind'] == 'gap']
+    assert gaps['location'].tolist() == ['South']
+    assert gaps['value'].tolist() == [45.0]
+
+
+def test_robust_detection_finds_the_spikes():
+    df = readings()
+    found = detect(df, FIELDS, method='robust', window=24)
+    spikes = found[found['kind'] == 'spike']
+    assert {(df['timestamp'][i], df['location'][i]) for i in (60, 200)} <= set(zip(spikes['timestamp'],
+                                                                                   spikes['location']))
+    with pytest.raises(ValueError):
+        detect(df, FIELDS, method='zscore')
+
+
+def test_state_survives_a_checkpoint():
+    df = readings()
+    whole = AnomalyDetector(FIELDS).update_frame(df)
+
+    first = AnomalyDetector(FIELDS)
+    head = first.update_frame(df.iloc[:150])
+    state = json.loads(json.dumps(first.state()))
+    tail = AnomalyDetector(FIELDS, state=state).update_frame(df.iloc[150:])
+    pd.testing.assert_frame_equal(as_frame(pd.concat([head, tail])), as_frame(whole), rtol=1e-9)
@@ -0,0 +1,110 @@
+"""
+Runs the collector against the stub providers in stub_providers.py.
+"""
+import asyncio
+import csv
+
+import aiohttp
+from aiohttp.test_utils import TestServer
+
+import stub_providers
+from collector import Collector, Location, Provider, Route
+from data_loggernew import AIR_QUALITY_SCHEMA, TRAFFIC_SCHEMA
+from writer import BatchWriter, read_records
+
+LOCATIONS = [Location(f"Site {i}", 28.6 + i / 100, 77.2) for i in range(4)]
+ROUTES = [Route(f"Route {i}", f"Origin {i}", f"Destination {i}", location=f"Site {i}") for i in range(3)]
+
+
+def collect(app, rounds=1, timeout=5.0, retries=2, on_air_quality=None, on_traffic=None):
+    """
+    Serves ``app`` on a local port and runs the collector against it for
+    ``rounds`` rounds. Returns the stub's /stats and the rows of each round.
+    """
+    rows = {'air_quality': [], 'traffic': []}
+
+    async def run():
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            options = dict(concurrency=2, timeout=timeout, retries=retries, backoff=0.01)
+            collector = Collector(
+                LOCATIONS,
+                ROUTES,
+                Provider('openweather', str(server.make_url('/data/2.5/air_pollution')), 'key', **options),
+                Provider('directions', str(server.make_url('/maps/api/directions/json')), 'key', **options),
+                on_air_quality=on_air_quality or rows['air_quality'].append,
+                on_traffic=on_traffic or rows['traffic'].append,
+                interval=0.05,
+                jitter=0.0
+            )
+            await collector.run(rounds=rounds)
+            async with aiohttp.ClientSession() as session:
+                async with session.get(server.make_url('/stats')) as response:
+                    return await response.json()
+        finally:
+            await server.close()
+
+    return asyncio.run(run()), rows
+
+
+def test_collects_every_site_over_pooled_connections():
+    stats, rows = collect(stub_providers.make_app(), rounds=3)
+
+    assert len(rows['air_quality']) == 3
+    assert len(rows['traffic']) == 3
+    last_air_quality, last_traffic = rows['air_quality'][-1], rows['traffic'][-1]
+    assert sorted(row['location'] for row in last_air_quality) == [location.name for location in LOCATIONS]
+    assert sorted(row['route'] for row in last_traffic) == [route.name for route in ROUTES]
+    for row in last_traffic:
+        assert row['duration_in_traffic_s'] >= row['duration_s']
+        assert row['location'] == row['route'].replace('Route', 'Site')
+
+    assert stats['requests'] == 3 * (len(LOCATIONS) + len(ROUTES))
+    # Two keep-alive sessions with two connections each, reused across rounds
+    assert stats['connections'] <= 4
+    assert stats['max_in_flight'] <= 4
+
+
+def test_retries_server_errors():
+    stats, rows = collect(stub_providers.make_app(failures=2), retries=2)
+
+    # The first two answers of each API are 503s, retried within the round
+    assert len(rows['air_quality'][0]) == len(LOCATIONS)
+    assert len(rows['traffic'][0]) == len(ROUTES)
+    assert stats['requests'] == len(LOCATIONS) + len(ROUTES) + 2 * 2
+
+
+def test_gives_up_after_retries():
+    stats, rows = collect(stub_providers.make_app(failures=100), retries=1)
+
+    assert rows == {'air_quality': [], 'traffic': []}
+    assert stats['requests'] == 2 * (len(LOCATIONS) + len(ROUTES))
+
+
+def test_drops_timed_out_requests():
+    stats, rows = collect(stub_providers.make_app(delay=1.0), timeout=0.05, retries=0)
+
+    # Stub responses take up to 2s, so most requests time out; the round still completes
+    collected = sum(len(batch) for batch in rows['air_quality'] + rows['traffic'])
+    assert collected < len(LOCATIONS) + len(ROUTES)
+    assert stats['requests'] == len(LOCATIONS) + len(ROUTES)
+
+
+def test_writes_batches(tmp_path):
+    air_quality = BatchWriter(str(tmp_path), 'air_quality', AIR_QUALITY_SCHEMA, batch_size=10, rotate_daily=False)
+    traffic = BatchWriter(str(tmp_path), 'traffic_data', TRAFFIC_SCHEMA, fmt='binary', batch_size=10,
+                          rotate_daily=False)
+    with air_quality, traffic:
+        collect(stub_providers.make_app(), rounds=2, on_air_quality=air_quality.write, on_traffic=traffic.write)
+
+    with open(tmp_path / 'air_quality.csv', newline='') as f:
+        written = list(csv.DictReader(f))
+    assert len(written) == 2 * len(LOCATIONS)
+    assert list(written[0]) == [name for name, _ in AIR_QUALITY_SCHEMA]
+    assert {row['location'] for row in written} == {location.name for location in LOCATIONS}
+
+    records = read_records(str(tmp_path / 'traffic_data.bin'))
+    assert len(records) == 2 * len(ROUTES)
+    assert {name.decode() for name in records['route']} == {route.name for route in ROUTES}
+    assert (records['duration_in_traffic_s'] >= records['duration_s']).all()
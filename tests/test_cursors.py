@@ -0,0 +1,76 @@
+"""
+Delta cursors: paging through a growing, tied timestamp array must deliver
+every row exactly once.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from timeseries import QueryError, cursor_position, make_cursor
+
+
+def timestamps(rows, seed=0, start='2024-01-01'):
+    """
+    Sorted timestamps with runs of equal values (several locations per reading).
+    """
+    minutes = np.cumsum(np.random.default_rng(seed).choice([0, 0, 10], rows))
+    return (pd.Timestamp(start) + pd.to_timedelta(minutes, unit='min')).to_numpy()
+
+
+def page(ts, cursor, limit):
+    lo = cursor_position(ts, cursor)
+    hi = min(len(ts), lo + limit)
+    return list(range(lo, hi)), make_cursor(ts, hi)
+
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 7, 1000])
+def test_pages_deliver_every_row_once(limit):
+    ts = timestamps(500)
+    delivered, cursor = [], '0.0'
+    while True:
+        rows, cursor = page(ts, cursor, limit)
+        if not rows:
+            break
+        delivered += rows
+    assert delivered == list(range(len(ts)))
+
+
+@pytest.mark.parametrize('limit', [1, 3, 50])
+def test_rows_appended_between_pages_are_delivered(limit):
+    full = timestamps(300, seed=1)
+    # Appended rows may share the last timestamp already delivered
+    sizes = [40, 41, 100, 101, 250, 300]
+    delivered, cursor = [], '0.0'
+    for size in sizes:
+        ts = full[:size]
+        while True:
+            rows, cursor = page(ts, cursor, limit)
+            if not rows:
+                break
+            delivered += rows
+    assert delivered == list(range(len(full)))
+
+
+def test_cursor_counts_ties():
+    ts = pd.to_datetime(['2024-01-01 00:00', '2024-01-01 00:10', '2024-01-01 00:10',
+                         '2024-01-01 00:10', '2024-01-01 00:20']).to_numpy()
+    assert make_cursor(ts, 0) == '0.0'
+    value = pd.Timestamp('2024-01-01 00:10').value
+    assert make_cursor(ts, 2) == f"{value}.1"
+    assert make_cursor(ts, 4) == f"{value}.3"
+    for position in range(len(ts) + 1):
+        assert cursor_position(ts, make_cursor(ts, position)) == position
+
+
+def test_cursor_for_rows_that_went_away():
+    ts = timestamps(100)
+    cursor = make_cursor(ts, 60)
+    # A smaller dataset (e.g. a reloaded history) resumes after whatever precedes the cursor
+    assert cursor_position(ts[:30], cursor) == 30
+    assert cursor_position(ts[:0], cursor) == 0
+
+
+@pytest.mark.parametrize('cursor', ['', 'abc', '1.2.3', '12', None])
+def test_invalid_cursors_are_rejected(cursor):
+    with pytest.raises(QueryError):
+        cursor_position(timestamps(10), cursor)
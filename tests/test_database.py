@@ -0,0 +1,81 @@
+"""
+ReadingStore round trips against the frames written, on a SQLite file.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import database
+from database import DEFAULT_LOCATION, READING_FIELDS, ReadingStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    url = f"sqlite:///{tmp_path / 'readings.db'}"
+    yield ReadingStore(url)
+    database.dispose_engines()
+
+
+def readings(rows=200, seed=0, locations=('North', 'South')):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'timestamp': np.repeat(pd.date_range('2024-01-01', periods=rows // len(locations), freq='10min'),
+                               len(locations)),
+        'location': list(locations) * (rows // len(locations)),
+        **{field: rng.uniform(0, 300, rows) for field in READING_FIELDS}
+    })
+    df.loc[rng.random(rows) < 0.1, 'no2'] = np.nan
+    return df
+
+
+def test_round_trip(store):
+    df = readings()
+    assert store.insert_frame(df) == len(df)
+    result = store.query()
+    expected = df.sort_values(['timestamp', 'location'], kind='stable').reset_index(drop=True)
+    # Timestamps are stored in whole seconds
+    pd.testing.assert_frame_equal(result, expected[['timestamp', 'location'] + READING_FIELDS],
+                                  check_dtype=False, check_exact=False, rtol=1e-12)
+
+
+def test_range_and_location_filters(store):
+    df = readings()
+    store.insert_frame(df)
+    start, end = df['timestamp'].iloc[40], df['timestamp'].iloc[120]
+    result = store.query(start=start, end=end, location='South', fields=['aqi'])
+    expected = df[(df['timestamp'] >= start) & (df['timestamp'] <= end) & (df['location'] == 'South')]
+    np.testing.assert_array_equal(result['timestamp'].to_numpy(), expected['timestamp'].to_numpy())
+    np.testing.assert_allclose(result['aqi'].to_numpy(), expected['aqi'].to_numpy())
+    assert list(result.columns) == ['timestamp', 'location', 'aqi']
+
+
+def test_rows_for_an_existing_reading_replace_it(store):
+    df = readings()
+    store.insert_frame(df)
+    changed = df.iloc[:10].assign(aqi=-1.0)
+    store.insert_frame(changed)
+    result = store.query()
+    assert len(result) == len(df)
+    assert (result['aqi'] == -1.0).sum() == 10
+
+
+def test_missing_locations_use_the_default(store):
+    df = readings(rows=4)
+    # One row at each timestamp, so the defaulted rows don't replace each other
+    df.loc[df.index[::2], 'location'] = np.nan
+    store.insert_frame(df)
+    locations = store.query()['location']
+    assert sorted(locations.unique()) == sorted({DEFAULT_LOCATION, *df['location'].dropna()})
+    assert (locations == DEFAULT_LOCATION).sum() == 2
+    assert 'nan' not in set(locations)
+
+
+def test_summary_matches_pandas(store):
+    df = readings()
+    latest, means = store.summary(['aqi'])
+    assert latest is None and np.isnan(means['aqi'])
+    store.insert_frame(df)
+    latest, means = store.summary(['aqi', 'no2'])
+    assert latest == df['timestamp'].max()
+    assert means['aqi'] == pytest.approx(df['aqi'].mean(), rel=1e-12)
+    assert means['no2'] == pytest.approx(df['no2'].mean(), rel=1e-12)
@@ -0,0 +1,134 @@
+"""
+DatasetCache reloads: when the data files' signature changes, on reload(),
+and the snapshots it hands out.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import columnar
+from dataset import Dataset, DatasetCache
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'merged.csv'
+    write(path, rows=50)
+    return str(path)
+
+
+def write(path, rows):
+    pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=rows, freq='10min'),
+        'aqi': np.arange(rows, dtype=float)
+    }).to_csv(path, index=False)
+
+
+def counting_loader():
+    def load(path):
+        load.calls += 1
+        if not os.path.exists(path):
+            return None
+        return pd.read_csv(path, parse_dates=['timestamp'])
+    load.calls = 0
+    return load
+
+
+def private_cache(source, loader):
+    return DatasetCache(source, loader=loader, shared_dir='')
+
+
+def test_unchanged_files_are_loaded_once(source):
+    loader = counting_loader()
+    cache = private_cache(source, loader)
+    first = cache.get()
+    assert cache.get() is first
+    assert cache.version == first.version == cache.file_version()
+    assert loader.calls == 1
+    np.testing.assert_array_equal(first.column('aqi'), np.arange(50))
+
+
+def test_new_data_is_loaded_on_the_next_get(source):
+    loader = counting_loader()
+    cache = private_cache(source, loader)
+    version = cache.get().version
+    write(source, rows=60)
+    assert cache.file_version() != version
+    assert loader.calls == 1
+
+    dataset = cache.get()
+    assert len(dataset) == 60 and dataset.version != version
+    assert loader.calls == 2
+
+
+def test_a_touched_file_is_reloaded(source):
+    loader = counting_loader()
+    cache = private_cache(source, loader)
+    version = cache.get().version
+    st = os.stat(source)
+    os.utime(source, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert cache.get().version != version
+    assert loader.calls == 2
+
+
+def test_a_columnar_manifest_is_watched(source):
+    loader = counting_loader()
+    cache = private_cache(source, loader)
+    version = cache.get().version
+    os.makedirs(columnar.bundle_dir(source), exist_ok=True)
+    with open(columnar.manifest_path(source), 'w') as f:
+        f.write('{}')
+    assert cache.get().version != version
+    assert loader.calls == 2
+
+
+def test_versions_only_depend_on_the_files(source):
+    first, second = private_cache(source, counting_loader()), private_cache(source, counting_loader())
+    assert first.get().version == second.get().version
+
+
+def test_reload_reads_unchanged_files_again(source):
+    loader = counting_loader()
+    cache = private_cache(source, loader)
+    first = cache.get()
+    reloaded = cache.reload()
+    assert reloaded is not first and reloaded.version == first.version
+    assert cache.get() is reloaded
+    assert loader.calls == 2
+
+
+def test_missing_files_give_no_dataset(tmp_path):
+    loader = counting_loader()
+    cache = private_cache(str(tmp_path / 'missing.csv'), loader)
+    assert cache.get() is None
+    assert cache.version is None and cache.file_version() is None
+
+
+def test_failed_loads_are_not_retried_until_the_files_change(source):
+    loader = counting_loader()
+
+    def failing_once(path):
+        df = loader(path)
+        return None if loader.calls == 1 else df
+
+    cache = private_cache(source, failing_once)
+    assert cache.get() is None
+    assert cache.get() is None
+    assert loader.calls == 1
+    write(source, rows=60)
+    assert len(cache.get()) == 60
+
+
+def test_snapshots_are_read_only():
+    frame = pd.DataFrame({'timestamp': pd.date_range('2024-01-01', periods=3, freq='10min'),
+                          'aqi': [1.0, 2.0, 3.0]})
+    dataset = Dataset.from_frame(frame, 'v1')
+    with pytest.raises(ValueError):
+        dataset.column('aqi')[0] = 0.0
+    df = dataset.frame()
+    df['extra'] = 1
+    assert 'extra' not in dataset.columns
+    assert dataset.memo('total', lambda d: d.column('aqi').sum()) == 6.0
+    assert dataset.memo('total', lambda d: 0.0) == 6.0
@@ -0,0 +1,152 @@
+"""
+Downsampling of range queries: budgets, limits and cached selections, with
+LTTB and min/max selections checked against point-by-point references.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataset import Dataset
+from downsample import METHODS, MIN_POINTS, downsample_indices, lttb_indices, minmax_indices, series_budget
+from rollups import RollupStore
+from timeseries import RangeQuery
+
+FIELDS = ['pm2_5', 'no2']
+
+
+def readings_with_gap():
+    """
+    Readings every 5 minutes from 10:00 to 10:55 and from 11:30 to 21:55.
+    """
+    timestamps = pd.date_range('2024-03-01 10:00', '2024-03-01 21:55', freq='5min')
+    timestamps = timestamps[(timestamps <= '2024-03-01 10:55') | (timestamps >= '2024-03-01 11:30')]
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        'timestamp': timestamps,
+        'pm2_5': 100 + 30 * rng.standard_normal(len(timestamps)),
+        'no2': 40 + 5 * rng.standard_normal(len(timestamps))
+    })
+
+
+def downsampled(dataset, rollups, **args):
+    query = RangeQuery.from_args(args, dataset, FIELDS)
+    return query.downsample(dataset, query.apply(dataset, rollups=rollups))
+
+
+def test_selections_follow_the_frame_at_rollup_resolutions():
+    dataset = Dataset.from_frame(readings_with_gap(), 'v1')
+    rollups = RollupStore(FIELDS)
+    late = downsampled(dataset, rollups, start='2024-03-01T11:05', resolution='1h', points='3')
+    # Same first row in the dataset, but the frame gains the 10:00 bucket
+    early = downsampled(dataset, rollups, start='2024-03-01T10:58', resolution='1h', points='3')
+
+    assert late['timestamp'].iloc[0] == pd.Timestamp('2024-03-01 11:00')
+    assert early['timestamp'].iloc[0] == pd.Timestamp('2024-03-01 10:00')
+    for df in (late, early):
+        assert len(df) <= 3
+        assert df['timestamp'].iloc[-1] == pd.Timestamp('2024-03-01 21:00')
+
+    # A fresh dataset (no cached selections) gives the same answer
+    fresh = Dataset.from_frame(readings_with_gap(), 'v1')
+    expected = downsampled(fresh, RollupStore(FIELDS), start='2024-03-01T10:58', resolution='1h', points='3')
+    pd.testing.assert_frame_equal(early, expected)
+
+
+def test_points_cap_the_union_of_series():
+    df = readings_with_gap()
+    dataset = Dataset.from_frame(df, 'v1')
+    # Three points per series would be six rows for a budget of three
+    result = downsampled(dataset, None, points='3')
+    assert len(result) == 3
+    assert result['timestamp'].iloc[0] == df['timestamp'].iloc[0]
+    assert result['timestamp'].iloc[-1] == df['timestamp'].iloc[-1]
+
+
+def reference_lttb(x, y, n):
+    """
+    Largest-Triangle-Three-Buckets point by point, as in Steinarsson's thesis.
+    """
+    size = len(y)
+    every = (size - 2) / (n - 2)
+    selected = [0]
+    a = 0
+    for i in range(n - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, size)
+        avg_x = sum(x[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_y = sum(y[avg_start:avg_end]) / (avg_end - avg_start)
+        best, best_area = None, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        a = best
+        selected.append(a)
+    return selected + [size - 1]
+
+
+def reference_minmax(y, n):
+    buckets = max((n - 2) // 2, 1)
+    edges = np.linspace(0, len(y), buckets + 1).astype(np.int64)
+    selected = {0, len(y) - 1}
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        bucket = list(y[lo:hi])
+        selected.update([lo + bucket.index(min(bucket)), lo + bucket.index(max(bucket))])
+    return sorted(selected)
+
+
+@pytest.mark.parametrize('size, n', [(10, 5), (100, 7), (1000, 50), (1001, 3), (5000, 333)])
+def test_lttb_matches_reference(size, n):
+    rng = np.random.default_rng(size)
+    x = np.cumsum(rng.uniform(1, 3, size))
+    y = np.cumsum(rng.standard_normal(size))
+    selected = lttb_indices(x, y, n)
+    assert selected.tolist() == reference_lttb((x - x[0]).tolist(), y.tolist(), n)
+
+
+@pytest.mark.parametrize('size, n', [(10, 4), (100, 7), (1000, 50), (1001, 10), (5000, 333)])
+def test_minmax_matches_reference(size, n):
+    y = np.cumsum(np.random.default_rng(size).standard_normal(size))
+    assert minmax_indices(y, n).tolist() == reference_minmax(y.tolist(), n)
+
+
+@pytest.mark.parametrize('method', METHODS)
+@pytest.mark.parametrize('n', [1, 2, 3, 4, 5, 10, 99, 100, 101, 500])
+def test_selections_stay_within_the_budget(method, n):
+    size = 100
+    rng = np.random.default_rng(n)
+    x = pd.date_range('2024-01-01', periods=size, freq='10min').to_numpy()
+    y = rng.standard_normal(size)
+    y[rng.random(size) < 0.1] = np.nan
+    selected = downsample_indices(x, y, n, method)
+
+    if n >= size:
+        np.testing.assert_array_equal(selected, np.arange(size))
+        return
+    assert len(selected) <= max(n, MIN_POINTS)
+    if method == 'lttb':
+        assert len(selected) == max(n, MIN_POINTS)
+    assert selected[0] == 0 and selected[-1] == size - 1
+    assert (np.diff(selected) > 0).all()
+
+
+def test_minmax_keeps_the_extremes():
+    y = np.sin(np.linspace(0, 20, 1000))
+    y[123], y[789] = 5.0, -5.0
+    for n in (4, 10):
+        assert {123, 789} <= set(minmax_indices(y, n))
+    # A budget of three only has room for one of them
+    assert len(set(minmax_indices(y, 3)) & {123, 789}) == 1
+
+
+def test_short_series_are_kept_whole():
+    for size in range(MIN_POINTS + 1):
+        y = np.arange(size, dtype=float)
+        for method in METHODS:
+            np.testing.assert_array_equal(downsample_indices(np.arange(size), y, 2, method), np.arange(size))
+
+
+def test_series_budget_splits_points():
+    assert series_budget(100, 4) == 25
+    assert series_budget(10, 4) == MIN_POINTS
+    assert series_budget(10, 0) == 10
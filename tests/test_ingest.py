@@ -0,0 +1,205 @@
+"""
+Incremental ingest: the Directions text parsers, the as-of join against a
+brute-force nearest match, and runs over growing logger files against a
+single run over the finished ones.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingest
+from ingest import (AIR_QUALITY_FIELDS, LOGGER_TIMESTAMP_FORMAT, MERGED_COLUMNS, TRAFFIC_FIELDS, join,
+                    parse_meters, parse_seconds, traffic_numbers)
+
+TOLERANCE = pd.Timedelta(minutes=10)
+MAX_LAG = pd.Timedelta(hours=1)
+LOCATIONS = ['North', 'South']
+
+
+def test_parse_seconds():
+    text = pd.Series(['23 mins', '1 hour 5 mins', '2 days 3 hours', '1 min', '3 hours', 'n/a', None, ''])
+    expected = [23 * 60, 3900, 2 * 86400 + 3 * 3600, 60, 3 * 3600, np.nan, np.nan, np.nan]
+    np.testing.assert_array_equal(parse_seconds(text).to_numpy(), expected)
+
+
+def test_parse_meters():
+    text = pd.Series(['12.3 km', '850 m', '1,204 km', '0.5 km', 'far', None])
+    expected = [12300.0, 850.0, 1204000.0, 500.0, np.nan, np.nan]
+    np.testing.assert_allclose(parse_meters(text).to_numpy(), expected)
+
+
+def test_traffic_numbers_prefer_recorded_values():
+    df = pd.DataFrame({
+        'distance': ['1 km', '2 km', '3 km'],
+        'duration': ['10 mins', '20 mins', '30 mins'],
+        'duration_in_traffic': ['11 mins', '22 mins', '33 mins'],
+        'distance_m': [1005.0, np.nan, 2990.0],
+        'duration_s': ['601', '', np.nan]
+    })
+    numbers = traffic_numbers(df)
+    np.testing.assert_array_equal(numbers['distance_m'], [1005.0, 2000.0, 2990.0])
+    np.testing.assert_array_equal(numbers['duration_s'], [601.0, 1200.0, 1800.0])
+    np.testing.assert_array_equal(numbers['duration_in_traffic_s'], [660.0, 1320.0, 1980.0])
+
+
+def air_quality_rows(rows, seed=0, start='2024-12-05'):
+    rng = np.random.default_rng(seed)
+    timestamps = pd.Timestamp(start) + pd.to_timedelta(np.repeat(np.arange(rows // 2) * 10, 2), unit='min')
+    return pd.DataFrame({
+        'timestamp': timestamps.floor('s'),
+        'location': LOCATIONS * (rows // 2),
+        **{field: rng.uniform(0, 300, rows).round(1) for field in AIR_QUALITY_FIELDS}
+    })
+
+
+def traffic_rows(rows, seed=1, start='2024-12-05', shared=0.2):
+    """
+    Traffic readings at irregular times, some logged without a location.
+    """
+    rng = np.random.default_rng(seed)
+    seconds = np.cumsum(rng.integers(60, 900, rows))
+    location = rng.choice(LOCATIONS, rows).astype(object)
+    location[rng.random(rows) < shared] = None
+    return pd.DataFrame({
+        'timestamp': pd.Timestamp(start) + pd.to_timedelta(seconds, unit='s'),
+        'location': location,
+        'distance_km': rng.uniform(1, 20, rows).round(3),
+        'duration_min': rng.uniform(5, 60, rows).round(2),
+        'duration_in_traffic_min': rng.uniform(5, 90, rows).round(2)
+    })
+
+
+def nearest(air_quality, traffic, tolerance):
+    """
+    Brute-force reference for join(): the nearest traffic reading for the
+    same location, else the nearest one without a location.
+    """
+    values = np.full((len(air_quality), len(TRAFFIC_FIELDS)), np.nan)
+    for i, row in enumerate(air_quality.itertuples()):
+        for candidates in (traffic[traffic['location'] == row.location], traffic[traffic['location'].isna()]):
+            distance = (candidates['timestamp'] - row.timestamp).abs()
+            distance = distance[distance <= tolerance]
+            if len(distance):
+                values[i] = candidates.loc[distance.idxmin(), TRAFFIC_FIELDS].to_numpy(dtype=float)
+                break
+    return values
+
+
+def test_join_matches_nearest_reading():
+    air_quality = air_quality_rows(400)
+    traffic = traffic_rows(300)
+    joined, waiting = join(air_quality, traffic, TOLERANCE, MAX_LAG)
+
+    assert list(joined.columns) == MERGED_COLUMNS
+    assert len(joined) + len(waiting) == len(air_quality)
+    ready = air_quality[air_quality['timestamp'] + TOLERANCE <= traffic['timestamp'].max()]
+    pd.testing.assert_frame_equal(joined[['timestamp', 'location'] + AIR_QUALITY_FIELDS],
+                                  ready.reset_index(drop=True), check_dtype=False)
+    np.testing.assert_array_equal(joined[TRAFFIC_FIELDS].to_numpy(dtype=float), nearest(ready, traffic, TOLERANCE))
+    assert joined[TRAFFIC_FIELDS].notna().all(axis=1).mean() > 0.5
+
+
+def test_rows_wait_for_traffic_until_the_lag_runs_out():
+    air_quality = air_quality_rows(40)
+    traffic = traffic_rows(5)
+    last_traffic = traffic['timestamp'].max()
+    joined, waiting = join(air_quality, traffic, TOLERANCE, MAX_LAG)
+
+    newest = air_quality['timestamp'].max()
+    expected_ready = ((air_quality['timestamp'] + TOLERANCE <= last_traffic)
+                      | (air_quality['timestamp'] <= newest - MAX_LAG))
+    assert len(joined) == expected_ready.sum()
+    assert (waiting['timestamp'] > newest - MAX_LAG).all()
+    assert (waiting['timestamp'] + TOLERANCE > last_traffic).all()
+
+
+def logger_files(air_quality, traffic):
+    """
+    The logger's files as (timestamps, lines): air quality as recorded,
+    traffic with text fields and, except for older rows, the numeric ones.
+    """
+    aq = air_quality.assign(timestamp=air_quality['timestamp'].dt.strftime(LOGGER_TIMESTAMP_FORMAT))
+    tr = pd.DataFrame({
+        'timestamp': traffic['timestamp'].dt.strftime(LOGGER_TIMESTAMP_FORMAT),
+        'distance': [f"{value:.3f} km" for value in traffic['distance_km']],
+        'duration': [f"{int(value // 60)} hours {int(value % 60)} mins" for value in traffic['duration_min']],
+        'duration_in_traffic': [f"{int(value)} mins" for value in traffic['duration_in_traffic_min']],
+        'location': traffic['location'],
+        'distance_m': traffic['distance_km'] * 1000,
+        'duration_s': traffic['duration_min'] * 60,
+        'duration_in_traffic_s': traffic['duration_in_traffic_min'] * 60
+    })
+    tr.loc[:len(tr) // 3, ['distance_m', 'duration_s', 'duration_in_traffic_s']] = np.nan
+    return {
+        'air_quality.csv': (air_quality['timestamp'], aq.to_csv(index=False).splitlines(keepends=True)),
+        'traffic_data.csv': (traffic['timestamp'], tr.to_csv(index=False).splitlines(keepends=True))
+    }
+
+
+def run(data_dir, merged, files, cuts):
+    """
+    Grows the logger files to the readings up to each time in ``cuts``, the
+    last one written halfway, and ingests after each step.
+    """
+    for cut in cuts:
+        for name, (timestamps, lines) in files.items():
+            rows = int((timestamps <= cut).sum())
+            with open(os.path.join(data_dir, name), 'w') as f:
+                f.writelines(lines[:rows + 1])
+                if rows + 1 < len(lines):
+                    f.write(lines[rows + 1][:10])
+        ingest.ingest(str(data_dir), str(merged), TOLERANCE, MAX_LAG)
+
+
+@pytest.fixture
+def logger_text():
+    return logger_files(air_quality_rows(600, seed=2), traffic_rows(400, seed=3))
+
+
+def test_incremental_runs_match_a_single_run(tmp_path, logger_text):
+    for name in ('steps', 'once'):
+        (tmp_path / name).mkdir()
+    end = pd.Timestamp('2024-12-08')
+    steps = pd.Timestamp('2024-12-05') + pd.to_timedelta([7, 45, 46, 190, 600, 601, 602, 1500, 2900], unit='min')
+    run(tmp_path / 'steps', tmp_path / 'steps.csv', logger_text, list(steps) + [end])
+    run(tmp_path / 'once', tmp_path / 'once.csv', logger_text, [end])
+
+    steps, once = (tmp_path / 'steps.csv').read_text(), (tmp_path / 'once.csv').read_text()
+    assert steps == once
+    merged = pd.read_csv(tmp_path / 'once.csv', index_col=0)
+    assert list(merged.columns) == MERGED_COLUMNS
+    assert merged.index.tolist() == list(range(len(merged)))
+    with open(ingest.checkpoint_path(str(tmp_path / 'steps.csv'))) as f:
+        checkpoint = json.load(f)
+    assert len(merged) + len(checkpoint['pending']) == 600
+
+
+def test_single_run_matches_join(tmp_path, logger_text):
+    run(tmp_path, tmp_path / 'merged.csv', logger_text, [pd.Timestamp('2024-12-08')])
+    air_quality = ingest.air_quality_values(ingest.read_new_rows(str(tmp_path), ingest.AIR_QUALITY_PATTERN, {}))
+    traffic = ingest.traffic_values(ingest.read_new_rows(str(tmp_path), ingest.TRAFFIC_PATTERN, {}))
+    joined, _ = join(air_quality, traffic, TOLERANCE, MAX_LAG)
+
+    merged = pd.read_csv(tmp_path / 'merged.csv', index_col=0)
+    np.testing.assert_array_equal(pd.to_datetime(merged['timestamp'], format=ingest.TIMESTAMP_FORMAT),
+                                  joined['timestamp'].dt.floor('min'))
+    np.testing.assert_allclose(merged[AIR_QUALITY_FIELDS + TRAFFIC_FIELDS].to_numpy(dtype=float),
+                               joined[AIR_QUALITY_FIELDS + TRAFFIC_FIELDS].to_numpy(dtype=float), rtol=1e-12)
+    # Text-only rows were parsed to the same numbers the logger recorded, to the text's precision
+    np.testing.assert_allclose(merged['distance_km'], joined['distance_km'], atol=5e-4)
+
+
+def test_partial_lines_are_read_on_the_next_run(tmp_path, logger_text):
+    path = tmp_path / 'air_quality.csv'
+    _, lines = logger_text['air_quality.csv']
+    path.write_text(''.join(lines[:20]) + lines[20][:5])
+    state = {'offset': 0, 'header': None, 'rows': 0}
+    first = ingest.read_appended(str(path), state)
+    assert len(first) == 19
+    path.write_text(''.join(lines))
+    second = ingest.read_appended(str(path), state)
+    assert ingest.read_appended(str(path), state) is None
+    pd.testing.assert_frame_equal(pd.concat([first, second], ignore_index=True), pd.read_csv(path))
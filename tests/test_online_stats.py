@@ -0,0 +1,132 @@
+"""
+OnlineStats, StatsStore and rolling_corr checked against pandas.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from analytics import MIN_PERIODS, rolling_corr
+from dataset import Dataset
+from online_stats import OnlineStats, StatsStore
+
+FIELDS = ['pm2_5', 'pm10', 'no2', 'o3', 'duration_in_traffic_min']
+POLLUTANTS = ['pm2_5', 'pm10', 'no2', 'o3']
+TRAFFIC = 'duration_in_traffic_min'
+
+RTOL = 1e-9
+
+
+def readings(rows=2000, seed=0, start='2023-11-26 21:30'):
+    """
+    Irregularly spaced readings around 10 minutes apart, with correlated
+    series, missing values, repeated timestamps and a large offset on pm10
+    (which naive sums of squares would lose precision on).
+    """
+    rng = np.random.default_rng(seed)
+    minutes = np.cumsum(rng.choice([0, 5, 10, 10, 10, 15, 30], rows))
+    traffic = 20 + 5 * rng.standard_normal(rows)
+    df = pd.DataFrame({
+        'timestamp': pd.Timestamp(start) + pd.to_timedelta(minutes, unit='min'),
+        'pm2_5': 150 + 3 * traffic + 20 * rng.standard_normal(rows),
+        'pm10': 1e6 + 4 * traffic + 30 * rng.standard_normal(rows),
+        'no2': 40 + traffic + 6 * rng.standard_normal(rows),
+        'o3': 30 - 0.5 * traffic + 3 * rng.standard_normal(rows),
+        TRAFFIC: traffic
+    })
+    for field, rate in [('pm2_5', 0.05), ('no2', 0.2), (TRAFFIC, 0.03)]:
+        df.loc[rng.random(rows) < rate, field] = np.nan
+    return df
+
+
+def assert_matches(stats, df):
+    described = df[FIELDS].describe()
+    for field in FIELDS:
+        assert stats.count(field) == described.loc['count', field]
+        for name, value in [('mean', stats.mean(field)), ('std', stats.std(field)),
+                            ('min', stats.min(field)), ('max', stats.max(field))]:
+            assert value == pytest.approx(described.loc[name, field], rel=RTOL, nan_ok=True), (field, name)
+    for field in POLLUTANTS:
+        expected = df[field].corr(df[TRAFFIC])
+        assert stats.corr(field, TRAFFIC) == pytest.approx(expected, rel=RTOL, abs=1e-12, nan_ok=True), field
+        assert stats.corr(TRAFFIC, field) == pytest.approx(expected, rel=RTOL, abs=1e-12, nan_ok=True), field
+
+
+def test_update_matches_pandas():
+    df = readings()
+    assert_matches(OnlineStats.from_columns(df, FIELDS), df)
+
+
+def test_batches_match_pandas():
+    df = readings()
+    stats = OnlineStats(FIELDS)
+    for lo in range(0, len(df), 137):
+        stats.update(df.iloc[lo:lo + 137])
+    assert_matches(stats, df)
+
+
+def test_merge_of_partial_states():
+    df = readings()
+    first, second = df.iloc[:700], df.iloc[700:]
+    merged = OnlineStats.from_columns(first, FIELDS).merge(OnlineStats.from_columns(second, FIELDS))
+    assert_matches(merged, df)
+
+    # Merging into an empty accumulator, or merging an empty one, changes nothing
+    empty = OnlineStats(FIELDS)
+    assert_matches(OnlineStats(FIELDS).merge(merged), df)
+    assert_matches(merged.merge(empty), df)
+
+
+def test_merge_with_a_shard_missing_a_field():
+    df = readings()
+    df.loc[df.index[:500], 'no2'] = np.nan
+    merged = OnlineStats.from_columns(df.iloc[:500], FIELDS).merge(OnlineStats.from_columns(df.iloc[500:], FIELDS))
+    assert_matches(merged, df)
+
+
+def test_missing_values():
+    df = readings(rows=50)
+    df['o3'] = np.nan
+    df.loc[df.index[:48], 'no2'] = np.nan
+    stats = OnlineStats.from_columns(df, FIELDS)
+    assert_matches(stats, df)
+    assert stats.count('o3') == 0
+    assert np.isnan(stats.mean('o3')) and np.isnan(stats.min('o3')) and np.isnan(stats.corr('o3', TRAFFIC))
+
+
+def test_merge_rejects_other_fields():
+    with pytest.raises(ValueError):
+        OnlineStats(FIELDS).merge(OnlineStats(POLLUTANTS))
+
+
+@pytest.mark.parametrize('lo, hi', [(0, 2000), (0, 1), (10, 20), (123, 1789), (400, 401), (1500, 2000), (7, 7)])
+def test_store_summary_matches_pandas(lo, hi):
+    df = readings()
+    dataset = Dataset.from_frame(df, 'v1')
+    stats = StatsStore(FIELDS).summary(dataset, lo, hi)
+    if lo == hi:
+        assert all(stats.count(field) == 0 for field in FIELDS)
+    else:
+        assert_matches(stats, df.iloc[lo:hi])
+
+
+def test_store_follows_appended_rows():
+    df = readings(rows=3000)
+    store = StatsStore(FIELDS)
+    store.summary(Dataset.from_frame(df.iloc[:1000], 'v1'))
+    # Rows appended to the last day and new days, as a growing merged file would have
+    dataset = Dataset.from_frame(df, 'v2')
+    assert_matches(store.summary(dataset), df)
+    assert_matches(store.summary(dataset, 900, 2500), df.iloc[900:2500])
+
+
+@pytest.mark.parametrize('window', ['1h', '6h', '24h', '7D'])
+def test_rolling_corr_matches_pandas(window):
+    df = readings()
+    indexed = df.set_index('timestamp')
+    for field in POLLUTANTS:
+        expected = indexed[field].rolling(window, min_periods=MIN_PERIODS).corr(indexed[TRAFFIC]).to_numpy()
+        result = rolling_corr(df['timestamp'].to_numpy(), df[field].to_numpy(), df[TRAFFIC].to_numpy(),
+                              pd.Timedelta(window))
+        np.testing.assert_array_equal(np.isnan(result), np.isnan(expected), err_msg=f"{field} {window}")
+        np.testing.assert_allclose(result, expected, rtol=1e-6, atol=1e-9, equal_nan=True,
+                                   err_msg=f"{field} {window}")
@@ -0,0 +1,96 @@
+"""
+RollupStore checked against pandas resampling of the same rows.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataset import Dataset
+from rollups import RollupStore
+
+FIELDS = ['pm2_5', 'no2']
+RTOL = 1e-9
+
+
+def readings(rows=1500, seed=0, start='2023-11-26 21:30'):
+    """
+    Readings every 10 minutes over about ten days, with missing values.
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'timestamp': pd.date_range(start, periods=rows, freq='10min'),
+        'pm2_5': 150 + 20 * rng.standard_normal(rows),
+        'no2': 40 + 6 * rng.standard_normal(rows)
+    })
+    df.loc[rng.random(rows) < 0.1, 'no2'] = np.nan
+    return df
+
+
+def assert_matches(store, df):
+    for name, rule in [('10m', '10min'), ('1h', '1h'), ('1d', '1D')]:
+        series = store.series(name)
+        expected = df.set_index('timestamp').resample(rule)
+        counts = expected.count()
+        expected = expected.agg(['mean', 'min', 'max', 'std'])[counts.sum(axis=1) > 0]
+        series = series[series[[f"{field}_count" for field in FIELDS]].sum(axis=1) > 0]
+        np.testing.assert_array_equal(series['timestamp'].to_numpy(), expected.index.to_numpy(), err_msg=name)
+        for field in FIELDS:
+            np.testing.assert_array_equal(series[f"{field}_count"].to_numpy(), counts.loc[expected.index, field])
+            for stat in ['mean', 'min', 'max', 'std']:
+                np.testing.assert_allclose(series[f"{field}_{stat}"].to_numpy(), expected[(field, stat)].to_numpy(),
+                                           rtol=RTOL, equal_nan=True, err_msg=f"{name} {field} {stat}")
+    aggregate = store.aggregate()
+    for field in FIELDS:
+        assert aggregate[field]['count'] == df[field].count()
+        assert aggregate[field]['mean'] == pytest.approx(df[field].mean(), rel=RTOL)
+        assert aggregate[field]['max'] == df[field].max()
+
+
+def synced(*frames):
+    store = RollupStore(FIELDS)
+    for i, df in enumerate(frames):
+        store.sync(Dataset.from_frame(df, f"v{i}"))
+    return store
+
+
+def test_build_matches_pandas():
+    df = readings()
+    assert_matches(synced(df), df)
+
+
+def test_appended_rows_are_added():
+    df = readings()
+    store = synced(df.iloc[:1000], df.iloc[:1200], df)
+    assert_matches(store, df)
+    # Only the last day was recomputed on each append
+    assert store._kept == int(np.searchsorted(df['timestamp'], df['timestamp'].iloc[-1].floor('1D')))
+
+
+def test_changed_last_rows_are_recomputed():
+    df = readings()
+    # The last bucket of the old snapshot gains readings, as it does when raw rows arrive late
+    old = df.iloc[:1000].copy()
+    old.loc[old.index[-3:], ['pm2_5', 'no2']] = np.nan
+    assert_matches(synced(old, df), df)
+
+
+def test_rows_inserted_before_the_end_rebuild():
+    df = readings()
+    late = pd.DataFrame({'timestamp': [df['timestamp'].iloc[20] + pd.Timedelta(minutes=5)],
+                         'pm2_5': [1000.0], 'no2': [np.nan]})
+    inserted = pd.concat([df, late]).sort_values('timestamp', kind='stable').reset_index(drop=True)
+    assert_matches(synced(df, inserted), inserted)
+
+
+def test_rewritten_history_rebuilds():
+    df = readings()
+    # Gap fills with the column mean change all over the history when data is appended
+    rewritten = df.copy()
+    rewritten.loc[rewritten.index[:50], 'pm2_5'] += 1.0
+    assert_matches(synced(df.iloc[:1200], rewritten), rewritten)
+
+
+def test_shrunk_snapshot_rebuilds():
+    df = readings()
+    assert_matches(synced(df, df.iloc[:700]), df.iloc[:700])
+    assert_matches(synced(df, df.iloc[:0], df.iloc[:300]), df.iloc[:300])
@@ -0,0 +1,105 @@
+"""
+RuleSet checked against evaluating every rule row by row with pandas.
+"""
+import operator
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from rules import RuleSet
+
+THRESHOLDS = {'air_quality': {'moderate': 100, 'unhealthy': 150}}
+
+RULES = [
+    {'name': 'unhealthy', 'when': [('aqi', '>', 'air_quality.unhealthy')],
+     'actions': ['Sprinklers in {location}'],
+     'actuations': [('control_ventilation', {'area': '{location}', 'action': 'increase'})]},
+    {'name': 'combined', 'when': [('aqi', '>=', 'air_quality.moderate'), ('ratio', '>', 1.2)]},
+    {'name': 'clear', 'when': [('aqi', '<', 50), ('ratio', '<=', 1.0)]},
+    {'name': 'not_one', 'when': [('level', '!=', 1)]},
+    {'name': 'exactly_one', 'when': [('level', '==', 1)]}
+]
+
+PYTHON_OPERATORS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le,
+                    '==': operator.eq, '!=': operator.ne}
+
+
+def readings(rows=500, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'location': [f"Station {i}" for i in range(rows)],
+        'aqi': rng.uniform(0, 250, rows).round(),
+        'ratio': rng.uniform(0.5, 2.0, rows),
+        'level': rng.integers(0, 3, rows).astype(float)
+    })
+    for column, rate in [('aqi', 0.1), ('ratio', 0.1), ('level', 0.2)]:
+        df.loc[rng.random(rows) < rate, column] = np.nan
+    return df
+
+
+def expected(df):
+    """
+    Whether each rule fires on each row; a missing value fails every condition.
+    """
+    fired = np.zeros((len(df), len(RULES)), dtype=bool)
+    for i, row in enumerate(df.to_dict('records')):
+        for j, rule in enumerate(RULES):
+            fired[i, j] = all(
+                not pd.isna(row[metric]) and PYTHON_OPERATORS[op](
+                    row[metric], THRESHOLDS['air_quality'][threshold.split('.')[1]]
+                    if isinstance(threshold, str) else threshold
+                )
+                for metric, op, threshold in rule['when']
+            )
+    return fired
+
+
+def test_evaluate_matches_row_by_row():
+    df = readings()
+    np.testing.assert_array_equal(RuleSet(RULES, THRESHOLDS).evaluate(df), expected(df))
+
+
+def test_missing_values_never_satisfy_a_condition():
+    df = pd.DataFrame({'aqi': [np.nan, 200.0], 'ratio': [np.nan, 2.0], 'level': [np.nan, np.nan]})
+    fired = RuleSet(RULES, THRESHOLDS).evaluate(df)
+    assert not fired[0].any()
+    assert fired[1].tolist() == [True, True, False, False, False]
+
+
+def test_outcomes_are_formatted_per_row():
+    df = readings(rows=20)
+    rules = RuleSet(RULES, THRESHOLDS)
+    fired = rules.evaluate(df)
+    outcomes = list(rules.outcomes(fired, df.to_dict('records')))
+    unhealthy = [(row, outcome) for row, outcome in outcomes if outcome['name'] == 'unhealthy']
+    assert len(unhealthy) == int(fired[:, 0].sum())
+    for row, outcome in unhealthy:
+        assert outcome['actions'] == [f"Sprinklers in {row['location']}"]
+        assert outcome['actuations'] == [('control_ventilation', {'area': row['location'], 'action': 'increase'})]
+
+
+def test_summarize_counts_firings():
+    df = readings()
+    rules = RuleSet(RULES, THRESHOLDS)
+    fired = rules.evaluate(df)
+    summary = rules.summarize(fired, df['location'].to_numpy())
+    for j, name in enumerate(rules.names):
+        hits = np.flatnonzero(expected(df)[:, j])
+        assert summary[name]['count'] == len(hits)
+        assert summary[name]['first'] == (df['location'][hits[0]] if len(hits) else None)
+
+
+@pytest.mark.parametrize('rule, error', [
+    ({'name': 'empty', 'when': []}, ValueError),
+    ({'name': 'bad_op', 'when': [('aqi', '=>', 1)]}, ValueError),
+    ({'name': 'bad_threshold', 'when': [('aqi', '>', 'air_quality.missing')]}, ValueError)
+])
+def test_invalid_rules_are_rejected(rule, error):
+    with pytest.raises(error):
+        RuleSet([rule], THRESHOLDS)
+
+
+def test_missing_metric_is_reported():
+    with pytest.raises(KeyError):
+        RuleSet(RULES, THRESHOLDS).evaluate({'aqi': [1.0]})
@@ -0,0 +1,122 @@
+"""
+Publishing, mapping and removing shared datasets, with several DatasetCaches
+standing in for the workers of a server.
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import shared_dataset
+from dataset import DatasetCache
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'merged.csv'
+    write(path, rows=50)
+    return str(path)
+
+
+@pytest.fixture
+def shared_dir(tmp_path):
+    directory = tmp_path / 'shared'
+    directory.mkdir()
+    return str(directory)
+
+
+def write(path, rows):
+    pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=rows, freq='10min'),
+        'aqi': np.arange(rows, dtype=float)
+    }).to_csv(path, index=False)
+
+
+def counting_loader():
+    def load(path):
+        load.calls += 1
+        return pd.read_csv(path, parse_dates=['timestamp'])
+    load.calls = 0
+    return load
+
+
+def age(directory, seconds=2 * shared_dataset.TMP_TIMEOUT):
+    then = time.time() - seconds
+    for name in os.listdir(directory):
+        os.utime(os.path.join(directory, name), (then, then))
+
+
+def test_published_version_is_mapped_by_other_workers(source, shared_dir):
+    loader = counting_loader()
+    first = DatasetCache(source, loader=loader, shared_dir=shared_dir).get()
+    second = DatasetCache(source, loader=loader, shared_dir=shared_dir).get()
+
+    assert loader.calls == 1
+    assert second.version == first.version
+    assert isinstance(second.column('aqi').base, np.memmap)
+    np.testing.assert_array_equal(second.column('aqi'), np.arange(50))
+    with pytest.raises(ValueError):
+        second.column('aqi')[0] = 1.0
+
+
+def test_forced_reload_is_picked_up_by_other_workers(source, shared_dir):
+    loader = counting_loader()
+    workers = [DatasetCache(source, loader=loader, shared_dir=shared_dir) for _ in range(3)]
+    version = workers[0].get().version
+    for worker in workers[1:]:
+        worker.get()
+
+    reloaded = workers[0].reload(force=True)
+    assert loader.calls == 2
+    assert reloaded.version != version and reloaded.version.startswith(version)
+    for worker in workers[1:]:
+        assert worker.file_version() == reloaded.version
+        assert worker.get().version == reloaded.version
+    # A worker started afterwards maps the forced version instead of loading
+    assert DatasetCache(source, loader=loader, shared_dir=shared_dir).get().version == reloaded.version
+    assert loader.calls == 2
+
+    # New data files replace the forced version
+    write(source, rows=60)
+    assert len(workers[1].get()) == 60
+    assert loader.calls == 3
+
+
+def test_forced_reload_without_shared_dir(source):
+    loader = counting_loader()
+    cache = DatasetCache(source, loader=loader, shared_dir='')
+    cache.get()
+    cache.reload(force=True)
+    cache.get()
+    assert loader.calls == 2
+
+
+def test_unused_versions_are_removed(source, shared_dir):
+    # Left behind by an older deployment, which used another key
+    stale = os.path.join(shared_dir, 'deadbeefdeadbeef-0123456789abcdef')
+    os.makedirs(stale)
+    open(os.path.join(stale, shared_dataset.MANIFEST_NAME), 'w').close()
+    open(os.path.join(shared_dir, 'deadbeefdeadbeef' + shared_dataset.POINTER_SUFFIX), 'w').close()
+    os.makedirs(os.path.join(shared_dir, '.tmp-deadbeefdeadbeef-crashed'))
+    age(shared_dir)
+
+    loader = counting_loader()
+    holder, mover = (DatasetCache(source, loader=loader, shared_dir=shared_dir) for _ in range(2))
+    held = holder.get().version
+    mover.get()
+    assert sorted(os.listdir(shared_dir)) == [f"{holder._shared_key}-{held}",
+                                              f"{holder._shared_key}{shared_dataset.POINTER_SUFFIX}"]
+
+    # A version still served by a worker survives the next publish; once nobody serves it, it goes
+    age(shared_dir)
+    forced = mover.reload(force=True).version
+    assert os.path.isdir(os.path.join(shared_dir, f"{holder._shared_key}-{held}"))
+    assert holder.get().version == forced
+    age(shared_dir)
+    write(source, rows=60)
+    latest = mover.get().version
+    assert sorted(name for name in os.listdir(shared_dir) if '-' in name) == sorted([
+        f"{holder._shared_key}-{forced}", f"{holder._shared_key}-{latest}"
+    ])
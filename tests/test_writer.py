@@ -0,0 +1,152 @@
+"""
+BatchWriter batching, daily rotation and fsync policies, read back with csv
+and read_records.
+"""
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import writer
+from writer import BatchWriter, read_records, to_records
+
+SCHEMA = [('timestamp', 'datetime64[s]'), ('aqi', 'f8'), ('location', 'S16')]
+
+
+@pytest.fixture
+def fsyncs(monkeypatch):
+    calls = []
+    real_fsync = os.fsync
+
+    def fsync(fd):
+        calls.append(fd)
+        real_fsync(fd)
+
+    monkeypatch.setattr(writer.os, 'fsync', fsync)
+    return calls
+
+
+def rows(days=3, per_day=5, start='2024-12-05'):
+    timestamps = pd.date_range(start, periods=days * per_day, freq=f"{24 * 60 // per_day}min")
+    return [{'timestamp': ts.strftime('%Y-%m-%d %H:%M:%S'), 'aqi': float(i), 'location': f"Site {i % 2}"}
+            for i, ts in enumerate(timestamps)]
+
+
+def read_csv(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def by_day(written):
+    days = {}
+    for row in written:
+        days.setdefault(row['timestamp'][:10], []).append(row)
+    return days
+
+
+def test_rows_are_rotated_into_daily_files(tmp_path):
+    written = rows()
+    with BatchWriter(str(tmp_path), 'air_quality', SCHEMA, batch_size=4, flush_interval=3600) as output:
+        for row in written:
+            output.write([row])
+
+    days = by_day(written)
+    assert sorted(os.listdir(tmp_path)) == [f"air_quality_{day}.csv" for day in sorted(days)]
+    for day, expected in days.items():
+        assert read_csv(tmp_path / f"air_quality_{day}.csv") == [
+            {name: str(value) for name, value in row.items()} for row in expected
+        ]
+
+
+def test_rows_wait_for_a_full_batch(tmp_path):
+    output = BatchWriter(str(tmp_path), 'air_quality', SCHEMA, batch_size=5, flush_interval=3600,
+                         rotate_daily=False)
+    path = tmp_path / 'air_quality.csv'
+    written = rows()
+    output.write(written[:4])
+    assert not path.exists()
+    output.write(written[4:5])
+    assert len(read_csv(path)) == 5
+    output.write(written[5:7])
+    assert len(read_csv(path)) == 5
+    output.close()
+    assert len(read_csv(path)) == 7
+
+
+def test_old_rows_are_flushed_by_age(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(writer.time, 'monotonic', lambda: now[0])
+    output = BatchWriter(str(tmp_path), 'air_quality', SCHEMA, batch_size=100, flush_interval=60,
+                         rotate_daily=False)
+    written = rows()
+    output.write(written[:1])
+    now[0] += 59
+    output.write(written[1:2])
+    assert not (tmp_path / 'air_quality.csv').exists()
+    now[0] += 1
+    output.write(written[2:3])
+    assert len(read_csv(tmp_path / 'air_quality.csv')) == 3
+    output.close()
+
+
+@pytest.mark.parametrize('policy', writer.FSYNC_POLICIES)
+def test_fsync_policies(tmp_path, fsyncs, policy):
+    # Two batches per day over three days
+    written = rows(days=3, per_day=4)
+    output = BatchWriter(str(tmp_path), 'air_quality', SCHEMA, batch_size=2, flush_interval=3600, fsync=policy)
+    for i in range(0, len(written), 2):
+        output.write(written[i:i + 2])
+    output.close()
+
+    # One fsync per batch for 'flush', plus one per file as it is rotated out or closed
+    expected = {'never': 0, 'close': 3, 'flush': 6 + 3}[policy]
+    assert len(fsyncs) == expected
+    assert sum(len(read_csv(tmp_path / name)) for name in os.listdir(tmp_path)) == len(written)
+
+
+def test_rotation_fsyncs_the_finished_day(tmp_path, fsyncs):
+    written = rows(days=2, per_day=4)
+    output = BatchWriter(str(tmp_path), 'air_quality', SCHEMA, batch_size=4, flush_interval=3600, fsync='close')
+    days = by_day(written)
+    first, second = sorted(days)
+    output.write(days[first])
+    assert fsyncs == []
+    output.write(days[second])
+    assert len(fsyncs) == 1
+    output.close()
+    assert len(fsyncs) == 2
+
+
+def test_existing_files_keep_their_header(tmp_path):
+    path = tmp_path / 'air_quality.csv'
+    path.write_text('timestamp,aqi\n2024-12-01 00:00:00,1.0\n')
+    with BatchWriter(str(tmp_path), 'air_quality', SCHEMA, batch_size=1, rotate_daily=False) as output:
+        output.write(rows()[:2])
+    assert path.read_text().splitlines() == [
+        'timestamp,aqi', '2024-12-01 00:00:00,1.0', '2024-12-05 00:00:00,0.0', '2024-12-05 04:48:00,1.0'
+    ]
+
+
+def test_binary_records_round_trip(tmp_path):
+    written = rows(days=1, per_day=10)
+    written[3]['aqi'] = None
+    written[4]['location'] = 'A much longer location name'
+    with BatchWriter(str(tmp_path), 'air_quality', SCHEMA, fmt='binary', batch_size=3, rotate_daily=False) as output:
+        output.write(written)
+    records = read_records(str(tmp_path / 'air_quality.bin'))
+
+    # Compared as bytes, since NaN fields never compare equal
+    assert records.tobytes() == to_records(written, np.dtype(SCHEMA)).tobytes()
+    np.testing.assert_array_equal(records['timestamp'],
+                                  pd.to_datetime([row['timestamp'] for row in written]).to_numpy().astype(
+                                      'datetime64[s]'))
+    assert np.isnan(records['aqi'][3])
+    assert records['location'][4] == b'A much longer lo'
+
+
+@pytest.mark.parametrize('options', [{'fmt': 'parquet'}, {'fsync': 'always'}])
+def test_invalid_options_are_rejected(tmp_path, options):
+    with pytest.raises(ValueError):
+        BatchWriter(str(tmp_path), 'air_quality', SCHEMA, **options)
@@ -0,0 +1,214 @@
+"""
+Time-range queries over the sorted timestamp column of a Dataset.
+
+Slices are located with binary search (np.searchsorted) on the timestamp
+array, so selecting a range costs O(log n + k) instead of a full scan.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from downsample import METHODS, MIN_POINTS, downsample_indices, series_budget
+
+# Supported values of the ``resolution`` query parameter and their resample rules
+RESOLUTIONS = {
+    'raw': None,
+    '10m': '10min',
+    '1h': '1h',
+    '1d': '1D'
+}
+
+RELATIVE_UNITS = {
+    'm': 'minutes',
+    'h': 'hours',
+    'd': 'days',
+    'w': 'weeks'
+}
+
+
+class QueryError(ValueError):
+    """Raised for invalid query parameters; handlers turn it into a 400 response."""
+
+
+def parse_time(value, latest=None):
+    """
+    Parses a ``start``/``end`` parameter.
+    Accepts ISO 8601 timestamps or durations relative to the latest
+    sample, such as ``-24h`` or ``-7d``.
+    """
+    if value is None or value == '':
+        return None
+    match = re.fullmatch(r'-(\d+)([mhdw])', value.strip())
+    if match:
+        if latest is None:
+            raise QueryError(f"Relative time '{value}' needs a non-empty dataset")
+        amount, unit = match.groups()
+        return pd.Timestamp(latest) - pd.Timedelta(**{RELATIVE_UNITS[unit]: int(amount)})
+    try:
+        return pd.Timestamp(value)
+    except (ValueError, TypeError):
+        raise QueryError(f"Invalid timestamp '{value}'")
+
+
+def parse_window(value):
+    """
+    Parses a window length such as ``24h`` or ``7d``.
+    """
+    match = re.fullmatch(r'(\d+)([mhdw])', (value or '').strip())
+    if not match or int(match.group(1)) == 0:
+        raise QueryError(f"Invalid window '{value}'. Use a length such as 24h or 7d")
+    amount, unit = match.groups()
+    return pd.Timedelta(**{RELATIVE_UNITS[unit]: int(amount)})
+
+
+def parse_fields(value, available):
+    """
+    Parses a comma-separated ``fields`` parameter against the available columns.
+    """
+    if value is None or value == '':
+        return list(available)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise QueryError(f"Unknown fields: {unknown}. Available fields: {list(available)}")
+    return fields
+
+
+def range_bounds(timestamps, start=None, end=None):
+    """
+    Returns the (lo, hi) positions of [start, end] in a sorted timestamp array.
+    """
+    lo = 0 if start is None else int(np.searchsorted(timestamps, start.to_datetime64(), side='left'))
+    hi = len(timestamps) if end is None else int(np.searchsorted(timestamps, end.to_datetime64(), side='right'))
+    return lo, max(lo, hi)
+
+
+class RangeQuery:
+    """
+    Parsed ``start``, ``end``, ``resolution``, ``fields``, ``points`` and
+    ``downsample`` parameters.
+    """
+    def __init__(self, start=None, end=None, resolution='raw', fields=None, points=None, method='lttb'):
+        self.start = start
+        self.end = end
+        self.resolution = resolution
+        self.fields = fields
+        self.points = points
+        self.method = method
+
+    @classmethod
+    def from_args(cls, args, dataset, available, latest=None):
+        """
+        Parses request arguments; relative times are resolved against the
+        dataset's last timestamp, or against ``latest`` when ``dataset`` is None.
+        """
+        if dataset is not None:
+            timestamps = dataset.column('timestamp')
+            latest = timestamps[-1] if len(timestamps) else None
+        resolution = args.get('resolution', 'raw')
+        if resolution not in RESOLUTIONS:
+            raise QueryError(f"Invalid resolution '{resolution}'. Use one of: {list(RESOLUTIONS)}")
+        start = parse_time(args.get('start'), latest)
+        end = parse_time(args.get('end'), latest)
+        if start is not None and end is not None and start > end:
+            raise QueryError("'start' must not be after 'end'")
+        points = args.get('points')
+        if points is not None:
+            try:
+                points = int(points)
+            except ValueError:
+                raise QueryError(f"Invalid points '{points}'")
+            if points < MIN_POINTS:
+                raise QueryError(f"'points' must be at least {MIN_POINTS}")
+        method = args.get('downsample', 'lttb')
+        if method not in METHODS:
+            raise QueryError(f"Invalid downsample method '{method}'. Use one of: {list(METHODS)}")
+        return cls(start, end, resolution, parse_fields(args.get('fields'), available), points, method)
+
+    @property
+    def is_default(self):
+        return self.start is None and self.end is None and self.resolution == 'raw' and self.points is None
+
+    def bounds(self, dataset):
+        return range_bounds(dataset.column('timestamp'), self.start, self.end)
+
+    def apply(self, dataset, columns=None, rollups=None):
+        """
+        Returns a DataFrame with the timestamp and requested columns for the range,
+        resampled (mean per bucket) when a coarser resolution was requested.
+        Coarser resolutions are read from ``rollups`` (a RollupStore) when given,
+        in which case edge buckets cover their full width.
+        """
+        columns = self.fields if columns is None else columns
+        if self.resolution in (rollups or ()):
+            rollups.sync(dataset)
+            return rollups.means(self.resolution, self.start, self.end, columns)
+        lo, hi = self.bounds(dataset)
+        df = pd.DataFrame(
+            {name: dataset.column(name)[lo:hi] for name in ['timestamp'] + list(columns)},
+            copy=False
+        )
+        rule = RESOLUTIONS[self.resolution]
+        if rule is None or df.empty:
+            return df
+        return df.set_index('timestamp').resample(rule).mean().dropna(how='all').reset_index()
+
+    def downsample(self, dataset, df):
+        """
+        Reduces a frame returned by apply() to at most ``points`` rows.
+        Each requested series gets an equal share of the budget and the
+        union of the selected rows is kept, so every series keeps its extremes.
+        Every series gets at least MIN_POINTS, so when there are too many
+        series for that the union is thinned evenly back to ``points`` rows.
+        Selections are cached per series, budget and frame; a frame is keyed by
+        its rows as well as the range, since at coarser resolutions the same
+        rows can fall into different edge buckets.
+        """
+        if self.points is None or len(df) <= self.points:
+            return df
+        lo, hi = self.bounds(dataset)
+        budget = series_budget(self.points, len(self.fields))
+        x = df['timestamp'].to_numpy()
+        frame = (lo, hi, self.resolution, tuple(df.columns), len(df), x[0], x[-1])
+        selections = [
+            dataset.cached(
+                ('downsample', self.method, field, budget) + frame,
+                lambda _, field=field: downsample_indices(x, df[field].to_numpy(), budget, self.method)
+            )
+            for field in self.fields
+        ]
+        indices = np.unique(np.concatenate(selections))
+        if len(indices) > self.points:
+            # Evenly spaced positions are distinct and keep the first and last row
+            indices = indices[np.linspace(0, len(indices) - 1, self.points).round().astype(np.int64)]
+        return df.iloc[indices].reset_index(drop=True)
+
+
+def make_cursor(timestamps, position):
+    """
+    Returns an opaque cursor for "everything before ``position``" in a sorted
+    timestamp array: the last timestamp delivered (epoch ns) and how many rows
+    with that timestamp were delivered, so ties are never skipped or repeated.
+    """
+    if position <= 0:
+        return '0.0'
+    last = timestamps[position - 1]
+    ties = position - int(np.searchsorted(timestamps, last, side='left'))
+    return f"{int(pd.Timestamp(last).value)}.{ties}"
+
+
+def cursor_position(timestamps, cursor):
+    """
+    Returns the index of the first row after ``cursor`` in a sorted timestamp array.
+    """
+    try:
+        ts_ns, ties = (int(part) for part in cursor.split('.'))
+    except (AttributeError, ValueError):
+        raise QueryError(f"Invalid cursor '{cursor}'")
+    if ts_ns == 0:
+        return 0
+    value = np.datetime64(ts_ns, 'ns')
+    left = int(np.searchsorted(timestamps, value, side='left'))
+    right = int(np.searchsorted(timestamps, value, side='right'))
+    return min(left + ties, right)
@@ -1,34 +1,25 @@
 import sys
 import os
 import logging
-import traceback
 
 # Configure basic logging to stderr
 logging.basicConfig(
     stream=sys.stderr,
-    level=logging.DEBUG,
+    level=logging.INFO,
     format='%(asctime)s %(levelname)s: %(message)s'
 )
 
 logger = logging.getLogger(__name__)
 
-try:
-    # Log current environment
-    logger.debug(f"Current working directory: {os.getcwd()}")
-    logger.debug(f"Directory contents: {os.listdir('.')}")
-    logger.debug(f"Python path: {sys.path}")
-
-    # Add the application directory to the Python path
-    project_dir = os.path.dirname(os.path.abspath(__file__))
-    if project_dir not in sys.path:
-        sys.path.insert(0, project_dir)
-
-    from app_new import app as application
+# Add the application directory to the Python path
+project_dir = os.path.dirname(os.path.abspath(__file__))
+if project_dir not in sys.path:
+    sys.path.insert(0, project_dir)
 
-    # Log application startup
-    logger.info("WSGI application starting up")
-
-except Exception as e:
-    logger.error(f"Failed to start application: {str(e)}")
-    logger.error(f"Traceback: {traceback.format_exc()}")
+try:
+    from app_new import app as application, warm_up
+except Exception:
+    logger.exception("Failed to start application")
     raise
+
+logger.info("WSGI application starting up")